@@ -17,7 +17,8 @@ import time
 import uuid
 import json
 from datetime import datetime
-from flask import Flask, request, g
+from flask import Flask, request, g, jsonify
+from werkzeug.exceptions import RequestEntityTooLarge
 from flask_cors import CORS
 from dotenv import load_dotenv
 import warnings
@@ -72,6 +73,14 @@ def create_app():
     
     # Enable CORS
     CORS(app)
+
+    # Reject bodies (raw uploads and whole forms) over MAX_UPLOAD_MB with 413
+    from utils.image_utils import MAX_UPLOAD_BYTES, upload_too_large
+    app.config['MAX_CONTENT_LENGTH'] = MAX_UPLOAD_BYTES
+
+    @app.errorhandler(RequestEntityTooLarge)
+    def request_too_large(e):
+        return jsonify({"error": str(upload_too_large("Request body"))}), 413
     
     # Configure logging
     log_level = os.environ.get('LOG_LEVEL', 'INFO').upper()
@@ -107,13 +116,17 @@ def create_app():
    
     app.logger.info("Initializing Background Removal Server...")
     
-    # Add request ID and start time to each request
+    from utils.rate_limit import client_id_from_request
+
+    # Add request ID, start time and client ID to each request
     @app.before_request
     def before_request():
         # Always set request ID and timing info for use in route handlers
         g.request_id = str(uuid.uuid4())
         g.start_time = time.time()
         g.request_timestamp = datetime.utcnow().isoformat()
+        # Identify the client (API key or IP) for rate limiting and fair scheduling
+        g.client_id = client_id_from_request(request)
         
         # Only log in production mode
         if app.config.get('IS_PRODUCTION', False):
@@ -181,6 +194,7 @@ def create_app():
                 'request_id': g.request_id,
                 'timestamp': g.request_timestamp,
                 'remote_addr': request.remote_addr,
+                'client_id': g.client_id,
                 'method': request.method,
                 'path': request.path,
                 'status_code': response.status_code,
@@ -212,8 +226,8 @@ def create_app():
     
     # Load model
     try:
-        from models.birefnet_model import birefnet_model
-        if birefnet_model is not None:
+        from models.model_registry import model_registry
+        if model_registry.is_loaded():
             app.logger.info("✅ BiRefNet model loaded successfully")
         else:
             app.logger.warning("⚠️ BiRefNet model could not be loaded, will use fallback method")
@@ -0,0 +1,445 @@
+#!/usr/bin/env python3
+"""
+Background Removal Server - ASGI application serving the same API as app.py.
+
+Upload bodies are read and image_url is fetched asynchronously on the event
+loop, so slow clients only hold a connection. Admission, decoding, inference
+and encoding run on a bounded thread pool, so the number of open connections
+is independent of model concurrency.
+
+To run the server:
+    python asgi.py [--port PORT] [--host HOST] [--workers N]
+    uvicorn asgi:app --host 0.0.0.0 --port 5000 --workers 4
+"""
+
+import argparse
+import asyncio
+import json
+import logging
+import os
+import sys
+import time
+import traceback
+import uuid
+import warnings
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager, ExitStack
+
+import httpx
+from dotenv import load_dotenv
+from starlette.applications import Starlette
+from starlette.datastructures import UploadFile
+from starlette.responses import FileResponse, JSONResponse, Response, StreamingResponse
+from starlette.routing import Route
+from werkzeug.datastructures import MultiDict
+
+# Load environment variables from .env file if present
+load_dotenv()
+
+# Filter out FutureWarnings to suppress timm deprecation warnings
+warnings.filterwarnings("ignore", category=FutureWarning)
+
+from config import (
+    MAX_CONCURRENT_INFERENCES, MAX_QUEUE_LENGTH, PRIORITY_LANES,
+    ASGI_INFERENCE_THREADS, ASGI_MAX_PENDING, ASGI_MAX_FIELD_MB, URL_FETCH_TIMEOUT,
+    SEQUENCE_MAX_FRAMES, PROFILE_TRACE_DIR,
+)
+from utils.image_utils import ImageTooLargeError, URL_FETCH_HEADERS, MAX_UPLOAD_BYTES, upload_too_large, check_content_length
+from utils.admission import admission_controller, AdmissionRejected
+from utils.rate_limit import client_id_from_request
+from utils.metrics import metrics
+from utils.profiling import list_traces
+from routes.processing import process_remove_bg, request_memory, iter_streamed_output, is_raw_upload, RawUploadRequest
+from routes.ping import health_status
+from routes.metrics import metrics_snapshot
+from routes.results import find_result, result_headers, is_not_modified, RESULT_GONE
+from routes.profiles import profiles_error
+from routes.batch_urls import parse_batch_body, UrlBatch, iter_ndjson, acquire_batch_slot, BATCH_BUSY_ERROR
+from routes.sequence import process_sequence, SequenceInputError
+from models.model_registry import UnknownModelError
+from utils.request_options import InvalidOptionError
+
+logging.basicConfig(
+    level=getattr(logging, os.environ.get("LOG_LEVEL", "INFO").upper()),
+    format="%(asctime)s - %(name)s - %(levelname)s - %(message)s",
+    handlers=[logging.StreamHandler(sys.stdout)],
+)
+logger = logging.getLogger("asgi")
+
+NO_IMAGE_ERROR = "No image provided. Please use form-data with one of: image_file, image_file_b64, or image_url, or send the image as the body"
+
+# One thread for every request that can be running or queued in admission
+INFERENCE_THREADS = ASGI_INFERENCE_THREADS or MAX_CONCURRENT_INFERENCES + MAX_QUEUE_LENGTH * len(PRIORITY_LANES)
+MAX_PENDING = ASGI_MAX_PENDING or 2 * INFERENCE_THREADS
+
+inference_executor = ThreadPoolExecutor(max_workers=INFERENCE_THREADS, thread_name_prefix="inference")
+
+
+class _Upload:
+    """File part exposed like a werkzeug FileStorage (.stream)."""
+
+    def __init__(self, upload):
+        self.stream = upload.file
+
+
+class FormRequest:
+    """
+    A parsed ASGI request with the attributes the shared processing code
+    reads from Flask's request: form, files, args, headers and remote_addr.
+    """
+
+    def __init__(self, request, form=None):
+        # MultiDicts: [] and get() return the first value, getlist() all of them
+        self.form = MultiDict()
+        self.files = MultiDict()
+        for name, value in (form.multi_items() if form is not None else []):
+            if isinstance(value, UploadFile):
+                self.files.add(name, _Upload(value))
+            else:
+                self.form.add(name, value)
+        self.args = request.query_params
+        self.headers = request.headers
+        self.remote_addr = request.client.host if request.client else None
+
+
+class _Pending:
+    """Count of requests dispatched to the inference executor."""
+
+    def __init__(self, limit):
+        self.limit = limit
+        self.count = 0
+
+    def try_acquire(self):
+        # Only touched from the event loop thread, so no lock is needed
+        if self.count >= self.limit:
+            return False
+        self.count += 1
+        metrics.set_gauge("asgi_pending_requests", self.count)
+        return True
+
+    def release(self):
+        self.count -= 1
+        metrics.set_gauge("asgi_pending_requests", self.count)
+
+
+pending = _Pending(MAX_PENDING)
+
+
+async def read_limited(chunks, what, length=None):
+    """
+    Async counterpart of image_utils.read_limited: join byte chunks, raising
+    ImageTooLargeError as soon as they exceed MAX_UPLOAD_BYTES.
+    """
+    check_content_length(length, what)
+    buf = bytearray()
+    async for chunk in chunks:
+        buf += chunk
+        if len(buf) > MAX_UPLOAD_BYTES:
+            raise upload_too_large(what)
+    return bytes(buf)
+
+
+async def read_body(request):
+    """The request body, at most MAX_UPLOAD_MB of it (like Flask's MAX_CONTENT_LENGTH)."""
+    return await read_limited(request.stream(), "Request body", request.headers.get("content-length"))
+
+
+async def fetch_url(client, url):
+    """Fetch image_url without blocking the event loop, at most MAX_UPLOAD_MB of it."""
+    try:
+        async with client.stream("GET", url) as resp:
+            resp.raise_for_status()
+            return await read_limited(resp.aiter_bytes(), "image_url", resp.headers.get("content-length"))
+    except httpx.HTTPError as e:
+        raise ValueError(f"Error reading image_url: {str(e)}")
+
+
+def _process(req, request_id, client_id, url_content):
+    # Runs on an inference thread
+    with ExitStack() as memory:
+        memory.enter_context(request_memory(request_id, logger))
+        result = process_remove_bg(req, request_id, client_id, logger, url_content=url_content)
+        # Streamed outputs are encoded while they are sent; keep tracking
+        # memory until then
+        close_memory = memory.pop_all().close if result.stream is not None else None
+        return result, close_memory
+
+
+async def remove_bg(request):
+    request_id = str(uuid.uuid4())
+    start_process_time = time.time()
+    form = None
+    try:
+        if is_raw_upload(request.headers.get("content-type")):
+            # The body is the image, options are in the query string
+            body = await read_body(request)
+            req = RawUploadRequest(body, request.query_params, request.headers, request.client.host if request.client else None)
+        else:
+            # Multipart files are spooled to disk as they arrive, so the
+            # declared length is checked up front rather than while reading
+            check_content_length(request.headers.get("content-length"), "Request body")
+            form = await request.form(max_part_size=int(ASGI_MAX_FIELD_MB * 1024 * 1024))
+            req = FormRequest(request, form)
+        client_id = client_id_from_request(req)
+
+        if isinstance(req, RawUploadRequest) and "image_file" in req.files:
+            logger.info(f"[{request_id}] Processing raw upload ({len(body)} bytes, {request.headers.get('content-type')})")
+        elif "image_file" in req.files:
+            logger.info(f"[{request_id}] Processing file upload")
+        elif "image_url" in req.form:
+            url = req.form["image_url"]
+            logger.info(f"[{request_id}] Processing URL: {url[:50]}..." if len(url) > 50 else f"[{request_id}] Processing URL: {url}")
+        elif "image_file_b64" in req.form:
+            logger.info(f"[{request_id}] Processing base64 image ({len(req.form['image_file_b64'])//1024} KB)")
+        else:
+            logger.warning(f"[{request_id}] Invalid request: {NO_IMAGE_ERROR}")
+            return JSONResponse({"error": NO_IMAGE_ERROR}, status_code=400)
+
+        # Only fetch the URL when it is the source that will be used
+        url_content = None
+        if "image_file" not in req.files and not req.form.get("image_file_b64") and req.form.get("image_url"):
+            url_content = await fetch_url(request.app.state.http, req.form["image_url"])
+
+        if not pending.try_acquire():
+            retry_after = admission_controller.retry_after()
+            logger.warning(f"[{request_id}] Rejected: {pending.count} requests already pending")
+            metrics.inc("asgi_rejected_total")
+            return JSONResponse({"error": "Server busy, please retry later"}, status_code=503,
+                                headers={"Retry-After": str(retry_after)})
+        try:
+            loop = asyncio.get_running_loop()
+            result, close_memory = await loop.run_in_executor(inference_executor, _process, req, request_id, client_id, url_content)
+        finally:
+            pending.release()
+
+        if result.reference is not None:
+            return JSONResponse(result.reference, headers=result.headers)
+        if result.stream is not None:
+            # Encoded on Starlette's thread pool while it is sent, in chunks
+            chunks = iter_streamed_output(result, request_id, logger, on_close=close_memory)
+            headers = dict(result.headers, **{"Content-Disposition": "inline; filename=output.png"})
+            return StreamingResponse(chunks, media_type="image/png", headers=headers)
+        return Response(result.buf.getvalue(), media_type="image/png", headers=result.headers)
+
+    except ImageTooLargeError as e:
+        logger.warning(f"[{request_id}] Rejected oversized image: {str(e)}")
+        return JSONResponse({"error": str(e)}, status_code=413)
+
+    except (UnknownModelError, InvalidOptionError) as e:
+        logger.warning(f"[{request_id}] {str(e)}")
+        return JSONResponse({"error": str(e)}, status_code=400)
+
+    except AdmissionRejected as e:
+        logger.warning(f"[{request_id}] Rejected by admission control ({e.status_code}): {str(e)}, retry after {e.retry_after}s")
+        return JSONResponse({"error": str(e)}, status_code=e.status_code, headers={"Retry-After": str(e.retry_after)})
+
+    except Exception as e:
+        error_time = time.time() - start_process_time
+        logger.error(f"[{request_id}] Error in background removal after {error_time:.4f}s: {str(e)}")
+        logger.error(f"[{request_id}] Traceback: {traceback.format_exc()}")
+        return JSONResponse({"error": str(e)}, status_code=500)
+
+    finally:
+        if form is not None:
+            await form.close()
+
+
+def _process_sequence(req, request_id, client_id):
+    # Runs on an inference thread
+    with request_memory(request_id, logger):
+        return process_sequence(req, request_id, client_id, logger)
+
+
+async def remove_bg_sequence(request):
+    """Remove backgrounds from an ordered frame sequence, returning a zip of per-frame alpha masks"""
+    request_id = str(uuid.uuid4())
+    start_process_time = time.time()
+    form = None
+    try:
+        check_content_length(request.headers.get("content-length"), "Request body")
+        form = await request.form(max_files=SEQUENCE_MAX_FRAMES + 1, max_part_size=int(ASGI_MAX_FIELD_MB * 1024 * 1024))
+        req = FormRequest(request, form)
+        client_id = client_id_from_request(req)
+
+        if not pending.try_acquire():
+            retry_after = admission_controller.retry_after()
+            logger.warning(f"[{request_id}] Rejected: {pending.count} requests already pending")
+            metrics.inc("asgi_rejected_total")
+            return JSONResponse({"error": "Server busy, please retry later"}, status_code=503,
+                                headers={"Retry-After": str(retry_after)})
+        try:
+            loop = asyncio.get_running_loop()
+            result = await loop.run_in_executor(inference_executor, _process_sequence, req, request_id, client_id)
+        finally:
+            pending.release()
+
+        headers = dict(result.headers, **{"Content-Disposition": 'attachment; filename="frames.zip"'})
+        return Response(result.buf.getvalue(), media_type="application/zip", headers=headers)
+
+    except ImageTooLargeError as e:
+        logger.warning(f"[{request_id}] Rejected oversized sequence: {str(e)}")
+        return JSONResponse({"error": str(e)}, status_code=413)
+
+    except (SequenceInputError, UnknownModelError, InvalidOptionError) as e:
+        logger.warning(f"[{request_id}] Invalid sequence request: {str(e)}")
+        return JSONResponse({"error": str(e)}, status_code=400)
+
+    except AdmissionRejected as e:
+        logger.warning(f"[{request_id}] Rejected by admission control ({e.status_code}): {str(e)}, retry after {e.retry_after}s")
+        return JSONResponse({"error": str(e)}, status_code=e.status_code, headers={"Retry-After": str(e.retry_after)})
+
+    except Exception as e:
+        error_time = time.time() - start_process_time
+        logger.error(f"[{request_id}] Error in sequence processing after {error_time:.4f}s: {str(e)}")
+        logger.error(f"[{request_id}] Traceback: {traceback.format_exc()}")
+        return JSONResponse({"error": str(e)}, status_code=500)
+
+    finally:
+        if form is not None:
+            await form.close()
+
+
+class BatchResponse(StreamingResponse):
+    """
+    Streams a batch as NDJSON and frees its batch slot however the response
+    ends, including a client gone before the body started (when the
+    generator never runs).
+    """
+
+    def __init__(self, content, release):
+        self.release = release
+        super().__init__(content, media_type="application/x-ndjson")
+
+    async def __call__(self, scope, receive, send):
+        try:
+            await super().__call__(scope, receive, send)
+        finally:
+            self.release()
+
+
+async def remove_bg_batch(request):
+    """Remove backgrounds from a list of image URLs, streaming NDJSON results per URL"""
+    request_id = str(uuid.uuid4())
+    try:
+        try:
+            body = json.loads(await read_body(request))
+        except ImageTooLargeError:
+            raise
+        except ValueError:
+            body = None
+        urls, ordered, options = parse_batch_body(body)
+    except ImageTooLargeError as e:
+        logger.warning(f"[{request_id}] Rejected oversized batch request: {str(e)}")
+        return JSONResponse({"error": str(e)}, status_code=413)
+    except ValueError as e:
+        logger.warning(f"[{request_id}] Invalid batch request: {str(e)}")
+        return JSONResponse({"error": str(e)}, status_code=400)
+
+    release, retry_after = acquire_batch_slot()
+    if release is None:
+        logger.warning(f"[{request_id}] Rejected: too many batch requests already running")
+        return JSONResponse({"error": BATCH_BUSY_ERROR}, status_code=503, headers={"Retry-After": str(retry_after)})
+
+    logger.info(f"[{request_id}] Processing batch of {len(urls)} URLs ({'input' if ordered else 'completion'} order)")
+    client_id = client_id_from_request(FormRequest(request))
+    batch = UrlBatch(urls, options, request.query_params, request.headers, client_id, request_id, logger)
+    # Starlette iterates the synchronous generator on its thread pool
+    return BatchResponse(iter_ndjson(batch, ordered), release)
+
+
+async def ping(request):
+    return JSONResponse({"message": "API is running"})
+
+
+async def health(request):
+    """Health check endpoint to verify model and API are running"""
+    status = health_status()
+    status["asgi"] = {"inference_threads": INFERENCE_THREADS, "pending": pending.count, "max_pending": MAX_PENDING}
+    # Requests waiting for an inference thread count as queued too
+    status["load"]["queue_depth"] = max(status["load"]["queue_depth"], pending.count)
+    return JSONResponse(status)
+
+
+async def get_metrics(request):
+    """Return in-process counters, gauges and latency histograms for this worker"""
+    return JSONResponse(metrics_snapshot())
+
+
+async def get_result(request):
+    """Serve a stored result, with ETag (its content hash), conditional requests and byte ranges"""
+    stored, error = find_result(request.path_params["result_id"])
+    if error is not None:
+        return JSONResponse({"error": error[0]}, status_code=error[1])
+    # Content-addressed, so the bytes behind an ID never change
+    headers = result_headers(stored)
+    if is_not_modified(stored, request.headers.get("if-none-match", "")):
+        return Response(status_code=304, headers=headers)
+    try:
+        stat = os.stat(stored.path)
+    except FileNotFoundError:
+        # Evicted between the lookup and the response
+        return JSONResponse({"error": RESULT_GONE}, status_code=404)
+    # Starlette handles Range and If-Range
+    return FileResponse(stored.path, media_type="image/png", headers=headers, stat_result=stat)
+
+
+async def get_profiles(request):
+    """List the profiling traces written by this server, newest first"""
+    error = profiles_error(request)
+    if error is not None:
+        return JSONResponse({"error": error[0]}, status_code=error[1])
+    return JSONResponse({"traces": list_traces()})
+
+
+async def download_profile(request):
+    """Download one trace file (see GET /profiles for names)"""
+    name = request.path_params["name"]
+    error = profiles_error(request, name)
+    if error is not None:
+        return JSONResponse({"error": error[0]}, status_code=error[1])
+    return FileResponse(os.path.join(PROFILE_TRACE_DIR, name), filename=name)
+
+
+@asynccontextmanager
+async def lifespan(app):
+    # One pooled HTTP client per worker for image_url fetches
+    async with httpx.AsyncClient(timeout=URL_FETCH_TIMEOUT, headers=URL_FETCH_HEADERS, follow_redirects=True) as client:
+        app.state.http = client
+        logger.info(f"✅ ASGI server ready ({INFERENCE_THREADS} inference threads, up to {MAX_PENDING} pending requests)")
+        yield
+    inference_executor.shutdown(wait=True)
+
+
+app = Starlette(
+    routes=[
+        Route("/remove-bg", remove_bg, methods=["POST"]),
+        Route("/remove-bg/batch", remove_bg_batch, methods=["POST"]),
+        Route("/remove-bg/sequence", remove_bg_sequence, methods=["POST"]),
+        Route("/ping", ping, methods=["GET"]),
+        Route("/health", health, methods=["GET"]),
+        Route("/metrics", get_metrics, methods=["GET"]),
+        Route("/results/{result_id}", get_result, methods=["GET"]),
+        Route("/profiles", get_profiles, methods=["GET"]),
+        Route("/profiles/{name}", download_profile, methods=["GET"]),
+    ],
+    lifespan=lifespan,
+)
+
+
+def parse_arguments():
+    """Parse command line arguments"""
+    parser = argparse.ArgumentParser(description="Background Removal Server (ASGI)")
+    parser.add_argument("--port", type=int, default=int(os.environ.get("PORT", 5000)),
+                        help="Port to run the server on (default: 5000 or PORT env var)")
+    parser.add_argument("--host", type=str, default=os.environ.get("HOST", "0.0.0.0"),
+                        help="Host to bind the server to (default: 0.0.0.0 or HOST env var)")
+    parser.add_argument("--workers", type=int, default=int(os.environ.get("WEB_CONCURRENCY", 1)),
+                        help="Worker processes (default: 1 or WEB_CONCURRENCY env var)")
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    import uvicorn
+
+    args = parse_arguments()
+    uvicorn.run("asgi:app", host=args.host, port=args.port, workers=args.workers)
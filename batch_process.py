@@ -0,0 +1,334 @@
+#!/usr/bin/env python
+"""
+Offline background removal for whole directories.
+
+Images flow through three pipelined stages connected by bounded queues:
+1. decode + preprocess on a thread pool
+2. batched BiRefNet inference on the main thread
+3. mask upsample/composite + PNG encode + write on another thread pool
+
+Outputs that already exist are skipped, so an interrupted run can be resumed
+by running the same command again. Outputs are written to a temporary file
+and renamed, so a partial file is never mistaken for a finished one.
+
+Usage:
+    python batch_process.py IN_DIR OUT_DIR [--batch-size 4] [--decode-workers 4] [--encode-workers 4]
+                            [--recursive] [--fast-path] [--model NAME] [--report report.json]
+"""
+
+import argparse
+import json
+import os
+import queue
+import sys
+import threading
+import time
+import warnings
+
+import torch
+from PIL import Image
+from torchvision import transforms
+
+from models.bg_remover import transform_image, predict_mask_batch, apply_mask
+from models.fast_paths import classify
+from utils.image_utils import has_alpha
+from utils.metrics import percentile
+
+# Filter out FutureWarnings to suppress timm deprecation warnings
+warnings.filterwarnings("ignore", category=FutureWarning)
+
+IMAGE_EXTENSIONS = (".png", ".jpg", ".jpeg", ".webp", ".bmp", ".tif", ".tiff")
+
+# Marks the end of a queue
+_DONE = object()
+
+
+class StageTimer:
+    """Thread-safe accumulator of busy time per stage."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.busy = {}
+
+    def add(self, stage, seconds):
+        with self._lock:
+            self.busy[stage] = self.busy.get(stage, 0.0) + seconds
+
+
+class Job:
+    """One input file moving through the pipeline."""
+
+    def __init__(self, input_path, output_path):
+        self.input_path = input_path
+        self.output_path = output_path
+        self.image = None
+        self.tensor = None
+        self.mask = None
+        self.mask_source = None
+        self.started_at = None
+
+
+def find_jobs(input_dir, output_dir, recursive=False):
+    """
+    List (job, already_done) pairs for every image in input_dir.
+
+    Outputs are named <stem>.png. Inputs that share a stem (a.jpg and a.png)
+    would overwrite each other's output, so each of them keeps its source
+    extension instead (a.jpg.png, a.png.png) and the clash is reported.
+    """
+    inputs = []
+    for root, dirs, files in os.walk(input_dir):
+        dirs.sort()
+        for name in sorted(files):
+            if name.startswith(".") or not name.lower().endswith(IMAGE_EXTENSIONS):
+                continue
+            inputs.append(os.path.relpath(os.path.join(root, name), input_dir))
+        if not recursive:
+            break
+
+    # Compared case-insensitively, as A.jpg and a.png clash on such filesystems
+    stems = {}
+    for relative in inputs:
+        stems.setdefault(os.path.splitext(relative)[0].lower(), []).append(relative)
+
+    jobs = []
+    for relative in inputs:
+        clashing = stems[os.path.splitext(relative)[0].lower()]
+        if len(clashing) > 1:
+            output_name = relative + ".png"
+            if relative == clashing[0]:
+                print(f"⚠️  {', '.join(clashing)} share an output name; writing <name>.<ext>.png for each")
+        else:
+            output_name = os.path.splitext(relative)[0] + ".png"
+        output_path = os.path.join(output_dir, output_name)
+        jobs.append((Job(os.path.join(input_dir, relative), output_path), os.path.exists(output_path)))
+    return jobs
+
+
+class BatchPipeline:
+    """Decode -> batched inference -> encode pipeline over a list of jobs."""
+
+    def __init__(self, batch_size=4, decode_workers=4, encode_workers=4, queue_size=None,
+                 fast_path=False, batch_timeout=0.05, model_name=None):
+        self.batch_size = batch_size
+        self.decode_workers = decode_workers
+        self.encode_workers = encode_workers
+        self.fast_path = fast_path
+        self.batch_timeout = batch_timeout
+        self.model_name = model_name
+        queue_size = queue_size or batch_size * 4
+
+        self.pending = queue.Queue()
+        self.decoded = queue.Queue(maxsize=queue_size)
+        self.to_encode = queue.Queue(maxsize=queue_size)
+
+        self.timer = StageTimer()
+        self._lock = threading.Lock()
+        self.completed = 0
+        self.bypassed = 0
+        self.megapixels = 0.0
+        self.failures = []
+        self.latencies = []
+
+    def _fail(self, job, stage, error):
+        with self._lock:
+            self.failures.append({"input": job.input_path, "stage": stage, "error": str(error)})
+        print(f"❌ {job.input_path}: {stage} failed: {error}")
+
+    def _decode_worker(self):
+        while True:
+            job = self.pending.get()
+            if job is _DONE:
+                self.decoded.put(_DONE)
+                return
+            job.started_at = time.time()
+            start = time.perf_counter()
+            try:
+                image = Image.open(job.input_path)
+                image = image.convert("RGBA" if self.fast_path and has_alpha(image) else "RGB")
+                job.image = image
+                if self.fast_path:
+                    result = classify(image)
+                    if result is not None:
+                        job.mask, job.mask_source = result.mask, result.kind
+                if job.mask is None:
+                    rgb = image if image.mode == "RGB" else image.convert("RGB")
+                    job.tensor = transform_image(rgb)
+            except Exception as e:
+                self.timer.add("decode", time.perf_counter() - start)
+                self._fail(job, "decode", e)
+                continue
+            self.timer.add("decode", time.perf_counter() - start)
+            # Fast-path results skip the model stage entirely
+            (self.to_encode if job.mask is not None else self.decoded).put(job)
+
+    def _encode_worker(self):
+        while True:
+            job = self.to_encode.get()
+            if job is _DONE:
+                return
+            start = time.perf_counter()
+            try:
+                output = apply_mask(job.image, job.mask, in_place=True)
+                os.makedirs(os.path.dirname(job.output_path) or ".", exist_ok=True)
+                temp_path = job.output_path + ".part"
+                output.save(temp_path, format="PNG")
+                os.replace(temp_path, job.output_path)
+            except Exception as e:
+                self.timer.add("encode", time.perf_counter() - start)
+                self._fail(job, "encode", e)
+                continue
+            self.timer.add("encode", time.perf_counter() - start)
+            with self._lock:
+                self.completed += 1
+                self.bypassed += job.mask_source != "model"
+                self.megapixels += job.image.width * job.image.height / 1_000_000
+                self.latencies.append(time.time() - job.started_at)
+            # Release pixel data as soon as the file is written
+            job.image = job.mask = None
+
+    def _next_batch(self, finished_decoders):
+        """Collect up to batch_size decoded jobs; flush early when input dries up."""
+        batch = []
+        while len(batch) < self.batch_size and finished_decoders < self.decode_workers:
+            try:
+                timeout = self.batch_timeout if batch else None
+                job = self.decoded.get(timeout=timeout)
+            except queue.Empty:
+                break
+            if job is _DONE:
+                finished_decoders += 1
+                continue
+            batch.append(job)
+        return batch, finished_decoders
+
+    def _run_inference(self):
+        to_pil = transforms.ToPILImage()
+        finished_decoders = 0
+        # Every decoder enqueues _DONE after its last job, so once all of
+        # them are seen the decoded queue is drained
+        while finished_decoders < self.decode_workers:
+            batch, finished_decoders = self._next_batch(finished_decoders)
+            if not batch:
+                continue
+            start = time.perf_counter()
+            try:
+                masks = predict_mask_batch(torch.stack([job.tensor for job in batch]), self.model_name)
+            except Exception as e:
+                self.timer.add("inference", time.perf_counter() - start)
+                for job in batch:
+                    self._fail(job, "inference", e)
+                continue
+            self.timer.add("inference", time.perf_counter() - start)
+            for job, mask in zip(batch, masks):
+                job.mask, job.mask_source, job.tensor = to_pil(mask), "model", None
+                self.to_encode.put(job)
+
+    def run(self, jobs):
+        """Process all jobs and return the elapsed wall time."""
+        for job in jobs:
+            self.pending.put(job)
+        for _ in range(self.decode_workers):
+            self.pending.put(_DONE)
+
+        decoders = [threading.Thread(target=self._decode_worker, daemon=True) for _ in range(self.decode_workers)]
+        encoders = [threading.Thread(target=self._encode_worker, daemon=True) for _ in range(self.encode_workers)]
+        start = time.time()
+        for thread in decoders + encoders:
+            thread.start()
+
+        self._run_inference()
+
+        for thread in decoders:
+            thread.join()
+        for _ in encoders:
+            self.to_encode.put(_DONE)
+        for thread in encoders:
+            thread.join()
+        return time.time() - start
+
+
+def build_report(pipeline, elapsed, total, skipped):
+    latencies = sorted(pipeline.latencies)
+    return {
+        "total_inputs": total,
+        "skipped_existing": skipped,
+        "processed": pipeline.completed,
+        "bypassed_model": pipeline.bypassed,
+        "failed": len(pipeline.failures),
+        "elapsed_seconds": round(elapsed, 3),
+        "images_per_second": round(pipeline.completed / elapsed, 3) if elapsed > 0 else None,
+        "megapixels_per_second": round(pipeline.megapixels / elapsed, 3) if elapsed > 0 else None,
+        "latency_p50_seconds": percentile(latencies, 50),
+        "latency_p95_seconds": percentile(latencies, 95),
+        "stage_busy_seconds": {k: round(v, 3) for k, v in pipeline.timer.busy.items()},
+        "batch_size": pipeline.batch_size,
+        "decode_workers": pipeline.decode_workers,
+        "encode_workers": pipeline.encode_workers,
+        "model": pipeline.model_name,
+        "failures": pipeline.failures,
+    }
+
+
+def parse_arguments():
+    """Parse command line arguments"""
+    parser = argparse.ArgumentParser(description="Remove backgrounds from every image in a directory")
+    parser.add_argument("input_dir", help="Directory containing input images")
+    parser.add_argument("output_dir", help="Directory for the output PNGs")
+    parser.add_argument("--batch-size", type=int, default=4,
+                        help="Images per model forward pass (default: 4)")
+    parser.add_argument("--decode-workers", type=int, default=4,
+                        help="Threads decoding and preprocessing inputs (default: 4)")
+    parser.add_argument("--encode-workers", type=int, default=4,
+                        help="Threads compositing and writing outputs (default: 4)")
+    parser.add_argument("--queue-size", type=int,
+                        help="Capacity of the queues between stages (default: 4 x batch size)")
+    parser.add_argument("--recursive", action="store_true",
+                        help="Also process images in subdirectories, mirroring the layout")
+    parser.add_argument("--fast-path", action="store_true",
+                        help="Skip the model for trivial inputs (existing alpha, blank, uniform background)")
+    parser.add_argument("--model", type=str, default=None,
+                        help="Registry name of the model to use (default: DEFAULT_MODEL)")
+    parser.add_argument("--no-resume", action="store_true",
+                        help="Reprocess images whose output already exists")
+    parser.add_argument("--report", type=str, help="Write the throughput report to this JSON file")
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    args = parse_arguments()
+
+    if not os.path.isdir(args.input_dir):
+        print(f"Error: Input directory '{args.input_dir}' does not exist.")
+        sys.exit(1)
+
+    all_jobs = find_jobs(args.input_dir, args.output_dir, recursive=args.recursive)
+    jobs = [job for job, done in all_jobs if args.no_resume or not done]
+    skipped = len(all_jobs) - len(jobs)
+    print(f"Found {len(all_jobs)} images, {skipped} already done, {len(jobs)} to process")
+
+    pipeline = BatchPipeline(
+        batch_size=args.batch_size,
+        decode_workers=args.decode_workers,
+        encode_workers=args.encode_workers,
+        queue_size=args.queue_size,
+        fast_path=args.fast_path,
+        model_name=args.model,
+    )
+    elapsed = pipeline.run(jobs)
+    report = build_report(pipeline, elapsed, len(all_jobs), skipped)
+
+    print("\n" + "=" * 50)
+    print("BATCH SUMMARY")
+    print("=" * 50)
+    for key, value in report.items():
+        if key != "failures":
+            print(f"{key}: {value}")
+    print("=" * 50)
+
+    if args.report:
+        with open(args.report, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"Report written to: {args.report}")
+
+    sys.exit(0 if not pipeline.failures else 1)
@@ -0,0 +1,156 @@
+#!/usr/bin/env python
+"""
+Search worker count x torch threads per worker x batch size for this host.
+
+For every combination, that many worker processes are started, each pinned
+to its own slice of the cores (the same split as CPU_AFFINITY=auto) with
+the given intra-op thread count. All workers run batched model forward
+passes concurrently for a fixed duration. Aggregate throughput and
+per-image latency are measured, and the configuration with the highest
+throughput (optionally under a p95 latency limit) is printed as the
+environment variables to deploy with.
+
+Batch size applies to batch_process.py --batch-size; the API processes one
+image per request, so use --batch-sizes 1 when tuning the API alone.
+
+Usage:
+    python -m benchmarks.autotune [--stub-model] [--duration 20] [--max-workers 16]
+                                  [--batch-sizes 1,2,4] [--max-p95 2.0] [--json tune.json]
+"""
+
+import argparse
+import json
+import multiprocessing
+import os
+import sys
+import time
+
+from utils.cpu_topology import available_cpus
+from utils.metrics import percentile
+
+
+def run_worker(slot, workers, threads, batch_size, duration, ready, start, results):
+    """Body of one worker process (spawned, so torch starts fresh)."""
+    # Pin and size thread pools before the model is imported and loaded
+    from utils.cpu_topology import configure_worker
+    configure_worker(slot=slot, workers=workers, affinity="auto", intra_op=threads, inter_op=1)
+
+    import torch
+    from config import MODEL_INPUT_SIZE
+    from models.bg_remover import predict_mask_batch
+
+    batch = torch.randn(batch_size, 3, *MODEL_INPUT_SIZE)
+    predict_mask_batch(batch)
+    ready.put(slot)
+    start.wait()
+
+    latencies = []
+    deadline = time.perf_counter() + duration
+    while time.perf_counter() < deadline:
+        begin = time.perf_counter()
+        predict_mask_batch(batch)
+        latencies.append(time.perf_counter() - begin)
+    results.put({"slot": slot, "latencies": latencies})
+
+
+def measure(workers, threads, batch_size, duration):
+    """Run one configuration and return its throughput and latency."""
+    context = multiprocessing.get_context("spawn")
+    ready, results, start = context.Queue(), context.Queue(), context.Event()
+    processes = [
+        context.Process(
+            target=run_worker,
+            args=(slot, workers, threads, batch_size, duration, ready, start, results),
+            daemon=True,
+        )
+        for slot in range(workers)
+    ]
+    for process in processes:
+        process.start()
+    # Start timing only once every worker has loaded the model and warmed up
+    for _ in processes:
+        ready.get()
+    start.set()
+    collected = [results.get() for _ in processes]
+    for process in processes:
+        process.join()
+
+    # Batch latency divided by batch size is the per-image cost
+    per_image = sorted(lat / batch_size for r in collected for lat in r["latencies"])
+    batches = sum(len(r["latencies"]) for r in collected)
+    return {
+        "workers": workers,
+        "threads_per_worker": threads,
+        "batch_size": batch_size,
+        "images_per_second": round(batches * batch_size / duration, 3),
+        "batch_latency_p50": round(percentile(sorted(lat for r in collected for lat in r["latencies"]), 50), 4),
+        "image_latency_p50": round(percentile(per_image, 50), 4),
+        "image_latency_p95": round(percentile(per_image, 95), 4),
+    }
+
+
+def candidates(cores, max_workers, batch_sizes):
+    """Worker counts in powers of two; for each, all cores or half of them as threads."""
+    worker_counts = sorted({w for w in (2 ** i for i in range(16)) if w <= min(cores, max_workers)} | {1})
+    for workers in worker_counts:
+        threads_options = sorted({max(1, cores // workers), max(1, cores // (2 * workers))}, reverse=True)
+        for threads in threads_options:
+            for batch_size in batch_sizes:
+                yield workers, threads, batch_size
+
+
+def parse_arguments():
+    """Parse command line arguments"""
+    parser = argparse.ArgumentParser(description="Find the best workers x threads x batch size for this host")
+    parser.add_argument("--duration", type=float, default=20, help="Seconds to measure each configuration (default: 20)")
+    parser.add_argument("--max-workers", type=int, default=16, help="Largest worker count to try (default: 16)")
+    parser.add_argument("--batch-sizes", default="1,2,4", help="Batch sizes to try (default: 1,2,4)")
+    parser.add_argument("--max-p95", type=float,
+                        help="Only accept configurations with p95 seconds per image below this")
+    parser.add_argument("--stub-model", action="store_true",
+                        help="Use a tiny untrained model instead of BiRefNet (no download needed)")
+    parser.add_argument("--json", dest="json_path", help="Write all results to this JSON file")
+    return parser.parse_args()
+
+
+def main():
+    args = parse_arguments()
+    if args.stub_model:
+        # Inherited by the spawned workers, which read it when config is imported
+        os.environ["USE_STUB_MODEL"] = "true"
+    cores = len(available_cpus())
+    batch_sizes = [int(b) for b in args.batch_sizes.split(",")]
+    configs = list(candidates(cores, args.max_workers, batch_sizes))
+    print(f"{cores} cores available, trying {len(configs)} configurations for {args.duration}s each", file=sys.stderr)
+
+    results = []
+    for workers, threads, batch_size in configs:
+        result = measure(workers, threads, batch_size, args.duration)
+        results.append(result)
+        print(f"workers={workers:3d} threads={threads:3d} batch={batch_size:2d}  "
+              f"{result['images_per_second']:8.2f} img/s  p50 {result['image_latency_p50']:.3f}s  "
+              f"p95 {result['image_latency_p95']:.3f}s", file=sys.stderr)
+
+    eligible = [r for r in results if args.max_p95 is None or r["image_latency_p95"] <= args.max_p95]
+    if not eligible:
+        print(f"Error: no configuration meets p95 <= {args.max_p95}s", file=sys.stderr)
+        return 1
+    best = max(eligible, key=lambda r: r["images_per_second"])
+
+    print("\nBest configuration for this host:")
+    print(f"  WEB_CONCURRENCY={best['workers']}")
+    print(f"  TORCH_INTRA_OP_THREADS={best['threads_per_worker']}")
+    print("  TORCH_INTER_OP_THREADS=1")
+    print("  CPU_AFFINITY=auto")
+    print(f"  batch_process.py --batch-size {best['batch_size']}")
+    print(f"  ({best['images_per_second']} images/s, p95 {best['image_latency_p95']}s per image)")
+
+    if args.json_path:
+        with open(args.json_path, "w") as f:
+            json.dump({"cores": cores, "duration": args.duration, "best": best, "results": results}, f, indent=2)
+        print(f"Results written to: {args.json_path}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,128 @@
+#!/usr/bin/env python
+"""
+Time-to-first-byte and peak memory of buffered vs streamed PNG output.
+
+Buffered is what /remove-bg does for small outputs: the whole RGBA result is
+encoded into a BytesIO before the first byte is sent. Streamed is the
+PngStream path used for large outputs, which sends each compressed chunk as
+soon as it is ready. For each output size, both are run on the same RGBA
+image (a test photo resized with a little grain so it compresses like a
+real photo, and an alpha channel from its luminance), and the report lists:
+
+- ttfb_seconds:   time until the first chunk could be sent
+- total_seconds:  time until the last byte
+- python_peak_mb: peak of Python-allocated memory during encoding (the
+                  encoded buffer, or the chunks in flight), via tracemalloc
+- rss_delta_mb:   peak process RSS growth during encoding
+
+The decoded image itself is the same for both and is not counted.
+
+Usage:
+    python -m benchmarks.encode [--sizes 12,25,50] [--chunk-kb 64] [--json encode.json]
+"""
+
+import argparse
+import io
+import json
+import math
+import os
+import sys
+import time
+import tracemalloc
+
+import numpy as np
+from PIL import Image
+
+from config import STREAM_CHUNK_KB
+from utils.memory import memory_monitor, release_memory
+from utils.png_stream import PngStream
+
+
+def make_image(source, megapixels, grain=3.0, seed=0):
+    aspect = source.width / source.height
+    height = int(math.sqrt(megapixels * 1_000_000 / aspect))
+    image = source.resize((int(height * aspect), height), Image.BILINEAR)
+    if grain:
+        pixels = np.asarray(image, dtype=np.int16)
+        pixels = pixels + np.random.default_rng(seed).normal(0, grain, pixels.shape).astype(np.int16)
+        image = Image.fromarray(np.clip(pixels, 0, 255).astype(np.uint8))
+    image.putalpha(image.convert("L"))
+    return image
+
+
+def buffered(image):
+    start = time.perf_counter()
+    buf = io.BytesIO()
+    image.save(buf, format="PNG")
+    elapsed = time.perf_counter() - start
+    return elapsed, elapsed, buf.getbuffer().nbytes
+
+
+def streamed(image, chunk_kb):
+    start = time.perf_counter()
+    stream = PngStream(image, chunk_size=chunk_kb * 1024)
+    for _ in stream:
+        pass
+    return stream.first_chunk_seconds, time.perf_counter() - start, stream.bytes_sent
+
+
+def measure(encode, *args):
+    release_memory()
+    usage = memory_monitor.start()
+    tracemalloc.start()
+    ttfb, total, size = encode(*args)
+    python_peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    memory_monitor.finish(usage)
+    return {
+        "ttfb_seconds": round(ttfb, 4),
+        "total_seconds": round(total, 4),
+        "bytes": size,
+        "python_peak_mb": round(python_peak / 2**20, 1),
+        "rss_delta_mb": round(usage.rss_delta / 2**20, 1),
+    }
+
+
+def parse_arguments():
+    """Parse command line arguments"""
+    parser = argparse.ArgumentParser(description="Compare buffered and streamed PNG encoding")
+    parser.add_argument("--input", type=str, default=None,
+                        help="Source image (default: first image in test_images)")
+    parser.add_argument("--sizes", type=str, default="12,25,50",
+                        help="Output sizes in megapixels (default: 12,25,50)")
+    parser.add_argument("--chunk-kb", type=int, default=STREAM_CHUNK_KB,
+                        help=f"Streamed chunk size in KB (default: {STREAM_CHUNK_KB})")
+    parser.add_argument("--grain", type=float, default=3.0,
+                        help="Standard deviation of the added grain, 0 for none (default: 3)")
+    parser.add_argument("--json", type=str, help="Write the report to this JSON file")
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    args = parse_arguments()
+    path = args.input
+    if path is None:
+        names = sorted(f for f in os.listdir("test_images") if f.lower().endswith((".png", ".jpg", ".jpeg")) and not f.startswith("."))
+        if not names:
+            print("Error: no images in 'test_images'")
+            sys.exit(1)
+        path = os.path.join("test_images", names[0])
+    source = Image.open(path).convert("RGB")
+
+    rows = []
+    for megapixels in [float(s) for s in args.sizes.split(",")]:
+        image = make_image(source, megapixels, args.grain)
+        for mode, result in (("buffered", measure(buffered, image)), ("streamed", measure(streamed, image, args.chunk_kb))):
+            row = dict(megapixels=megapixels, width=image.width, height=image.height, mode=mode, **result)
+            rows.append(row)
+            print(f"{megapixels:5g} MP {mode:9s} ttfb={row['ttfb_seconds']:.3f}s total={row['total_seconds']:.3f}s "
+                  f"size={row['bytes'] / 2**20:.1f} MB python_peak={row['python_peak_mb']} MB rss_delta={row['rss_delta_mb']} MB",
+                  flush=True)
+        del image
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump({"source": path, "chunk_kb": args.chunk_kb, "grain": args.grain, "runs": rows}, f, indent=2)
+        print(f"Report written to: {args.json}")
+
+    sys.exit(0)
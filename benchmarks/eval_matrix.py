@@ -0,0 +1,271 @@
+#!/usr/bin/env python
+"""
+Speed versus quality matrix for the inference modes we could enable.
+
+Every mode is run over a dataset directory and its masks are compared with
+reference masks from the fp32 model at 1024x1024 (computed in the same run):
+- IoU and MAE of the masks at reference resolution
+- boundary F-score (DAVIS-style, tolerance relative to the image diagonal)
+- latency per image (preprocess + model, or the fast-path check)
+- peak memory during inference (CUDA allocator peak, or process RSS on CPU),
+  after the model is loaded
+
+Each mode runs in a fresh subprocess, so no mode inherits another's model,
+allocator growth or caches.
+
+Modes:
+- fp32_1024:   reference, the production configuration
+- fp32_768 / fp32_512: lower model input resolution
+- half_1024:   fp16 on CUDA, bfloat16 on CPU
+- int8_1024:   dynamic int8 quantization of the Linear layers (CPU only)
+- fast_path:   fast-path bypass for trivial inputs, fp32/1024 otherwise
+
+Usage:
+    python -m benchmarks.eval_matrix [--input-dir test_images] [--modes fp32_512,half_1024]
+                                     [--repeats 3] [--json report.json]
+"""
+
+import argparse
+import gc
+import json
+import multiprocessing
+import os
+import statistics
+import sys
+import threading
+import time
+import warnings
+
+import torch
+from PIL import Image
+from torchvision import transforms
+
+from config import DEVICE, MODEL_INPUT_SIZE
+from models.model_registry import model_registry
+from models.fast_paths import classify
+from utils.image_utils import has_alpha
+from utils.mask_metrics import to_array, iou, mae, boundary_f
+from utils.memory import rss_bytes
+
+warnings.filterwarnings("ignore", category=FutureWarning)
+
+REFERENCE_MODE = "fp32_1024"
+
+HALF_DTYPE = torch.float16 if DEVICE.type == "cuda" else torch.bfloat16
+
+# name -> (model input size, dtype, int8 quantization, fast paths)
+MODES = {
+    "fp32_1024": (MODEL_INPUT_SIZE, torch.float32, False, False),
+    "fp32_768": ((768, 768), torch.float32, False, False),
+    "fp32_512": ((512, 512), torch.float32, False, False),
+    "half_1024": (MODEL_INPUT_SIZE, HALF_DTYPE, False, False),
+    "int8_1024": (MODEL_INPUT_SIZE, torch.float32, True, False),
+    "fast_path": (MODEL_INPUT_SIZE, torch.float32, False, True),
+}
+
+
+class PeakMemory:
+    """Peak memory above the starting point while the context is active."""
+
+    def __init__(self, interval=0.01):
+        self.interval = interval
+        self.peak_bytes = 0
+
+    def __enter__(self):
+        if DEVICE.type == "cuda":
+            torch.cuda.synchronize()
+            torch.cuda.reset_peak_memory_stats()
+            self._start = torch.cuda.memory_allocated()
+            return self
+        self._start = self._peak = rss_bytes()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._sample, daemon=True)
+        self._thread.start()
+        return self
+
+    def _sample(self):
+        while not self._stop.wait(self.interval):
+            self._peak = max(self._peak, rss_bytes())
+
+    def __exit__(self, *exc):
+        if DEVICE.type == "cuda":
+            torch.cuda.synchronize()
+            self.peak_bytes = torch.cuda.max_memory_allocated() - self._start
+            return
+        self._stop.set()
+        self._thread.join()
+        self.peak_bytes = max(self._peak, rss_bytes()) - self._start
+
+
+class ModeRunner:
+    """Produces masks for one mode."""
+
+    def __init__(self, name):
+        self.name = name
+        size, self.dtype, quantize, self.fast_path = MODES[name]
+        self.transform = transforms.Compose([
+            transforms.Resize(size),
+            transforms.ToTensor(),
+            transforms.Normalize([0.485, 0.456, 0.406], [0.229, 0.224, 0.225]),
+        ])
+        # A fresh fp32 instance per mode: the registry's model is already
+        # fp16 on CUDA, and modes must not affect each other
+        model = model_registry.load_fresh(half=False).to(self.dtype)
+        if quantize:
+            model = torch.ao.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+        self.model = model.eval()
+        self.to_pil = transforms.ToPILImage()
+
+    def predict(self, image):
+        """Return (PIL "L" mask, source)."""
+        if self.fast_path:
+            result = classify(image)
+            if result is not None:
+                return result.mask, result.kind
+        rgb = image if image.mode == "RGB" else image.convert("RGB")
+        tensor = self.transform(rgb).unsqueeze(0).to(DEVICE, self.dtype)
+        with torch.no_grad():
+            pred = self.model(tensor)[-1].sigmoid().float().cpu()
+        return self.to_pil(pred[0]), "model"
+
+
+def supported(name):
+    _, _, quantize, _ = MODES[name]
+    # Dynamic quantization only has CPU kernels
+    return not (quantize and DEVICE.type == "cuda")
+
+
+def load_images(input_dir):
+    images = []
+    for name in sorted(os.listdir(input_dir)):
+        if name.lower().endswith((".png", ".jpg", ".jpeg")) and not name.startswith("."):
+            image = Image.open(os.path.join(input_dir, name))
+            images.append((name, image.convert("RGBA" if has_alpha(image) else "RGB")))
+    return images
+
+
+def run_mode(name, images, repeats):
+    """Return ({image name: mask}, {image name: source}, latencies, peak memory bytes)."""
+    masks, sources, latencies = {}, {}, []
+    # Model loading is not part of the memory a mode needs per request
+    runner = ModeRunner(name)
+    with PeakMemory() as memory:
+        # Warm up once so one-off allocation and kernel selection are not timed
+        runner.predict(images[0][1])
+        for image_name, image in images:
+            timings = []
+            for _ in range(repeats):
+                start = time.perf_counter()
+                masks[image_name], sources[image_name] = runner.predict(image)
+                timings.append(time.perf_counter() - start)
+            latencies.append(statistics.median(timings))
+    del runner
+    gc.collect()
+    return masks, sources, latencies, memory.peak_bytes
+
+
+def _run_mode_from_dir(name, input_dir, repeats):
+    # Subprocess entry point: loads its own copy of the images
+    return run_mode(name, load_images(input_dir), repeats)
+
+
+def run_mode_isolated(name, input_dir, repeats):
+    """run_mode() in a fresh process, so modes do not share allocator state or loaded models."""
+    with multiprocessing.get_context("spawn").Pool(1) as pool:
+        return pool.apply(_run_mode_from_dir, (name, input_dir, repeats))
+
+
+def score(masks, references):
+    """Mean IoU, MAE and boundary F of masks against the reference masks."""
+    per_image = {}
+    for image_name, ref_mask in references.items():
+        ref = to_array(ref_mask)
+        pred = to_array(masks[image_name], ref_mask.size)
+        per_image[image_name] = {
+            "iou": round(iou(pred, ref), 4),
+            "mae": round(mae(pred, ref), 4),
+            "boundary_f": round(boundary_f(pred, ref), 4),
+        }
+    means = {
+        metric: round(statistics.mean(r[metric] for r in per_image.values()), 4)
+        for metric in ("iou", "mae", "boundary_f")
+    }
+    return means, per_image
+
+
+def parse_arguments():
+    """Parse command line arguments"""
+    parser = argparse.ArgumentParser(description="Latency, memory and mask quality per inference mode")
+    parser.add_argument("--input-dir", default="test_images", help="Dataset directory (default: test_images)")
+    parser.add_argument("--modes", default=",".join(MODES),
+                        help=f"Comma separated modes to evaluate (default: all of {', '.join(MODES)})")
+    parser.add_argument("--repeats", type=int, default=3, help="Timed runs per image (default: 3)")
+    parser.add_argument("--json", dest="json_path", help="Write the full report to this JSON file")
+    return parser.parse_args()
+
+
+def main():
+    args = parse_arguments()
+    modes = [m.strip() for m in args.modes.split(",") if m.strip()]
+    unknown = [m for m in modes if m not in MODES]
+    if unknown:
+        print(f"Error: unknown mode(s) {', '.join(unknown)}", file=sys.stderr)
+        return 1
+
+    images = load_images(args.input_dir)
+    if not images:
+        print(f"Error: No images found in '{args.input_dir}'", file=sys.stderr)
+        return 1
+
+    print(f"Computing {REFERENCE_MODE} reference masks for {len(images)} images...", file=sys.stderr)
+    references, _, reference_latencies, reference_memory = run_mode_isolated(REFERENCE_MODE, args.input_dir, args.repeats)
+
+    rows = []
+    for name in modes:
+        if not supported(name):
+            print(f"Skipping {name}: not supported on {DEVICE.type}", file=sys.stderr)
+            continue
+        if name == REFERENCE_MODE:
+            masks, sources, latencies, memory = references, {}, reference_latencies, reference_memory
+        else:
+            print(f"Running {name}...", file=sys.stderr)
+            masks, sources, latencies, memory = run_mode_isolated(name, args.input_dir, args.repeats)
+        means, per_image = score(masks, references)
+        rows.append({
+            "mode": name,
+            "latency_mean_ms": round(statistics.mean(latencies) * 1000, 2),
+            "latency_max_ms": round(max(latencies) * 1000, 2),
+            "speedup": round(statistics.mean(reference_latencies) / statistics.mean(latencies), 2),
+            "peak_memory_mb": round(memory / 1_000_000, 1),
+            "bypassed": sum(source != "model" for source in sources.values()),
+            **means,
+            "per_image": per_image,
+        })
+
+    print("\n" + "=" * 96)
+    print(f"{'mode':12s} {'latency ms':>11s} {'max ms':>9s} {'speedup':>8s} {'peak MB':>9s} "
+          f"{'bypassed':>9s} {'IoU':>7s} {'MAE':>7s} {'bound F':>8s}")
+    print("=" * 96)
+    for row in rows:
+        print(f"{row['mode']:12s} {row['latency_mean_ms']:11.1f} {row['latency_max_ms']:9.1f} "
+              f"{row['speedup']:7.2f}x {row['peak_memory_mb']:9.1f} {row['bypassed']:9d} "
+              f"{row['iou']:7.4f} {row['mae']:7.4f} {row['boundary_f']:8.4f}")
+    print("=" * 96)
+    print(f"Quality is relative to {REFERENCE_MODE} on {DEVICE}; {len(images)} images")
+
+    if args.json_path:
+        report = {
+            "device": str(DEVICE),
+            "torch": torch.__version__,
+            "reference": REFERENCE_MODE,
+            "images": [name for name, _ in images],
+            "modes": rows,
+        }
+        with open(args.json_path, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"Report written to: {args.json_path}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,185 @@
+#!/usr/bin/env python
+"""
+Hit-rate and quality report for perceptual-hash mask reuse.
+
+Every image in the input directory is indexed with its fresh BiRefNet mask.
+Near-duplicate variants (resized, re-compressed, EXIF stripped) are then
+looked up; on a hit the reused mask is compared with fresh inference on the
+variant. A cropped variant and all cross-image pairs act as negative controls
+and should miss.
+
+Usage:
+    python -m benchmarks.phash_reuse [--input-dir test_images] [--max-distance 4] [--json report.json]
+"""
+
+import argparse
+import io
+import itertools
+import json
+import os
+import sys
+import time
+import warnings
+
+from PIL import Image
+
+from config import PHASH_MASK_SIZE, PHASH_MAX_DISTANCE
+from models.bg_remover import predict_mask
+from models.mask_cache import PerceptualMaskIndex
+from utils.mask_metrics import to_array, iou, mae
+from utils.phash import phash
+
+warnings.filterwarnings("ignore", category=FutureWarning)
+
+
+def _resize(scale):
+    def variant(image):
+        return image.resize((max(1, int(image.width * scale)), max(1, int(image.height * scale))), Image.LANCZOS)
+    return variant
+
+
+def _recompress(quality):
+    def variant(image):
+        buf = io.BytesIO()
+        image.save(buf, format="JPEG", quality=quality)
+        buf.seek(0)
+        return Image.open(buf).convert("RGB")
+    return variant
+
+
+def _strip_exif(image):
+    buf = io.BytesIO()
+    image.save(buf, format="PNG")
+    buf.seek(0)
+    return Image.open(buf).convert("RGB")
+
+
+def _crop(fraction):
+    def variant(image):
+        dx, dy = int(image.width * fraction), int(image.height * fraction)
+        return image.crop((dx, 0, image.width - dx, image.height - dy))
+    return variant
+
+
+# (name, transform, expected to hit)
+VARIANTS = [
+    ("resize_50", _resize(0.5), True),
+    ("resize_75", _resize(0.75), True),
+    ("jpeg_q60", _recompress(60), True),
+    ("exif_stripped", _strip_exif, True),
+    ("crop_10", _crop(0.10), False),
+]
+
+
+def list_images(input_dir):
+    return sorted(
+        f for f in os.listdir(input_dir)
+        if f.lower().endswith((".png", ".jpg", ".jpeg")) and not f.startswith(".")
+    )
+
+
+def run(input_dir, max_distance, mask_size):
+    index = PerceptualMaskIndex(capacity=1024, max_distance=max_distance, mask_size=mask_size)
+    originals = {}
+    rows = []
+
+    for name in list_images(input_dir):
+        image = Image.open(os.path.join(input_dir, name)).convert("RGB")
+        originals[name] = image
+        index.add(image, predict_mask(image))
+
+    for name, image in originals.items():
+        for variant_name, transform, expect_hit in VARIANTS:
+            variant = transform(image)
+
+            lookup_start = time.time()
+            hit = index.lookup(variant)
+            lookup_time = time.time() - lookup_start
+
+            infer_start = time.time()
+            fresh = predict_mask(variant)
+            infer_time = time.time() - infer_start
+
+            row = {
+                "image": name,
+                "variant": variant_name,
+                "expected_hit": expect_hit,
+                "hit": hit is not None,
+                "distance": hit[1] if hit else None,
+                "lookup_seconds": round(lookup_time, 5),
+                "inference_seconds": round(infer_time, 4),
+            }
+            if hit:
+                reused = to_array(hit[0], variant.size)
+                reference = to_array(fresh, variant.size)
+                row["iou"] = round(iou(reused, reference), 4)
+                row["mae"] = round(mae(reused, reference), 4)
+            rows.append(row)
+            print(f"{name:28s} {variant_name:14s} hit={row['hit']!s:5s} distance={row['distance']} "
+                  f"iou={row.get('iou')} mae={row.get('mae')}")
+
+    # Cross-image pairs: any match here is a false positive
+    hashes = {name: phash(image) for name, image in originals.items()}
+    false_positives = []
+    for a, b in itertools.combinations(hashes, 2):
+        distance = bin(hashes[a] ^ hashes[b]).count("1")
+        if distance <= max_distance:
+            false_positives.append({"a": a, "b": b, "distance": distance})
+
+    return rows, false_positives
+
+
+def summarize(rows, false_positives):
+    expected = [r for r in rows if r["expected_hit"]]
+    controls = [r for r in rows if not r["expected_hit"]]
+    hits = [r for r in expected if r["hit"]]
+    summary = {
+        "near_duplicate_lookups": len(expected),
+        "near_duplicate_hit_rate": round(len(hits) / len(expected), 4) if expected else None,
+        "control_false_hits": sum(1 for r in controls if r["hit"]),
+        "cross_image_false_positives": len(false_positives),
+        "mean_iou_on_hit": round(sum(r["iou"] for r in hits) / len(hits), 4) if hits else None,
+        "min_iou_on_hit": min((r["iou"] for r in hits), default=None),
+        "mean_mae_on_hit": round(sum(r["mae"] for r in hits) / len(hits), 4) if hits else None,
+        "mean_lookup_seconds": round(sum(r["lookup_seconds"] for r in rows) / len(rows), 5) if rows else None,
+        "mean_inference_seconds": round(sum(r["inference_seconds"] for r in rows) / len(rows), 4) if rows else None,
+    }
+    per_variant = {}
+    for variant_name, _, _ in VARIANTS:
+        variant_rows = [r for r in rows if r["variant"] == variant_name]
+        per_variant[variant_name] = round(sum(r["hit"] for r in variant_rows) / len(variant_rows), 4) if variant_rows else None
+    summary["hit_rate_by_variant"] = per_variant
+    return summary
+
+
+def parse_arguments():
+    """Parse command line arguments"""
+    parser = argparse.ArgumentParser(description="Evaluate perceptual-hash mask reuse")
+    parser.add_argument("--input-dir", type=str, default="test_images",
+                        help="Directory containing test images (default: test_images)")
+    parser.add_argument("--max-distance", type=int, default=PHASH_MAX_DISTANCE,
+                        help=f"Hamming distance threshold (default: {PHASH_MAX_DISTANCE})")
+    parser.add_argument("--mask-size", type=int, default=PHASH_MASK_SIZE,
+                        help=f"Stored mask resolution (default: {PHASH_MASK_SIZE})")
+    parser.add_argument("--json", type=str, help="Write the full report to this JSON file")
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    args = parse_arguments()
+    rows, false_positives = run(args.input_dir, args.max_distance, args.mask_size)
+    summary = summarize(rows, false_positives)
+
+    print("\n" + "=" * 50)
+    print("PHASH MASK REUSE SUMMARY")
+    print("=" * 50)
+    for key, value in summary.items():
+        print(f"{key}: {value}")
+    print("=" * 50)
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump({"summary": summary, "rows": rows, "false_positives": false_positives}, f, indent=2)
+        print(f"Report written to: {args.json}")
+
+    sys.exit(0)
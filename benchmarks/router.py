@@ -0,0 +1,169 @@
+#!/usr/bin/env python
+"""
+Tail latency through router.py with and without queue-depth balancing.
+
+Starts several app.py instances on local ports, then for each scenario
+(round robin and random as a plain load balancer would do, queue-depth
+balancing, and queue-depth balancing with content-hash affinity) starts the
+router in front of them and drives it with the load_test.py client mix.
+Instances are restarted for every scenario so each starts with cold mask
+caches. Reports throughput, latency percentiles and the share of masks
+served from the near-duplicate cache.
+
+Use --slow-backends to give some instances a single torch thread, which
+makes the replicas uneven the way mixed hardware or noisy neighbours do.
+
+Usage:
+    python -m benchmarks.router [--stub-model] [--backends 3] [--slow-backends 1]
+                                [--concurrency 12] [--duration 30] [--json router.json]
+"""
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+import threading
+import time
+
+import requests
+
+from load_test import load_payloads, StubServer, worker, summarize, parse_mix
+
+SCENARIOS = [
+    ("round_robin", ["--policy", "round_robin"]),
+    ("random", ["--policy", "random"]),
+    ("queue", ["--policy", "queue"]),
+    ("queue_affinity", ["--policy", "queue", "--affinity"]),
+]
+
+
+def wait_ready(url, timeout=300):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            if requests.get(url, timeout=1).status_code == 200:
+                return
+        except requests.RequestException:
+            pass
+        time.sleep(0.5)
+    raise RuntimeError(f"{url} did not become ready within {timeout}s")
+
+
+def start_backends(count, slow, base_port, stub_model):
+    threads = max(1, (os.cpu_count() or 1) // count)
+    processes = []
+    for i in range(count):
+        env = dict(os.environ, RATE_LIMIT_ENABLED="false", MAX_CONCURRENT_INFERENCES="1",
+                   TORCH_INTRA_OP_THREADS=str(1 if i < slow else threads), TORCH_INTER_OP_THREADS="1")
+        if stub_model:
+            env["USE_STUB_MODEL"] = "true"
+        processes.append(subprocess.Popen(
+            [sys.executable, "app.py", "--port", str(base_port + i), "--host", "127.0.0.1", "--log-level", "WARNING"],
+            env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+        ))
+    urls = [f"http://127.0.0.1:{base_port + i}" for i in range(count)]
+    for url in urls:
+        wait_ready(f"{url}/health")
+    return processes, urls
+
+
+def stop(processes):
+    for process in processes:
+        process.terminate()
+    for process in processes:
+        try:
+            process.wait(timeout=30)
+        except subprocess.TimeoutExpired:
+            process.kill()
+
+
+def cache_hits(urls):
+    """Masks served by the model and by the near-duplicate cache, summed over backends."""
+    totals = {"model": 0, "phash_cache": 0}
+    for url in urls:
+        counters = requests.get(f"{url}/metrics", timeout=5).json().get("counters", {})
+        for source in totals:
+            totals[source] += counters.get(f"mask_source_total{{source={source}}}", 0)
+    return totals
+
+
+def run_scenario(name, router_args, args, payloads, mix):
+    processes, urls = start_backends(args.backends, args.slow_backends, args.base_port, args.stub_model)
+    router_cmd = [sys.executable, "router.py", "--port", str(args.router_port), "--host", "127.0.0.1"]
+    for url in urls:
+        router_cmd += ["--backend", url]
+    router = subprocess.Popen(router_cmd + router_args, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        router_url = f"http://127.0.0.1:{args.router_port}"
+        wait_ready(f"{router_url}/router/status")
+
+        results = []
+        lock = threading.Lock()
+        with StubServer(payloads) as stub:
+            start = time.time()
+            deadline = start + args.duration
+            threads = [
+                # Repeats are kept: the affinity scenario is about mask cache hits
+                threading.Thread(target=worker, args=(f"{router_url}/remove-bg", mix, payloads, stub, deadline,
+                                                      args.timeout, results, lock, args.seed + i, True))
+                for i in range(args.concurrency)
+            ]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+            elapsed = time.time() - start
+
+        row = dict(scenario=name, **summarize(results, elapsed))
+        masks = cache_hits(urls)
+        total = masks["model"] + masks["phash_cache"]
+        row["mask_cache_hit_rate"] = round(masks["phash_cache"] / total, 4) if total else None
+        print(f"{name:16s} rps={row['throughput_rps']} p50={row['latency_p50']} p95={row['latency_p95']} "
+              f"p99={row['latency_p99']} max={row['latency_max']} cache_hits={row['mask_cache_hit_rate']} "
+              f"errors={row['error_rate']}", flush=True)
+        return row
+    finally:
+        stop([router])
+        stop(processes)
+
+
+def parse_arguments():
+    """Parse command line arguments"""
+    parser = argparse.ArgumentParser(description="Compare router policies by tail latency")
+    parser.add_argument("--stub-model", action="store_true", help="Run the instances with the stub model")
+    parser.add_argument("--backends", type=int, default=3, help="Number of app.py instances (default: 3)")
+    parser.add_argument("--slow-backends", type=int, default=0,
+                        help="How many instances get a single torch thread (default: 0)")
+    parser.add_argument("--concurrency", type=int, default=12, help="Concurrent clients (default: 12)")
+    parser.add_argument("--duration", type=float, default=30, help="Seconds per scenario (default: 30)")
+    parser.add_argument("--mix", default="file=1", type=parse_mix, help="Weighted input methods (default: file=1)")
+    parser.add_argument("--sizes", default="256,1024,2048", help="Longest image sides (default: 256,1024,2048)")
+    parser.add_argument("--input-dir", default="test_images", help="Source images (default: test_images)")
+    parser.add_argument("--scenarios", default=",".join(name for name, _ in SCENARIOS),
+                        help="Comma separated subset of scenarios to run")
+    parser.add_argument("--base-port", type=int, default=5101, help="First instance port (default: 5101)")
+    parser.add_argument("--router-port", type=int, default=8100, help="Router port (default: 8100)")
+    parser.add_argument("--timeout", type=float, default=120, help="Per-request timeout (default: 120)")
+    parser.add_argument("--seed", type=int, default=0, help="Random seed for the request mix (default: 0)")
+    parser.add_argument("--json", type=str, help="Write the report to this JSON file")
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    args = parse_arguments()
+    payloads = load_payloads(args.input_dir, [int(s) for s in args.sizes.split(",")])
+    if not payloads:
+        print(f"Error: No images found in '{args.input_dir}'", file=sys.stderr)
+        sys.exit(1)
+
+    selected = args.scenarios.split(",")
+    rows = [run_scenario(name, router_args, args, payloads, args.mix) for name, router_args in SCENARIOS if name in selected]
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump({"backends": args.backends, "slow_backends": args.slow_backends,
+                       "concurrency": args.concurrency, "duration": args.duration, "scenarios": rows}, f, indent=2)
+        print(f"Report written to: {args.json}")
+
+    sys.exit(0)
@@ -0,0 +1,152 @@
+#!/usr/bin/env python
+"""
+Speed and quality of sequence mode against running the model on every frame.
+
+Synthetic clips are built from the test images: a static shot with
+re-compression noise, a camera pan (a sliding crop), a slow zoom (not
+compensated by warping, so it forces keyframes) and a hard cut between two
+images. A directory of real frames can be added with --frames-dir. For each
+clip, the masks from sequence mode are compared with per-frame inference.
+
+Usage:
+    python -m benchmarks.sequence [--input-dir test_images] [--frames 24] [--frames-dir clip/] [--json report.json]
+"""
+
+import argparse
+import io
+import json
+import os
+import sys
+import time
+import warnings
+
+from PIL import Image
+
+from config import SEQUENCE_DIFF_THRESHOLD, SEQUENCE_KEYFRAME_INTERVAL, SEQUENCE_BATCH_SIZE
+from models.bg_remover import predict_masks
+from models.sequence import sequence_masks
+from utils.mask_metrics import to_array, iou, boundary_f
+
+warnings.filterwarnings("ignore", category=FutureWarning)
+
+FRAME_SIZE = (640, 480)
+
+
+def _jpeg(image, quality=85):
+    buf = io.BytesIO()
+    image.save(buf, format="JPEG", quality=quality)
+    buf.seek(0)
+    return Image.open(buf).convert("RGB")
+
+
+def static_clip(image, frames):
+    base = image.resize(FRAME_SIZE, Image.LANCZOS)
+    return [_jpeg(base, 80 + i % 3 * 5) for i in range(frames)]
+
+
+def pan_clip(image, frames, travel=0.15):
+    width, height = FRAME_SIZE
+    wide = image.resize((int(width * (1 + travel)), height), Image.LANCZOS)
+    step = (wide.width - width) / max(frames - 1, 1)
+    return [_jpeg(wide.crop((round(i * step), 0, round(i * step) + width, height))) for i in range(frames)]
+
+
+def zoom_clip(image, frames, zoom=0.2):
+    base = image.resize(FRAME_SIZE, Image.LANCZOS)
+    width, height = FRAME_SIZE
+    clip = []
+    for i in range(frames):
+        margin = zoom / 2 * i / max(frames - 1, 1)
+        box = (round(width * margin), round(height * margin), round(width * (1 - margin)), round(height * (1 - margin)))
+        clip.append(_jpeg(base.crop(box).resize(FRAME_SIZE, Image.BILINEAR)))
+    return clip
+
+
+def cut_clip(first, second, frames):
+    half = frames // 2
+    return static_clip(first, half) + static_clip(second, frames - half)
+
+
+def load_frames_dir(frames_dir):
+    names = sorted(f for f in os.listdir(frames_dir) if f.lower().endswith((".png", ".jpg", ".jpeg")) and not f.startswith("."))
+    return [Image.open(os.path.join(frames_dir, name)).convert("RGB") for name in names]
+
+
+def run_clip(name, frames, diff_threshold, keyframe_interval, batch_size):
+    start = time.time()
+    reference = []
+    for i in range(0, len(frames), batch_size):
+        reference += predict_masks(frames[i:i + batch_size])
+    per_frame_time = time.time() - start
+
+    start = time.time()
+    masks, plans = sequence_masks(frames, diff_threshold, keyframe_interval, batch_size=batch_size)
+    sequence_time = time.time() - start
+
+    ious, boundaries = [], []
+    for frame, mask, ref in zip(frames, masks, reference):
+        pred, ref = to_array(mask, frame.size), to_array(ref, frame.size)
+        ious.append(iou(pred, ref))
+        boundaries.append(boundary_f(pred, ref))
+
+    keyframes = sum(plan.source == "model" for plan in plans)
+    row = {
+        "clip": name,
+        "frames": len(frames),
+        "keyframes": keyframes,
+        "warped": sum(plan.source == "warped" for plan in plans),
+        "per_frame_seconds": round(per_frame_time, 3),
+        "sequence_seconds": round(sequence_time, 3),
+        "speedup": round(per_frame_time / sequence_time, 2) if sequence_time > 0 else None,
+        "mean_iou": round(sum(ious) / len(ious), 4),
+        "min_iou": round(min(ious), 4),
+        "mean_boundary_f": round(sum(boundaries) / len(boundaries), 4),
+    }
+    print(f"{name:24s} frames={row['frames']:3d} keyframes={keyframes:3d} speedup={row['speedup']}x "
+          f"iou={row['mean_iou']} (min {row['min_iou']}) boundary_f={row['mean_boundary_f']}")
+    return row
+
+
+def parse_arguments():
+    """Parse command line arguments"""
+    parser = argparse.ArgumentParser(description="Evaluate sequence mode against per-frame inference")
+    parser.add_argument("--input-dir", type=str, default="test_images",
+                        help="Directory containing test images (default: test_images)")
+    parser.add_argument("--frames", type=int, default=24, help="Frames per synthetic clip (default: 24)")
+    parser.add_argument("--frames-dir", type=str, help="Also evaluate a directory of real frames (sorted by name)")
+    parser.add_argument("--diff-threshold", type=float, default=SEQUENCE_DIFF_THRESHOLD,
+                        help=f"Changed fraction that triggers a keyframe (default: {SEQUENCE_DIFF_THRESHOLD})")
+    parser.add_argument("--keyframe-interval", type=int, default=SEQUENCE_KEYFRAME_INTERVAL,
+                        help=f"Forced keyframe interval, 0 for none (default: {SEQUENCE_KEYFRAME_INTERVAL})")
+    parser.add_argument("--batch-size", type=int, default=SEQUENCE_BATCH_SIZE,
+                        help=f"Frames per model batch (default: {SEQUENCE_BATCH_SIZE})")
+    parser.add_argument("--json", type=str, help="Write the report to this JSON file")
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    args = parse_arguments()
+    names = sorted(f for f in os.listdir(args.input_dir) if f.lower().endswith((".png", ".jpg", ".jpeg")) and not f.startswith("."))
+    images = [Image.open(os.path.join(args.input_dir, name)).convert("RGB") for name in names[:2]]
+    if not images:
+        print(f"Error: no images in '{args.input_dir}'")
+        sys.exit(1)
+
+    clips = [
+        ("static", static_clip(images[0], args.frames)),
+        ("pan", pan_clip(images[0], args.frames)),
+        ("zoom", zoom_clip(images[0], args.frames)),
+        ("cut", cut_clip(images[0], images[-1], args.frames)),
+    ]
+    if args.frames_dir:
+        clips.append((os.path.basename(os.path.normpath(args.frames_dir)), load_frames_dir(args.frames_dir)))
+
+    rows = [run_clip(name, frames, args.diff_threshold, args.keyframe_interval, args.batch_size) for name, frames in clips]
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump({"diff_threshold": args.diff_threshold, "keyframe_interval": args.keyframe_interval,
+                       "batch_size": args.batch_size, "clips": rows}, f, indent=2)
+        print(f"Report written to: {args.json}")
+
+    sys.exit(0)
@@ -0,0 +1,126 @@
+#!/usr/bin/env python
+"""
+Benchmark the vectorised sky detection against the original per-pixel loops.
+
+The loop implementation below is the one that used to live in
+test_all_images.create_debug_visualization; it is kept here only as the
+reference for correctness and speed. Images are downscaled to --max-side
+first because the loops take minutes on full-size photos.
+
+Usage:
+    python -m benchmarks.sky_detection [--input-dir test_images] [--max-side 256] [--json report.json]
+"""
+
+import argparse
+import json
+import os
+import sys
+import time
+
+import numpy as np
+from PIL import Image
+
+from utils.sky_detection import detect_sky
+
+
+def detect_sky_loops(img_np):
+    """Reference implementation: nested Python loops over every pixel."""
+    h, w, _ = img_np.shape
+
+    sky_mask = np.zeros((h, w), dtype=np.uint8)
+    for y in range(h):
+        for x in range(w):
+            r, g, b = img_np[y, x]
+            is_blue_sky = b > r and b > g and b > 100
+            brightness = (int(r) + int(g) + int(b)) / 3.0
+            is_bright = (brightness > 200 and
+                         abs(int(r) - int(g)) < 20 and
+                         abs(int(r) - int(b)) < 20 and
+                         abs(int(g) - int(b)) < 20)
+            if is_blue_sky or is_bright:
+                sky_mask[y, x] = 255
+
+    upper_region = np.zeros((h // 4, w), dtype=np.uint8)
+    for y in range(h // 4):
+        for x in range(w):
+            count = 0
+            for dy in [-2, -1, 0, 1, 2]:
+                for dx in [-2, -1, 0, 1, 2]:
+                    ny, nx = y + dy, x + dx
+                    if 0 <= ny < h // 4 and 0 <= nx < w and sky_mask[ny, nx] > 0:
+                        count += 1
+            if count > 15:
+                upper_region[y, x] = 255
+
+    return sky_mask, upper_region
+
+
+def benchmark_image(image_path, max_side, repeats):
+    image = Image.open(image_path).convert("RGB")
+    image.thumbnail((max_side, max_side), Image.LANCZOS)
+    img_np = np.array(image)
+
+    loop_start = time.perf_counter()
+    ref_sky, ref_upper = detect_sky_loops(img_np)
+    loop_time = time.perf_counter() - loop_start
+
+    vec_times = []
+    for _ in range(repeats):
+        vec_start = time.perf_counter()
+        sky, upper, _ = detect_sky(img_np)
+        vec_times.append(time.perf_counter() - vec_start)
+    vec_time = min(vec_times)
+
+    return {
+        "image": os.path.basename(image_path),
+        "size": list(image.size),
+        "loop_seconds": round(loop_time, 4),
+        "vectorised_seconds": round(vec_time, 6),
+        "speedup": round(loop_time / vec_time, 1) if vec_time > 0 else None,
+        "identical": bool(np.array_equal(ref_sky, sky) and np.array_equal(ref_upper, upper)),
+    }
+
+
+def parse_arguments():
+    """Parse command line arguments"""
+    parser = argparse.ArgumentParser(description="Benchmark sky detection: loops vs vectorised")
+    parser.add_argument("--input-dir", type=str, default="test_images",
+                        help="Directory containing test images (default: test_images)")
+    parser.add_argument("--max-side", type=int, default=256,
+                        help="Downscale images so the longest side is at most this (default: 256)")
+    parser.add_argument("--repeats", type=int, default=5,
+                        help="Repetitions of the vectorised version; the best time is kept (default: 5)")
+    parser.add_argument("--json", type=str, help="Write results to this JSON file")
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    args = parse_arguments()
+
+    image_files = sorted(
+        f for f in os.listdir(args.input_dir)
+        if f.lower().endswith((".png", ".jpg", ".jpeg")) and not f.startswith(".")
+    )
+
+    results = []
+    for image_file in image_files:
+        result = benchmark_image(os.path.join(args.input_dir, image_file), args.max_side, args.repeats)
+        results.append(result)
+        print(f"{result['image']:28s} {result['size'][0]}x{result['size'][1]}  "
+              f"loops: {result['loop_seconds']:.3f}s  vectorised: {result['vectorised_seconds'] * 1000:.2f}ms  "
+              f"speedup: {result['speedup']}x  identical: {result['identical']}")
+
+    all_identical = all(r["identical"] for r in results)
+    print("\n" + "=" * 50)
+    print(f"Images: {len(results)}, outputs identical: {all_identical}")
+    if results:
+        total_loop = sum(r["loop_seconds"] for r in results)
+        total_vec = sum(r["vectorised_seconds"] for r in results)
+        print(f"Total loops: {total_loop:.2f}s, total vectorised: {total_vec:.4f}s, speedup: {total_loop / total_vec:.0f}x")
+    print("=" * 50)
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=2)
+
+    sys.exit(0 if all_identical else 1)
@@ -0,0 +1,251 @@
+#!/usr/bin/env python
+"""
+Per-stage micro-benchmarks of the /remove-bg hot path.
+
+Stages:
+- decode:     get_input_image() on an uploaded file
+- preprocess: transform_image() (resize + normalise to model input)
+- forward:    model forward pass (predict_mask_batch)
+- composite:  mask upsample + alpha composite (apply_mask)
+- encode:     PNG encode of the RGBA result, as in routes/remove_bg
+
+Inputs are the images in test_images/ plus synthetic images at the given
+sizes. Results (median and min seconds per stage and input) can be saved
+as a baseline, and a later run can be compared against it; stages slower
+than the baseline by more than --threshold are reported as regressions and
+the exit code is 1.
+
+Runs on a CPU-only machine; --stub-model replaces BiRefNet with a tiny
+untrained network so the checkpoint does not need to be downloaded (the
+forward numbers are then only comparable with other stub runs).
+
+Usage:
+    python -m benchmarks.stages --stub-model --save benchmarks/baseline.json
+    python -m benchmarks.stages --stub-model --compare benchmarks/baseline.json [--threshold 0.15]
+"""
+
+import argparse
+import io
+import json
+import os
+import platform
+import statistics
+import sys
+import time
+from datetime import datetime
+
+import numpy as np
+from PIL import Image
+
+STAGES = ("decode", "preprocess", "forward", "composite", "encode")
+
+# Differences smaller than this are treated as noise regardless of ratio
+MIN_REGRESSION_SECONDS = 0.002
+
+
+class _Upload:
+    """Minimal stand-in for a werkzeug FileStorage."""
+
+    def __init__(self, data):
+        self.stream = io.BytesIO(data)
+
+
+class _UploadRequest:
+    """Minimal stand-in for a Flask request with one image_file upload."""
+
+    def __init__(self, data):
+        self.files = {"image_file": _Upload(data)}
+        self.form = {}
+
+
+def synthetic_image(size):
+    """Smooth gradient with a disc, so encoders see realistic-ish content."""
+    width = height = size
+    y, x = np.mgrid[0:height, 0:width].astype(np.float32)
+    pixels = np.stack([
+        255 * x / max(width - 1, 1),
+        255 * y / max(height - 1, 1),
+        127 + 64 * np.sin(x / 37.0) * np.cos(y / 53.0),
+    ], axis=2)
+    disc = (x - width / 2) ** 2 + (y - height / 2) ** 2 < (size / 4) ** 2
+    pixels[disc] = (230, 40, 40)
+    return Image.fromarray(pixels.clip(0, 255).astype(np.uint8))
+
+
+def load_inputs(input_dir, sizes):
+    """Return a list of (name, encoded JPEG/PNG bytes)."""
+    inputs = []
+    if input_dir and os.path.isdir(input_dir):
+        for name in sorted(os.listdir(input_dir)):
+            if name.lower().endswith((".png", ".jpg", ".jpeg")) and not name.startswith("."):
+                with open(os.path.join(input_dir, name), "rb") as f:
+                    inputs.append((name, f.read()))
+    for size in sizes:
+        buf = io.BytesIO()
+        synthetic_image(size).save(buf, format="JPEG", quality=90)
+        inputs.append((f"synthetic_{size}", buf.getvalue()))
+    return inputs
+
+
+def time_call(fn, repeats, warmup):
+    """Run fn warmup + repeats times; return (timings, last result)."""
+    result = None
+    for _ in range(warmup):
+        result = fn()
+    timings = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        result = fn()
+        timings.append(time.perf_counter() - start)
+    return timings, result
+
+
+def run_benchmarks(inputs, repeats, warmup):
+    # Imported here so --stub-model can take effect before the model loads
+    from utils.image_utils import get_input_image
+    from models.bg_remover import transform_image, predict_mask_batch, apply_mask
+    from torchvision import transforms
+
+    to_pil = transforms.ToPILImage()
+    results = {}
+    for name, data in inputs:
+        timings = {}
+        timings["decode"], image = time_call(lambda: get_input_image(_UploadRequest(data)), repeats, warmup)
+        # Sources with alpha decode as RGBA; the model takes RGB, as in get_mask()
+        rgb = image if image.mode == "RGB" else image.convert("RGB")
+        timings["preprocess"], tensor = time_call(lambda: transform_image(rgb), repeats, warmup)
+        batch = tensor.unsqueeze(0)
+        timings["forward"], masks = time_call(lambda: predict_mask_batch(batch), repeats, warmup)
+        mask = to_pil(masks[0])
+        timings["composite"], output = time_call(lambda: apply_mask(image, mask), repeats, warmup)
+
+        def encode():
+            buf = io.BytesIO()
+            output.save(buf, format="PNG")
+            return buf
+
+        timings["encode"], _ = time_call(encode, repeats, warmup)
+
+        for stage in STAGES:
+            results[f"{stage}/{name}"] = {
+                "median": round(statistics.median(timings[stage]), 6),
+                "min": round(min(timings[stage]), 6),
+                "megapixels": round(image.width * image.height / 1_000_000, 3),
+            }
+        summary = "  ".join(f"{stage}: {results[f'{stage}/{name}']['median'] * 1000:.1f}ms" for stage in STAGES)
+        print(f"{name:28s} {summary}", file=sys.stderr)
+    return results
+
+
+def environment(stub_model):
+    import torch
+    from config import MODEL_NAME, MODEL_INPUT_SIZE, DEVICE
+    return {
+        "timestamp": datetime.now().isoformat(),
+        "python": platform.python_version(),
+        "torch": torch.__version__,
+        "torch_threads": torch.get_num_threads(),
+        "machine": platform.machine(),
+        "processor": platform.processor(),
+        "cpu_count": os.cpu_count(),
+        "device": str(DEVICE),
+        "model": "stub" if stub_model else MODEL_NAME,
+        "model_input_size": list(MODEL_INPUT_SIZE),
+    }
+
+
+def compare(current, baseline, threshold, statistic="min"):
+    """
+    Compare stage timings with a baseline.
+
+    The minimum is the default statistic since it is the least sensitive to
+    noise from other processes on the machine.
+
+    Returns:
+        (rows, regressions): all compared rows and those slower than threshold
+    """
+    rows, regressions = [], []
+    for key, result in sorted(current.items()):
+        base = baseline.get(key)
+        if base is None:
+            rows.append({"key": key, "current": result[statistic], "baseline": None, "change": None})
+            continue
+        now, before = result[statistic], base[statistic]
+        change = (now - before) / before if before > 0 else 0.0
+        row = {"key": key, "current": now, "baseline": before, "change": round(change, 4)}
+        rows.append(row)
+        if change > threshold and now - before > MIN_REGRESSION_SECONDS:
+            regressions.append(row)
+    return rows, regressions
+
+
+def parse_arguments():
+    """Parse command line arguments"""
+    parser = argparse.ArgumentParser(description="Per-stage benchmarks of the background removal hot path")
+    parser.add_argument("--input-dir", default="test_images", help="Real images to benchmark (default: test_images)")
+    parser.add_argument("--sizes", default="512,2048,4096",
+                        help="Synthetic square image sizes, comma separated, empty for none (default: 512,2048,4096)")
+    parser.add_argument("--repeats", type=int, default=5, help="Timed repetitions per stage (default: 5)")
+    parser.add_argument("--warmup", type=int, default=1, help="Untimed warmup runs per stage (default: 1)")
+    parser.add_argument("--stub-model", action="store_true",
+                        help="Use a tiny untrained model instead of BiRefNet (no download needed)")
+    parser.add_argument("--save", help="Write results as a baseline JSON file")
+    parser.add_argument("--compare", help="Compare results with this baseline JSON file")
+    parser.add_argument("--threshold", type=float, default=0.15,
+                        help="Relative slowdown reported as a regression (default: 0.15)")
+    parser.add_argument("--statistic", choices=("min", "median"), default="min",
+                        help="Timing compared against the baseline (default: min)")
+    parser.add_argument("--output", help="Write results (and comparison) JSON to this file")
+    return parser.parse_args()
+
+
+def main():
+    args = parse_arguments()
+    if args.stub_model:
+        os.environ["USE_STUB_MODEL"] = "true"
+
+    sizes = [int(s) for s in args.sizes.split(",") if s.strip()]
+    inputs = load_inputs(args.input_dir, sizes)
+    if not inputs:
+        print("Error: no inputs to benchmark", file=sys.stderr)
+        return 1
+
+    results = run_benchmarks(inputs, args.repeats, args.warmup)
+    report = {"environment": environment(args.stub_model), "results": results}
+
+    exit_code = 0
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        rows, regressions = compare(results, baseline["results"], args.threshold, args.statistic)
+        report["comparison"] = {
+            "baseline_environment": baseline.get("environment"),
+            "statistic": args.statistic,
+            "threshold": args.threshold,
+            "rows": rows,
+            "regressions": regressions,
+        }
+        print("\n" + "=" * 50, file=sys.stderr)
+        print(f"COMPARISON WITH {args.compare} (threshold {args.threshold:.0%})", file=sys.stderr)
+        print("=" * 50, file=sys.stderr)
+        for row in rows:
+            change = f"{row['change']:+.1%}" if row["change"] is not None else "new"
+            flag = "  ❌ REGRESSION" if row in regressions else ""
+            print(f"{row['key']:40s} {row['current'] * 1000:9.2f}ms  {change:>8s}{flag}", file=sys.stderr)
+        print(f"\n{len(regressions)} regression(s)", file=sys.stderr)
+        if regressions:
+            exit_code = 1
+
+    if args.save:
+        with open(args.save, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"Baseline written to: {args.save}", file=sys.stderr)
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+
+    return exit_code
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,394 @@
+#!/usr/bin/env python
+"""
+Python client for the Background Removal API.
+
+One client holds a pool of keep-alive connections and is safe to share
+between threads. Requests rejected with 429 or 503 (rate limit, full
+queue) and refused connections are retried with exponential backoff,
+waiting at least as long as the server's Retry-After. Images are sent as
+the raw request body by default, which skips multipart encoding on both
+sides.
+
+    from client import BgRemovalClient
+
+    with BgRemovalClient("http://localhost:5000", api_key="...") as api:
+        api.remove("photo.jpg").save("photo.png")
+
+        # Many images, at most 8 requests in flight, results as they finish
+        for item in api.map(paths, window=8):
+            if item.ok:
+                item.result.save(f"out/{item.index}.png")
+            else:
+                print(item.input, item.error)
+
+        # URLs fetched and processed by the server, results streamed back
+        for item in api.batch_urls(urls):
+            ...
+
+Usage as a script:
+    python client.py [--url http://localhost:5000] [--window 8] [--output-dir out] image [image ...]
+"""
+
+import argparse
+import base64
+import io
+import json
+import mimetypes
+import os
+import random
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+import requests
+from requests.adapters import HTTPAdapter
+
+# Statuses that mean "try again later": rate limited, queue full or draining
+RETRY_STATUSES = (429, 503)
+
+USER_AGENT = "BgRemovalClient/1.0"
+
+
+class ApiError(Exception):
+    """A request the server answered with an error status (after any retries)."""
+
+    def __init__(self, status_code, message, retry_after=None):
+        super().__init__(f"{status_code}: {message}")
+        self.status_code = status_code
+        self.message = message
+        self.retry_after = retry_after
+
+
+class Result:
+    """
+    Output of one image.
+
+    Attributes:
+        content: PNG bytes, None for response="reference"
+        reference: For response="reference", the stored result (id, url,
+            size, width, height, expires_at); None otherwise
+        headers: Response headers (X-Model, X-Mask-Source, X-Queue-Wait, ...)
+        attempts: Requests made, including retries
+        seconds: Time from the first attempt until the response was read
+    """
+
+    def __init__(self, content, headers, attempts=1, seconds=0.0, reference=None):
+        self.content = content
+        self.reference = reference
+        self.headers = headers
+        self.attempts = attempts
+        self.seconds = seconds
+
+    def image(self):
+        """The output as a PIL Image (RGBA)."""
+        from PIL import Image
+        return Image.open(io.BytesIO(self.content))
+
+    def save(self, path):
+        """Write the PNG to path."""
+        with open(path, "wb") as f:
+            f.write(self.content)
+
+
+class BatchItem:
+    """
+    One input of map() or batch_urls().
+
+    Attributes:
+        index: Position of the input
+        input: The input as given (image or URL)
+        result: Result on success, else None
+        error: Exception on failure (usually ApiError), else None
+    """
+
+    def __init__(self, index, input, result=None, error=None):
+        self.index = index
+        self.input = input
+        self.result = result
+        self.error = error
+
+    @property
+    def ok(self):
+        return self.error is None
+
+
+def _option_value(value):
+    return str(value).lower() if isinstance(value, bool) else str(value)
+
+
+def _read_image(image):
+    """(bytes, content type) of bytes, a path or a binary file object."""
+    if isinstance(image, (bytes, bytearray, memoryview)):
+        return bytes(image), "application/octet-stream"
+    if isinstance(image, (str, os.PathLike)):
+        content_type = mimetypes.guess_type(os.fspath(image))[0]
+        with open(image, "rb") as f:
+            data = f.read()
+        return data, content_type if content_type and content_type.startswith("image/") else "application/octet-stream"
+    if hasattr(image, "read"):
+        return image.read(), "application/octet-stream"
+    raise TypeError(f"Unsupported image input: {type(image).__name__} (expected bytes, a path or a file object)")
+
+
+def _error_message(response):
+    try:
+        return response.json().get("error", response.text)
+    except ValueError:
+        return response.text or response.reason
+
+
+class BgRemovalClient:
+    """
+    Client for one server (or a router.py in front of several).
+
+    Args:
+        base_url: Server URL, e.g. "http://localhost:5000"
+        api_key: Sent as X-API-Key; the server rate limits and queues per key
+            instead of per IP
+        timeout: Seconds to wait for a response (connect and read)
+        pool_size: Keep-alive connections kept open; threads beyond it wait
+            for a free connection instead of opening throwaway ones
+        max_retries: Retries of a request answered with 429/503 or refused
+        backoff: First retry delay in seconds, doubled on every retry
+        max_backoff: Largest delay between retries, unless the server asks
+            for more with Retry-After
+    """
+
+    def __init__(self, base_url="http://localhost:5000", api_key=None, timeout=120, pool_size=16,
+                 max_retries=5, backoff=0.5, max_backoff=30):
+        self.base_url = base_url.rstrip("/")
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size, pool_block=True)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        self.session.headers["User-Agent"] = USER_AGENT
+        if api_key:
+            self.session.headers["X-API-Key"] = api_key
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+        return False
+
+    def close(self):
+        """Close the pooled connections."""
+        self.session.close()
+
+    def _delay(self, attempt, retry_after=None):
+        # Full jitter spreads out clients that were rejected together
+        delay = random.uniform(0, min(self.max_backoff, self.backoff * 2 ** attempt))
+        try:
+            return max(delay, float(retry_after)) if retry_after else delay
+        except ValueError:
+            return delay
+
+    def _request(self, method, path, **kwargs):
+        """Send a request, retrying 429/503 and refused connections; returns (response, attempts)."""
+        for attempt in range(self.max_retries + 1):
+            try:
+                response = self.session.request(method, self.base_url + path, timeout=self.timeout, **kwargs)
+            except requests.ConnectionError:
+                if attempt == self.max_retries:
+                    raise
+                delay = self._delay(attempt)
+            else:
+                if response.status_code not in RETRY_STATUSES or attempt == self.max_retries:
+                    return response, attempt + 1
+                delay = self._delay(attempt, response.headers.get("Retry-After"))
+                response.close()
+            time.sleep(delay)
+
+    @staticmethod
+    def _check(response):
+        if response.status_code >= 400:
+            raise ApiError(response.status_code, _error_message(response), response.headers.get("Retry-After"))
+
+    def remove(self, image=None, url=None, raw=True, model=None, response="image", **options):
+        """
+        Remove the background of one image.
+
+        Args:
+            image: bytes, a path or a binary file object
+            url: Image URL for the server to fetch, instead of image
+            raw: Send the image as the request body (default) rather than
+                as multipart form-data
+            model: Registry name of the model, None for the server default
+            response: "image" for the PNG, or "reference" to keep it on the
+                server (see fetch_result())
+            **options: Other /remove-bg options (reuse_mask, fast_path,
+                threshold, lane, ...)
+
+        Returns:
+            Result
+
+        Raises:
+            ApiError, or requests.RequestException for network errors
+        """
+        params = {name: _option_value(value) for name, value in options.items() if value is not None}
+        if model:
+            params["model"] = model
+        if response != "image":
+            params["response"] = response
+
+        start = time.time()
+        if url is not None:
+            resp, attempts = self._request("POST", "/remove-bg", data=dict(params, image_url=url))
+        else:
+            # Read once, so retries resend the same bytes
+            data, content_type = _read_image(image)
+            if raw:
+                resp, attempts = self._request("POST", "/remove-bg", params=params, data=data,
+                                               headers={"Content-Type": content_type})
+            else:
+                resp, attempts = self._request("POST", "/remove-bg", data=params,
+                                               files={"image_file": ("image", data, content_type)})
+        self._check(resp)
+        if response == "reference":
+            return Result(None, dict(resp.headers), attempts, time.time() - start, reference=resp.json())
+        return Result(resp.content, dict(resp.headers), attempts, time.time() - start)
+
+    def map(self, images, window=8, ordered=False, **kwargs):
+        """
+        Process many images concurrently with at most window requests in flight.
+
+        Inputs are consumed lazily, so images may be a generator over a large
+        directory. Failures are reported per item rather than raised.
+
+        Args:
+            images: Iterable of inputs accepted by remove() as image
+            window: Most requests in flight (and, with ordered, results
+                held back) at once
+            ordered: Yield in input order instead of as results finish
+            **kwargs: Passed to remove() (model, response, raw, options)
+
+        Yields:
+            BatchItem per input
+        """
+        inputs = enumerate(images)
+        pending = {}
+        held = {}
+        next_index = 0
+
+        with ThreadPoolExecutor(max_workers=window) as pool:
+            def submit_next():
+                for index, image in inputs:
+                    pending[pool.submit(self.remove, image, **kwargs)] = (index, image)
+                    return True
+                return False
+
+            try:
+                while len(pending) + len(held) < window and submit_next():
+                    pass
+                while pending:
+                    done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        index, image = pending.pop(future)
+                        try:
+                            item = BatchItem(index, image, result=future.result())
+                        except Exception as e:
+                            item = BatchItem(index, image, error=e)
+                        if not ordered:
+                            yield item
+                        else:
+                            held[index] = item
+                            while next_index in held:
+                                yield held.pop(next_index)
+                                next_index += 1
+                    while len(pending) + len(held) < window and submit_next():
+                        pass
+            finally:
+                # Consumer stopped early: drop what has not started
+                for future in pending:
+                    future.cancel()
+
+    def batch_urls(self, urls, ordered=False, **options):
+        """
+        Have the server fetch and process a list of URLs (POST /remove-bg/batch)
+        and yield each result as its line of the streamed response arrives.
+
+        Args:
+            urls: List of image URLs (at most the server's BATCH_MAX_URLS)
+            ordered: Ask the server for input order instead of completion order
+            **options: /remove-bg options applied to every image (model,
+                response, threshold, ...)
+
+        Yields:
+            BatchItem per URL; failed items carry an ApiError with the item's
+            status (they are not retried)
+        """
+        urls = list(urls)
+        body = dict(options, urls=urls, order="input" if ordered else "completed")
+        resp, _ = self._request("POST", "/remove-bg/batch", json=body, stream=True)
+        with resp:
+            self._check(resp)
+            for line in resp.iter_lines():
+                if not line:
+                    continue
+                item = json.loads(line)
+                if "summary" in item:
+                    break
+                index = item["index"]
+                if item["status"] != 200:
+                    yield BatchItem(index, urls[index], error=ApiError(item["status"], item.get("error", ""), item.get("retry_after")))
+                    continue
+                content = base64.b64decode(item["image_b64"]) if "image_b64" in item else None
+                result = Result(content, item.get("headers", {}), seconds=item.get("seconds", 0.0), reference=item.get("result"))
+                yield BatchItem(index, urls[index], result=result)
+
+    def fetch_result(self, reference):
+        """
+        Download a result stored with response="reference".
+
+        Args:
+            reference: The reference dict (or its id)
+
+        Returns:
+            PNG bytes
+        """
+        result_id = reference["id"] if isinstance(reference, dict) else reference
+        resp, _ = self._request("GET", f"/results/{result_id}")
+        self._check(resp)
+        return resp.content
+
+    def health(self):
+        """The server's /health status."""
+        resp, _ = self._request("GET", "/health")
+        self._check(resp)
+        return resp.json()
+
+
+def parse_arguments():
+    """Parse command line arguments"""
+    parser = argparse.ArgumentParser(description="Remove backgrounds from images with a running API server")
+    parser.add_argument("images", nargs="+", help="Image files")
+    parser.add_argument("--url", default=os.environ.get("BG_REMOVAL_URL", "http://localhost:5000"),
+                        help="Server URL (default: BG_REMOVAL_URL or http://localhost:5000)")
+    parser.add_argument("--api-key", default=os.environ.get("BG_REMOVAL_API_KEY"), help="API key (default: BG_REMOVAL_API_KEY)")
+    parser.add_argument("--model", help="Model name (default: server default)")
+    parser.add_argument("--window", type=int, default=8, help="Requests in flight (default: 8)")
+    parser.add_argument("--output-dir", default="output", help="Where to write the PNGs (default: output)")
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    args = parse_arguments()
+    os.makedirs(args.output_dir, exist_ok=True)
+    failed = 0
+    start = time.time()
+    with BgRemovalClient(args.url, api_key=args.api_key, pool_size=args.window) as api:
+        for item in api.map(args.images, window=args.window, model=args.model):
+            if item.ok:
+                path = os.path.join(args.output_dir, os.path.splitext(os.path.basename(item.input))[0] + ".png")
+                item.result.save(path)
+                print(f"{item.input} -> {path} ({item.result.seconds:.2f}s, {item.result.attempts} attempt(s))")
+            else:
+                failed += 1
+                print(f"{item.input}: {item.error}", file=sys.stderr)
+    print(f"Processed {len(args.images) - failed}/{len(args.images)} images in {time.time() - start:.2f}s")
+    sys.exit(1 if failed else 0)
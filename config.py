@@ -1,5 +1,6 @@
 # config.py: Contains common configurations for the project
 
+import os
 import torch
 
 # Configure device for running the model
@@ -13,5 +14,214 @@ else:
 # Model name from Hugging Face
 MODEL_NAME = "ZhengPeng7/BiRefNet"
 
+# Models selectable per request ("model" option): name -> Hugging Face repo.
+# Override with MODELS="name=repo,name=repo"
+MODELS = {
+    "birefnet": MODEL_NAME,
+    "birefnet-lite": "ZhengPeng7/BiRefNet_lite",
+    "birefnet-portrait": "ZhengPeng7/BiRefNet-portrait",
+}
+if os.environ.get("MODELS"):
+    MODELS = dict(item.strip().split("=", 1) for item in os.environ["MODELS"].split(",") if item.strip())
+
+# Model used when a request does not choose one; loaded at startup and never evicted
+DEFAULT_MODEL = os.environ.get("DEFAULT_MODEL", "birefnet")
+
+# Memory for loaded models (weights and buffers, in MB); least recently used
+# models are evicted beyond it. 0 = unbounded
+MODEL_MEMORY_BUDGET_MB = int(os.environ.get("MODEL_MEMORY_BUDGET_MB", 0))
+
+# Directory of local model snapshots (<dir>/<name>), downloaded on first use
+# unless MODEL_OFFLINE is set. Empty = use the Hugging Face cache
+MODEL_SNAPSHOT_DIR = os.environ.get("MODEL_SNAPSHOT_DIR", "")
+MODEL_OFFLINE = os.environ.get("MODEL_OFFLINE", "false").lower() in ("1", "true", "yes")
+
+# Run one forward pass when a model is loaded, so the first request is not slow
+MODEL_WARMUP = os.environ.get("MODEL_WARMUP", "true").lower() in ("1", "true", "yes")
+
+# Use a tiny untrained stand-in instead of BiRefNet (benchmarks and CPU-only
+# machines without the checkpoint; masks are meaningless)
+USE_STUB_MODEL = os.environ.get("USE_STUB_MODEL", "false").lower() in ("1", "true", "yes")
+
 # Input size for model (resize image to 1024x1024 before feeding to model)
-MODEL_INPUT_SIZE = (1024, 1024)
\ No newline at end of file
+MODEL_INPUT_SIZE = (1024, 1024)
+
+# Admission control (per worker process)
+# Maximum number of requests running decode/inference/encode at the same time
+MAX_CONCURRENT_INFERENCES = int(os.environ.get("MAX_CONCURRENT_INFERENCES", 1))
+
+# Maximum number of requests allowed to wait for an inference slot, per priority lane
+MAX_QUEUE_LENGTH = int(os.environ.get("MAX_QUEUE_LENGTH", 8))
+
+# Total megapixels allowed in flight at once (bounds decoded image memory)
+PIXEL_BUDGET_MP = float(os.environ.get("PIXEL_BUDGET_MP", 64))
+
+# Maximum number of waiting requests from a single client across all lanes
+MAX_QUEUED_PER_CLIENT = int(os.environ.get("MAX_QUEUED_PER_CLIENT", 4))
+
+# Seconds a queued request waits for a slot before it is rejected with 503
+QUEUE_TIMEOUT = float(os.environ.get("QUEUE_TIMEOUT", 30))
+
+# Reject inputs larger than this many megapixels before decoding them
+MAX_INPUT_MEGAPIXELS = float(os.environ.get("MAX_INPUT_MEGAPIXELS", 50))
+
+# Priority lanes: (name, largest input in megapixels or None, weight), defined
+# in utils/priority_lanes.py so gunicorn.conf.py can size threads from them
+from utils.priority_lanes import PRIORITY_LANES
+
+# Per-client rate limiting (token buckets measured in input megapixels)
+RATE_LIMIT_ENABLED = os.environ.get("RATE_LIMIT_ENABLED", "true").lower() in ("1", "true", "yes")
+
+# Sustained megapixels per second allowed for each client
+RATE_LIMIT_MP_PER_SECOND = float(os.environ.get("RATE_LIMIT_MP_PER_SECOND", 10))
+
+# Bucket size: megapixels a client may send in a burst
+RATE_LIMIT_BURST_MP = float(os.environ.get("RATE_LIMIT_BURST_MP", 100))
+
+# Minimum cost of a request, so tiny images are not free
+RATE_LIMIT_MIN_COST_MP = float(os.environ.get("RATE_LIMIT_MIN_COST_MP", 0.25))
+
+# Optional SQLite file to share buckets between worker processes (empty = in-process only)
+RATE_LIMIT_SQLITE_PATH = os.environ.get("RATE_LIMIT_SQLITE_PATH", "")
+
+# Per-client usage kept by each worker for /metrics: clients tracked (the
+# least used is dropped when a new one arrives) and how many are reported
+RATE_LIMIT_TRACKED_CLIENTS = int(os.environ.get("RATE_LIMIT_TRACKED_CLIENTS", 1000))
+RATE_LIMIT_TOP_CLIENTS = int(os.environ.get("RATE_LIMIT_TOP_CLIENTS", 20))
+
+# Comma separated IPs or networks of proxies (e.g. router.py) whose
+# X-Forwarded-For header names the real client; empty trusts no proxy
+TRUSTED_PROXIES = os.environ.get("TRUSTED_PROXIES", "")
+
+# Perceptual-hash mask reuse for near-duplicate inputs (resized, re-compressed, re-tagged)
+# Number of masks kept in the index (0 disables reuse)
+PHASH_CACHE_ENTRIES = int(os.environ.get("PHASH_CACHE_ENTRIES", 512))
+
+# Maximum Hamming distance (out of 64 bits) for two images to count as duplicates
+PHASH_MAX_DISTANCE = int(os.environ.get("PHASH_MAX_DISTANCE", 4))
+
+# Side length of the stored low-resolution masks
+PHASH_MASK_SIZE = int(os.environ.get("PHASH_MASK_SIZE", 512))
+
+# Fast paths that skip the model for trivial inputs (existing alpha, blank, uniform background)
+FAST_PATHS_ENABLED = os.environ.get("FAST_PATHS_ENABLED", "true").lower() in ("1", "true", "yes")
+
+# Colour distance to the background below which a pixel is keyed out (0-441)
+COLOR_KEY_TOLERANCE = float(os.environ.get("COLOR_KEY_TOLERANCE", 12))
+
+# Gaussian feather radius (pixels at key resolution) applied to colour-key masks
+FAST_PATH_FEATHER_RADIUS = float(os.environ.get("FAST_PATH_FEATHER_RADIUS", 1.0))
+
+# Opt-in per-request profiling (X-Profile: 1 header or ?profile=1), admin only.
+# Requests must send this token in X-Admin-Token; empty disables profiling.
+PROFILING_ADMIN_TOKEN = os.environ.get("PROFILING_ADMIN_TOKEN", "")
+
+# Directory for profiling traces, and how many profiled requests to keep
+PROFILE_TRACE_DIR = os.environ.get("PROFILE_TRACE_DIR", "traces")
+PROFILE_MAX_TRACES = int(os.environ.get("PROFILE_MAX_TRACES", 50))
+
+# Gracefully restart a gunicorn worker once its RSS stays above this many MB
+# after a request (0 disables). In-flight requests finish first.
+WORKER_MAX_RSS_MB = int(os.environ.get("WORKER_MAX_RSS_MB", 0))
+
+# Seconds between RSS samples while requests are running
+MEMORY_SAMPLE_INTERVAL = float(os.environ.get("MEMORY_SAMPLE_INTERVAL", 0.05))
+
+# Return freed heap to the OS after requests that grew RSS by this many MB
+MALLOC_TRIM_THRESHOLD_MB = int(os.environ.get("MALLOC_TRIM_THRESHOLD_MB", 256))
+
+# CPU threading per worker process (0 = torch default, i.e. one intra-op
+# thread per core, which oversubscribes the CPU with several workers)
+TORCH_INTRA_OP_THREADS = int(os.environ.get("TORCH_INTRA_OP_THREADS", 0))
+TORCH_INTER_OP_THREADS = int(os.environ.get("TORCH_INTER_OP_THREADS", 0))
+
+# Worker CPU affinity: "" (none), "auto" (split the available cores evenly
+# between workers) or an explicit core list such as "0-15,32-47" to split
+CPU_AFFINITY = os.environ.get("CPU_AFFINITY", "")
+
+# Number of gunicorn worker processes (gunicorn's own variable)
+WEB_CONCURRENCY = int(os.environ.get("WEB_CONCURRENCY", 1))
+
+# gthread threads per gunicorn worker (read by gunicorn.conf.py); 0 = enough for
+# every running and queued request (MAX_CONCURRENT_INFERENCES + lane queues)
+GUNICORN_THREADS = int(os.environ.get("GUNICORN_THREADS", 0))
+
+# ASGI app (asgi.py): threads running admission + inference; 0 = enough for
+# every running and queued request (MAX_CONCURRENT_INFERENCES + lane queues)
+ASGI_INFERENCE_THREADS = int(os.environ.get("ASGI_INFERENCE_THREADS", 0))
+
+# Requests waiting for or holding an inference thread before new ones get 503 (0 = 2x threads)
+ASGI_MAX_PENDING = int(os.environ.get("ASGI_MAX_PENDING", 0))
+
+# Largest non-file form field (e.g. image_file_b64) accepted by the ASGI app, in MB
+ASGI_MAX_FIELD_MB = float(os.environ.get("ASGI_MAX_FIELD_MB", 100))
+
+# Largest request body (raw upload or whole form) and largest image_url download,
+# in MB; larger ones get 413 before they are buffered. Applies to both apps
+MAX_UPLOAD_MB = float(os.environ.get("MAX_UPLOAD_MB", 100))
+
+# Timeout for fetching image_url, in seconds
+URL_FETCH_TIMEOUT = float(os.environ.get("URL_FETCH_TIMEOUT", 30))
+
+# Batch URL endpoint (POST /remove-bg/batch): most URLs accepted per request
+BATCH_MAX_URLS = int(os.environ.get("BATCH_MAX_URLS", 100))
+
+# Concurrent URL fetches per batch request
+BATCH_FETCH_WORKERS = int(os.environ.get("BATCH_FETCH_WORKERS", 8))
+
+# Images fetched or being fetched ahead of inference, per batch request (bounds memory)
+BATCH_PREFETCH = int(os.environ.get("BATCH_PREFETCH", 16))
+
+# Items of one batch running or queued for inference at once (0 = MAX_CONCURRENT_INFERENCES)
+BATCH_INFERENCE_WORKERS = int(os.environ.get("BATCH_INFERENCE_WORKERS", 0))
+
+# Batch requests running at once per worker; each starts its own fetch pool and
+# inference threads, so more get 503 with Retry-After (0 = unlimited)
+BATCH_MAX_CONCURRENT = int(os.environ.get("BATCH_MAX_CONCURRENT", 4))
+
+# Sequence mode (POST /remove-bg/sequence): most frames and total input megapixels per request
+SEQUENCE_MAX_FRAMES = int(os.environ.get("SEQUENCE_MAX_FRAMES", 300))
+SEQUENCE_MAX_MEGAPIXELS = float(os.environ.get("SEQUENCE_MAX_MEGAPIXELS", 200))
+
+# Uncompressed size limits for archive members, per frame and in total (MB);
+# checked from the archive index before anything is decompressed
+SEQUENCE_MAX_FRAME_MB = float(os.environ.get("SEQUENCE_MAX_FRAME_MB", 64))
+SEQUENCE_MAX_ARCHIVE_MB = float(os.environ.get("SEQUENCE_MAX_ARCHIVE_MB", 512))
+
+# Fraction of the rate-limit cost charged per frame for decoding a sequence
+# (keyframes are charged in full on top)
+SEQUENCE_DECODE_COST = float(os.environ.get("SEQUENCE_DECODE_COST", 0.1))
+
+# Fraction of the frame (0-1) that may change since the last keyframe, after
+# motion compensation, before a frame gets its own model pass
+SEQUENCE_DIFF_THRESHOLD = float(os.environ.get("SEQUENCE_DIFF_THRESHOLD", 0.01))
+
+# Run the model at least every N frames even on static footage (0 = only on changes)
+SEQUENCE_KEYFRAME_INTERVAL = int(os.environ.get("SEQUENCE_KEYFRAME_INTERVAL", 12))
+
+# Keyframes per model batch
+SEQUENCE_BATCH_SIZE = int(os.environ.get("SEQUENCE_BATCH_SIZE", 4))
+
+# Outputs of at least this many megapixels are PNG-encoded while they are sent
+# (chunked) instead of into a buffer first (0 = never; "stream" option overrides)
+STREAM_OUTPUT_MIN_MEGAPIXELS = float(os.environ.get("STREAM_OUTPUT_MIN_MEGAPIXELS", 8))
+
+# Compressed bytes per streamed chunk, in KB; smaller chunks reach the client
+# sooner, larger ones cost fewer writes
+STREAM_CHUNK_KB = int(os.environ.get("STREAM_CHUNK_KB", 64))
+
+# Result store for response=reference: directory of content-addressed PNGs
+# ("" disables the mode) and seconds a result is kept after it was last stored
+RESULT_STORE_DIR = os.environ.get("RESULT_STORE_DIR", "results")
+RESULT_TTL_SECONDS = float(os.environ.get("RESULT_TTL_SECONDS", 3600))
+
+# Source cache for repeated requests on the same input (e.g. an editor trying
+# refinement options): decoded image and mask kept per source bytes and model,
+# so only refinement and encoding are redone. Memory budget in MB (0 disables)
+# and seconds an entry is kept after its last use
+SOURCE_CACHE_MB = int(os.environ.get("SOURCE_CACHE_MB", 512))
+SOURCE_CACHE_TTL_SECONDS = float(os.environ.get("SOURCE_CACHE_TTL_SECONDS", 300))
+
+# Fraction of the rate-limit cost charged for a source cache hit, which needs
+# pixel budget but no inference slot
+SOURCE_CACHE_HIT_COST = float(os.environ.get("SOURCE_CACHE_HIT_COST", 0.1))
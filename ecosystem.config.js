@@ -2,14 +2,17 @@ module.exports = {
   apps: [{
     name: 'bg-removal',
     script: 'gunicorn',
-    args: '--bind 0.0.0.0:5000 --log-level=info --access-logfile=./logs/gunicorn_access.log --error-logfile=./logs/gunicorn_error.log app:app',
+    args: '-c gunicorn.conf.py --bind 0.0.0.0:5000 --graceful-timeout 120 --log-level=info --access-logfile=./logs/gunicorn_access.log --error-logfile=./logs/gunicorn_error.log app:app',
     interpreter: './venv/bin/python3',
     cwd: __dirname,
     env: {
       FLASK_ENV: 'production',
       LOG_LEVEL: 'INFO',
       HOST: '0.0.0.0',
-      PORT: '5000'
+      PORT: '5000',
+      WORKER_MAX_RSS_MB: '6144',
+      CPU_AFFINITY: 'auto',
+      TORCH_INTER_OP_THREADS: '1'
     },
     out_file: './logs/out.log',
     error_file: './logs/error.log',
@@ -0,0 +1,37 @@
+# gunicorn.conf.py: Worker topology hooks (gunicorn -c gunicorn.conf.py app:app)
+#
+# Each worker gets a stable slot (0..workers-1), reused by its replacement
+# when a worker is recycled, so CPU_AFFINITY=auto gives every worker its own
+# slice of the cores. Thread counts come from TORCH_INTRA_OP_THREADS and
+# TORCH_INTER_OP_THREADS (see config.py).
+#
+# Settings are read from the environment here rather than by importing
+# config.py, which imports torch and probes CUDA in the arbiter before fork.
+# The lanes come from utils/priority_lanes.py, which config.py re-exports.
+import os
+
+from utils.priority_lanes import PRIORITY_LANES
+
+workers = int(os.environ.get("WEB_CONCURRENCY", 1))
+
+# Every request holds a gthread thread while it waits for admission, so a
+# worker needs one per inference slot plus one per queue place; with fewer,
+# requests wait unseen in gunicorn's backlog and the lane queues never fill
+worker_class = "gthread"
+threads = int(os.environ.get("GUNICORN_THREADS", 0)) or (
+    int(os.environ.get("MAX_CONCURRENT_INFERENCES", 1))
+    + int(os.environ.get("MAX_QUEUE_LENGTH", 8)) * len(PRIORITY_LANES)
+)
+
+
+def pre_fork(server, worker):
+    # Runs in the arbiter: pick the lowest slot not held by a live worker
+    used = {getattr(w, "cpu_slot", None) for w in server.WORKERS.values()}
+    worker.cpu_slot = next(slot for slot in range(len(server.WORKERS) + 1) if slot not in used)
+
+
+def post_fork(server, worker):
+    # Runs in the new worker before the app (and model) is loaded
+    from utils.cpu_topology import configure_worker
+    applied = configure_worker(slot=worker.cpu_slot % server.num_workers, workers=server.num_workers)
+    server.log.info(f"Worker {worker.pid} topology: {applied}")
@@ -0,0 +1,295 @@
+#!/usr/bin/env python
+"""
+Concurrent load generator for the background removal API.
+
+Sends /remove-bg requests from a pool of worker threads for a fixed
+duration, using a weighted mix of input methods (file upload, base64 and
+URL) and image sizes generated from test_images/. URL inputs are served by
+a local HTTP stub so the test does not depend on external hosts.
+
+Every request carries a unique source (a JPEG comment with a random nonce,
+so the pixels are unchanged) and reuse_mask=false, so the server's source
+cache and near-duplicate mask reuse never skip the model and the numbers
+measure inference. --allow-cache replays identical payloads with the
+server's default options instead.
+
+Reports throughput, latency percentiles and error rates as JSON, overall
+and per input method / image size.
+
+Usage:
+    python load_test.py [--host localhost] [--port 5000] [--concurrency 8] [--duration 60]
+                        [--mix file=1,b64=1,url=1] [--sizes 256,1024,2048] [--allow-cache]
+                        [--output report.json]
+"""
+
+import argparse
+import base64
+import io
+import json
+import os
+import random
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlsplit, parse_qs
+
+import requests
+from PIL import Image
+
+from utils.metrics import percentile
+
+INPUT_METHODS = ("file", "b64", "url")
+
+
+def load_payloads(input_dir, sizes):
+    """
+    Build in-memory JPEG payloads for every test image at every size.
+
+    Returns:
+        List of dicts with name, size label, pixel count and JPEG bytes
+    """
+    payloads = []
+    image_files = sorted(
+        f for f in os.listdir(input_dir)
+        if f.lower().endswith((".png", ".jpg", ".jpeg")) and not f.startswith(".")
+    )
+    for image_file in image_files:
+        image = Image.open(os.path.join(input_dir, image_file)).convert("RGB")
+        for size in sizes:
+            scale = size / max(image.size)
+            resized = image.resize((max(1, round(image.width * scale)), max(1, round(image.height * scale))), Image.LANCZOS)
+            buf = io.BytesIO()
+            resized.save(buf, format="JPEG", quality=90)
+            payloads.append({
+                "name": f"{os.path.splitext(image_file)[0]}_{size}.jpg",
+                "size": size,
+                "pixels": resized.width * resized.height,
+                "data": buf.getvalue(),
+            })
+    return payloads
+
+
+def unique_bytes(data, nonce):
+    """
+    JPEG bytes with a comment segment holding nonce, right after the SOI
+    marker: a new source to the server, with identical pixels.
+    """
+    comment = nonce.encode("ascii")
+    return data[:2] + b"\xff\xfe" + (len(comment) + 2).to_bytes(2, "big") + comment + data[2:]
+
+
+class StubServer:
+    """
+    Local HTTP server serving payloads by name for image_url requests.
+
+    A ?nonce= query serves the payload made unique with unique_bytes().
+    """
+
+    def __init__(self, payloads, host="127.0.0.1"):
+        files = {p["name"]: p["data"] for p in payloads}
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                path = urlsplit(self.path)
+                data = files.get(path.path.lstrip("/"))
+                if data is None:
+                    self.send_error(404)
+                    return
+                nonce = parse_qs(path.query).get("nonce")
+                if nonce:
+                    data = unique_bytes(data, nonce[0])
+                self.send_response(200)
+                self.send_header("Content-Type", "image/jpeg")
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def log_message(self, format, *args):
+                pass
+
+        self.server = ThreadingHTTPServer((host, 0), Handler)
+        self.server.daemon_threads = True
+        self.base_url = f"http://{host}:{self.server.server_address[1]}"
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+
+    def __enter__(self):
+        self.thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def url_for(self, payload, nonce=None):
+        url = f"{self.base_url}/{payload['name']}"
+        return f"{url}?nonce={nonce}" if nonce else url
+
+
+def send_request(session, url, method, payload, stub, timeout, nonce=None):
+    """
+    Send one /remove-bg request and return the response.
+
+    With a nonce the source is made unique and sent with reuse_mask=false,
+    so the server runs the model; without one it is sent as is.
+    """
+    data = payload["data"] if nonce is None else unique_bytes(payload["data"], nonce)
+    options = {} if nonce is None else {"reuse_mask": "false"}
+    if method == "file":
+        files = {"image_file": (payload["name"], data, "image/jpeg")}
+        return session.post(url, files=files, data=options, timeout=timeout)
+    if method == "b64":
+        form = dict(options, image_file_b64=base64.b64encode(data).decode("utf-8"))
+        return session.post(url, data=form, timeout=timeout)
+    return session.post(url, data=dict(options, image_url=stub.url_for(payload, nonce)), timeout=timeout)
+
+
+def worker(url, mix, payloads, stub, deadline, timeout, results, lock, seed, allow_cache=False):
+    rng = random.Random(seed)
+    methods, weights = zip(*mix.items())
+    session = requests.Session()
+    while time.time() < deadline:
+        method = rng.choices(methods, weights)[0]
+        payload = rng.choice(payloads)
+        nonce = None if allow_cache else f"{rng.getrandbits(64):016x}"
+        start = time.perf_counter()
+        try:
+            response = send_request(session, url, method, payload, stub, timeout, nonce)
+            status = response.status_code
+            error = None if status == 200 else response.text[:200]
+        except requests.RequestException as e:
+            status, error = None, str(e)
+        latency = time.perf_counter() - start
+        with lock:
+            results.append({
+                "method": method,
+                "size": payload["size"],
+                "status": status,
+                "latency": latency,
+                "error": error,
+            })
+
+
+def summarize(results, elapsed):
+    """Throughput, latency percentiles and error rates for a list of results."""
+    ok = sorted(r["latency"] for r in results if r["status"] == 200)
+    statuses = {}
+    for r in results:
+        key = str(r["status"]) if r["status"] is not None else "connection_error"
+        statuses[key] = statuses.get(key, 0) + 1
+    total = len(results)
+    return {
+        "requests": total,
+        "successful": len(ok),
+        "error_rate": round((total - len(ok)) / total, 4) if total else None,
+        "throughput_rps": round(len(ok) / elapsed, 3) if elapsed > 0 else None,
+        "latency_p50": round(percentile(ok, 50), 4) if ok else None,
+        "latency_p95": round(percentile(ok, 95), 4) if ok else None,
+        "latency_p99": round(percentile(ok, 99), 4) if ok else None,
+        "latency_max": round(ok[-1], 4) if ok else None,
+        "status_codes": statuses,
+    }
+
+
+def build_report(results, elapsed, args, mix, sizes):
+    report = {
+        "config": {
+            "target": f"http://{args.host}:{args.port}/remove-bg",
+            "concurrency": args.concurrency,
+            "duration": args.duration,
+            "mix": mix,
+            "sizes": sizes,
+            "allow_cache": args.allow_cache,
+        },
+        "elapsed_seconds": round(elapsed, 3),
+        "overall": summarize(results, elapsed),
+        "by_method": {},
+        "by_size": {},
+    }
+    for method in mix:
+        subset = [r for r in results if r["method"] == method]
+        if subset:
+            report["by_method"][method] = summarize(subset, elapsed)
+    for size in sizes:
+        subset = [r for r in results if r["size"] == size]
+        if subset:
+            report["by_size"][str(size)] = summarize(subset, elapsed)
+    errors = [r["error"] for r in results if r["error"]]
+    report["sample_errors"] = errors[:5]
+    return report
+
+
+def parse_mix(value):
+    """Parse 'file=2,b64=1,url=1' into a weight dict."""
+    mix = {}
+    for part in value.split(","):
+        method, _, weight = part.partition("=")
+        method = method.strip()
+        if method not in INPUT_METHODS:
+            raise argparse.ArgumentTypeError(f"Unknown input method '{method}', expected one of {INPUT_METHODS}")
+        mix[method] = float(weight or 1)
+    return mix
+
+
+def parse_arguments():
+    """Parse command line arguments"""
+    parser = argparse.ArgumentParser(description="Load test the background removal API")
+    parser.add_argument("--host", default="localhost", help="API host (default: localhost)")
+    parser.add_argument("--port", default=5000, type=int, help="API port (default: 5000)")
+    parser.add_argument("--concurrency", default=8, type=int, help="Concurrent clients (default: 8)")
+    parser.add_argument("--duration", default=60, type=float, help="Test duration in seconds (default: 60)")
+    parser.add_argument("--mix", default="file=1,b64=1,url=1", type=parse_mix,
+                        help="Weighted input methods (default: file=1,b64=1,url=1)")
+    parser.add_argument("--sizes", default="256,1024,2048",
+                        help="Longest image side(s) to test, comma separated (default: 256,1024,2048)")
+    parser.add_argument("--input-dir", default="test_images", help="Source images (default: test_images)")
+    parser.add_argument("--timeout", default=120, type=float, help="Per-request timeout in seconds (default: 120)")
+    parser.add_argument("--seed", default=0, type=int, help="Random seed for the request mix (default: 0)")
+    parser.add_argument("--allow-cache", action="store_true",
+                        help="Replay identical payloads with default options, so cache hits that skip the model count too")
+    parser.add_argument("--output", help="Write the JSON report to this file as well as stdout")
+    return parser.parse_args()
+
+
+def main():
+    args = parse_arguments()
+    sizes = [int(s) for s in args.sizes.split(",")]
+    payloads = load_payloads(args.input_dir, sizes)
+    if not payloads:
+        print(f"Error: No images found in '{args.input_dir}'", file=sys.stderr)
+        return 1
+
+    url = f"http://{args.host}:{args.port}/remove-bg"
+    results = []
+    lock = threading.Lock()
+
+    with StubServer(payloads) as stub:
+        print(f"Load testing {url} with {args.concurrency} clients for {args.duration}s "
+              f"(URL inputs served from {stub.base_url})", file=sys.stderr)
+        start = time.time()
+        deadline = start + args.duration
+        threads = [
+            threading.Thread(
+                target=worker,
+                args=(url, args.mix, payloads, stub, deadline, args.timeout, results, lock, args.seed + i,
+                      args.allow_cache),
+            )
+            for i in range(args.concurrency)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.time() - start
+
+    report = build_report(results, elapsed, args, args.mix, sizes)
+    output = json.dumps(report, indent=2)
+    print(output)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(output)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,53 +1,167 @@
+import time
 import torch
 from PIL import Image
 from torchvision import transforms
-from models.birefnet_model import birefnet_model
+from models.model_registry import model_registry
+from models.mask_cache import phash_index
+from models.fast_paths import classify
+from models.mask_refinement import refine_mask
+from utils.metrics import metrics
+from utils.phash import phash
 from config import DEVICE, MODEL_INPUT_SIZE
 
-def remove(image):
+# Transform image for the model
+transform_image = transforms.Compose([
+    transforms.Resize(MODEL_INPUT_SIZE),
+    transforms.ToTensor(),
+    transforms.Normalize([0.485, 0.456, 0.406],
+                        [0.229, 0.224, 0.225])
+])
+
+def predict_mask_batch(input_tensors, model_name=None):
+    """
+    Run BiRefNet on a batch of preprocessed images
+
+    Args:
+        input_tensors: Tensor of shape (n, 3, H, W) from transform_image
+        model_name: Registry name of the model to use, None for the default
+
+    Returns:
+        Float tensor of shape (n, H, W) on the CPU with values in [0, 1]
+    """
+    model_name = model_registry.resolve(model_name)
+    model = model_registry.get(model_name)
+    input_tensors = input_tensors.to(DEVICE)
+    if DEVICE.type == "cuda":
+        input_tensors = input_tensors.half()
+
+    # Run model
+    start = time.time()
+    with torch.no_grad():
+        preds = model(input_tensors)[-1].sigmoid().cpu()
+    metrics.observe("model_inference_seconds", time.time() - start, model=model_name)
+    metrics.inc("model_images_total", len(input_tensors), model=model_name)
+    return preds[:, 0].float()
+
+def predict_masks(images, model_name=None):
+    """
+    Run BiRefNet on several RGB images in one batch
+
+    Args:
+        images: List of PIL Images in RGB mode
+        model_name: Registry name of the model to use, None for the default
+
+    Returns:
+        List of PIL Images (mode "L") masks at model resolution
+    """
+    # Prepare input tensor
+    input_tensors = torch.stack([transform_image(image) for image in images])
+    to_pil = transforms.ToPILImage()
+    return [to_pil(mask_tensor) for mask_tensor in predict_mask_batch(input_tensors, model_name)]
+
+def predict_mask(image, model_name=None):
+    """
+    Run BiRefNet on an RGB image
+
+    Args:
+        image: PIL Image in RGB mode
+        model_name: Registry name of the model to use, None for the default
+
+    Returns:
+        PIL Image (mode "L") mask at model resolution
+    """
+    return predict_masks([image], model_name)[0]
+
+def get_mask(image, reuse_mask=True, fast_path=False, model_name=None):
+    """
+    Get the foreground mask for an image, skipping the model when possible
+
+    Args:
+        image: PIL Image in RGB or RGBA mode
+        reuse_mask: Whether to look up and store masks in the perceptual-hash index
+        fast_path: Whether to answer trivial inputs (existing alpha, blank,
+            uniform background) without the model
+        model_name: Registry name of the model to use, None for the default
+
+    Returns:
+        Tuple of (PIL "L" mask at any resolution, source) where source is
+        "model", "phash_cache" or the fast path kind
+    """
+    mask_image, source = _get_mask(image, reuse_mask, fast_path, model_registry.resolve(model_name))
+    metrics.inc("mask_source_total", source=source)
+    return mask_image, source
+
+def _get_mask(image, reuse_mask, fast_path, model_name):
+    if fast_path:
+        result = classify(image)
+        if result is not None:
+            return result.mask, result.kind
+
+    if image.mode != "RGB":
+        image = image.convert("RGB")
+
+    if not reuse_mask or phash_index is None:
+        return predict_mask(image, model_name), "model"
+
+    # Masks are only reused between requests for the same model
+    image_hash = phash(image)
+    hit = phash_index.lookup(image, image_hash, model=model_name)
+    if hit is not None:
+        mask_image, _ = hit
+        return mask_image, "phash_cache"
+
+    mask_image = predict_mask(image, model_name)
+    phash_index.add(image, mask_image, image_hash, model=model_name)
+    return mask_image, "model"
+
+def apply_mask(image, mask_image, in_place=False):
+    """
+    Upsample a mask to the image size and use it as the alpha channel
+
+    Args:
+        image: PIL Image in RGB or RGBA mode (an existing alpha is replaced)
+        mask_image: PIL Image (mode "L") at any resolution
+        in_place: Add the alpha to image itself instead of a copy, saving a
+            full-size copy when the caller no longer needs the input
+
+    Returns:
+        PIL Image in RGBA mode
+    """
+    mask_image = mask_image.resize(image.size, Image.LANCZOS)
+
+    # Create result image with alpha channel
+    output_image = image if in_place else image.copy()
+    output_image.putalpha(mask_image)
+
+    return output_image
+
+def remove(image, reuse_mask=True, fast_path=False, refinement=None, model_name=None):
     """
     Remove background from an image using the BiRefNet model
-    
+
     Args:
         image: PIL Image or path to image file
-        
+        reuse_mask: Whether near-duplicate images may reuse a cached mask
+        fast_path: Whether trivial inputs may skip the model (keeps RGBA input)
+        refinement: RefinementOptions applied to the mask before upsampling
+        model_name: Registry name of the model to use, None for the default
+
     Returns:
         PIL Image with transparent background
     """
     # If image is a file path, open it
+    caller_image = image
     if isinstance(image, str):
-        image = Image.open(image).convert("RGB")
-    
-    # Make sure image is in RGB mode
-    if image.mode != "RGB":
+        image = Image.open(image)
+
+    # Make sure image is in RGB mode (or RGBA when a fast path may use its alpha)
+    if fast_path and "A" in image.getbands():
+        if image.mode != "RGBA":
+            image = image.convert("RGBA")
+    elif image.mode != "RGB":
         image = image.convert("RGB")
-    
-    # Save original size for later
-    orig_size = image.size
-    
-    # Transform image for the model
-    transform_image = transforms.Compose([
-        transforms.Resize(MODEL_INPUT_SIZE),
-        transforms.ToTensor(),
-        transforms.Normalize([0.485, 0.456, 0.406],
-                            [0.229, 0.224, 0.225])
-    ])
-    
-    # Prepare input tensor
-    input_tensor = transform_image(image).unsqueeze(0).to(DEVICE)
-    if DEVICE.type == "cuda":
-        input_tensor = input_tensor.half()
-    
-    # Run model
-    to_pil = transforms.ToPILImage()
-    with torch.no_grad():
-        preds = birefnet_model(input_tensor)[-1].sigmoid().cpu()
-    mask_tensor = preds[0].squeeze(0)
-    mask_image = to_pil(mask_tensor)
-    mask_image = mask_image.resize(orig_size, Image.LANCZOS)
-    
-    # Create result image with alpha channel
-    output_image = image.copy()
-    output_image.putalpha(mask_image)
-    
-    return output_image 
\ No newline at end of file
+
+    mask_image, _ = get_mask(image, reuse_mask=reuse_mask, fast_path=fast_path, model_name=model_name)
+    mask_image = refine_mask(image, mask_image, refinement)
+    # The caller's own image is left untouched; converted copies are reused
+    return apply_mask(image, mask_image, in_place=image is not caller_image)
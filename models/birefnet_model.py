@@ -1,16 +1,73 @@
-# model/birefnet_model.py: Load BiRefNet model via transformers
+# model/birefnet_model.py: Load BiRefNet models via transformers
 
-from transformers import AutoModelForImageSegmentation
-from config import MODEL_NAME, DEVICE
+import os
+from config import MODEL_NAME, DEVICE, USE_STUB_MODEL
+from utils.cpu_topology import ensure_configured
 import torch
 
-def load_birefnet_model():
-    model = AutoModelForImageSegmentation.from_pretrained(MODEL_NAME, trust_remote_code=True)
+class StubBiRefNet(torch.nn.Module):
+    """
+    Tiny stand-in with BiRefNet's call interface (returns a list of logit maps,
+    the last one being the final prediction). Used for benchmarks and local
+    runs on machines without the checkpoint; its masks are meaningless.
+    """
+
+    def __init__(self):
+        super().__init__()
+        torch.manual_seed(0)
+        self.encoder = torch.nn.Sequential(
+            torch.nn.Conv2d(3, 16, 3, stride=2, padding=1),
+            torch.nn.ReLU(),
+            torch.nn.Conv2d(16, 32, 3, stride=2, padding=1),
+            torch.nn.ReLU(),
+        )
+        self.head = torch.nn.Conv2d(32, 1, 1)
+
+    def forward(self, x):
+        logits = self.head(self.encoder(x))
+        return [torch.nn.functional.interpolate(logits, size=x.shape[-2:], mode="bilinear", align_corners=False)]
+
+def ensure_snapshot(repo_id, local_dir, offline=False):
+    """
+    Make sure a local snapshot of a Hugging Face repo exists
+
+    Args:
+        repo_id: Hugging Face repo, e.g. "ZhengPeng7/BiRefNet"
+        local_dir: Directory holding (or receiving) the snapshot
+        offline: Fail instead of downloading a missing snapshot
+
+    Returns:
+        local_dir
+    """
+    if os.path.isfile(os.path.join(local_dir, "config.json")):
+        return local_dir
+    if offline:
+        raise FileNotFoundError(f"No local snapshot of {repo_id} in {local_dir} (MODEL_OFFLINE is set)")
+    from huggingface_hub import snapshot_download
+    snapshot_download(repo_id, local_dir=local_dir)
+    return local_dir
+
+def load_birefnet_model(repo_id=MODEL_NAME, local_dir=None, half=None):
+    """
+    Load a BiRefNet checkpoint onto DEVICE in eval mode
+
+    Args:
+        repo_id: Hugging Face repo to load
+        local_dir: Local snapshot directory to load from instead of the hub cache
+        half: Convert to fp16 (default: on CUDA)
+    """
+    # Thread pools and affinity must be set before the model first runs
+    ensure_configured()
+    if USE_STUB_MODEL:
+        model = StubBiRefNet()
+    else:
+        from transformers import AutoModelForImageSegmentation
+        if local_dir:
+            model = AutoModelForImageSegmentation.from_pretrained(local_dir, trust_remote_code=True, local_files_only=True)
+        else:
+            model = AutoModelForImageSegmentation.from_pretrained(repo_id, trust_remote_code=True)
     model.to(DEVICE)
     model.eval()
-    if DEVICE.type == "cuda":
+    if half if half is not None else DEVICE.type == "cuda":
         model.half()
     return model
-
-# Initialize model once and use it throughout the project
-birefnet_model = load_birefnet_model()
\ No newline at end of file
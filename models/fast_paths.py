@@ -0,0 +1,130 @@
+# models/fast_paths.py: Cheap pre-classifier for inputs that do not need the model
+import numpy as np
+from PIL import Image, ImageFilter
+
+from config import COLOR_KEY_TOLERANCE, FAST_PATH_FEATHER_RADIUS
+
+# Existing alpha is used when at least this fraction of pixels is transparent
+# and at least this fraction is opaque
+MIN_ALPHA_FRACTION = 0.01
+
+# Images whose per-channel standard deviation is below this are blank
+BLANK_STD = 2.0
+
+# Border width, as a fraction of the shorter side, sampled for the background colour
+BORDER_FRACTION = 0.02
+
+# Colour-key mask is computed at most at this resolution and upsampled afterwards
+KEY_MAX_SIDE = 1024
+
+# Reject the colour key when more than this fraction of pixels is neither
+# clearly background nor clearly foreground
+MAX_AMBIGUOUS_FRACTION = 0.03
+
+# Reject the colour key when almost nothing differs from the background
+MIN_FOREGROUND_FRACTION = 0.005
+
+# Reject the colour key when more than this fraction of the border is
+# foreground: a studio shot's subject does not run through the frame edge
+MAX_BORDER_FOREGROUND_FRACTION = 0.002
+
+# Classification runs on a thumbnail of this size
+THUMBNAIL_SIZE = (256, 256)
+
+
+class FastPathResult:
+    """
+    Mask produced without running the model.
+
+    Attributes:
+        kind: "existing_alpha", "blank" or "uniform_background"
+        mask: PIL Image (mode "L") at any resolution
+    """
+
+    def __init__(self, kind, mask):
+        self.kind = kind
+        self.mask = mask
+
+
+def _existing_alpha(image):
+    alpha = image.getchannel("A")
+    thumb = np.asarray(alpha.resize(THUMBNAIL_SIZE, Image.NEAREST))
+    transparent = (thumb < 128).mean()
+    if transparent >= MIN_ALPHA_FRACTION and (1.0 - transparent) >= MIN_ALPHA_FRACTION:
+        return FastPathResult("existing_alpha", alpha)
+    return None
+
+
+def _border_pixels(pixels):
+    """Pixels in a band along the frame edge, for (h, w) or (h, w, c) arrays."""
+    height, width = pixels.shape[:2]
+    band = max(1, int(min(height, width) * BORDER_FRACTION))
+    channels = pixels.shape[2:]
+    return np.concatenate([
+        pixels[:band].reshape(-1, *channels),
+        pixels[-band:].reshape(-1, *channels),
+        pixels[:, :band].reshape(-1, *channels),
+        pixels[:, -band:].reshape(-1, *channels),
+    ])
+
+
+def _color_key(image, background, tolerance, feather_radius):
+    work = image
+    if max(image.size) > KEY_MAX_SIDE:
+        work = image.copy()
+        work.thumbnail((KEY_MAX_SIDE, KEY_MAX_SIDE), Image.BILINEAR)
+    pixels = np.asarray(work, dtype=np.float32)
+
+    # Distance to the background colour, ramped between tolerance and 3x tolerance
+    distance = np.sqrt(((pixels - background) ** 2).sum(axis=2))
+    mask = np.clip((distance - tolerance) / (2.0 * tolerance), 0.0, 1.0)
+
+    ambiguous = ((mask > 0.05) & (mask < 0.95)).mean()
+    foreground = (mask >= 0.5).mean()
+    if ambiguous > MAX_AMBIGUOUS_FRACTION or foreground < MIN_FOREGROUND_FRACTION:
+        return None
+    border_foreground = (_border_pixels(mask) >= 0.5).mean()
+    if border_foreground > MAX_BORDER_FOREGROUND_FRACTION:
+        return None
+
+    mask_image = Image.fromarray((mask * 255).astype(np.uint8))
+    if feather_radius > 0:
+        mask_image = mask_image.filter(ImageFilter.GaussianBlur(feather_radius))
+    return FastPathResult("uniform_background", mask_image)
+
+
+def classify(image, tolerance=COLOR_KEY_TOLERANCE, feather_radius=FAST_PATH_FEATHER_RADIUS):
+    """
+    Detect inputs that can be answered without BiRefNet.
+
+    Checks, in order:
+    - RGBA input with a meaningful alpha channel: the alpha is reused
+    - near-uniform image: fully transparent result
+    - near-uniform border colour with a clean separation from it: colour-key
+      mask with feathered edges
+
+    Args:
+        image: PIL Image in RGB or RGBA mode
+
+    Returns:
+        FastPathResult, or None when the model is needed
+    """
+    if image.mode == "RGBA":
+        result = _existing_alpha(image)
+        if result is not None:
+            return result
+        image = image.convert("RGB")
+
+    thumb = image.resize(THUMBNAIL_SIZE, Image.BILINEAR)
+    pixels = np.asarray(thumb, dtype=np.float32)
+
+    if pixels.reshape(-1, 3).std(axis=0).max() < BLANK_STD:
+        return FastPathResult("blank", Image.new("L", (1, 1), 0))
+
+    border = _border_pixels(pixels)
+    background = np.median(border, axis=0)
+    deviation = np.abs(border - background).max(axis=1)
+    if np.percentile(deviation, 99) > tolerance:
+        return None
+
+    return _color_key(image, background, tolerance, feather_radius)
@@ -0,0 +1,119 @@
+# models/mask_cache.py: Reuse masks for near-duplicate images via a perceptual-hash index
+import threading
+from collections import OrderedDict
+
+import numpy as np
+from PIL import Image
+
+from config import PHASH_CACHE_ENTRIES, PHASH_MAX_DISTANCE, PHASH_MASK_SIZE
+from utils.metrics import metrics
+from utils.phash import phash, hamming_distances
+
+# Inputs whose aspect ratios differ by more than this are never matched,
+# so a crop of a cached image does not reuse the uncropped mask
+ASPECT_RATIO_TOLERANCE = 0.02
+
+
+class PerceptualMaskIndex:
+    """
+    Bounded LRU index from perceptual hash to a low-resolution mask.
+
+    Lookups compare the query hash against every stored hash at once with a
+    vectorised Hamming distance, and return the closest entry within
+    max_distance bits whose aspect ratio (and model) matches.
+    """
+
+    def __init__(self, capacity, max_distance, mask_size):
+        self.capacity = capacity
+        self.max_distance = max_distance
+        self.mask_size = mask_size
+
+        self._lock = threading.Lock()
+        self._hashes = np.zeros(capacity, dtype=np.uint64)
+        self._aspects = np.zeros(capacity, dtype=np.float64)
+        self._valid = np.zeros(capacity, dtype=bool)
+        self._masks = [None] * capacity
+        # Small integer per model name, so entries can be filtered vectorised
+        self._model_ids = np.zeros(capacity, dtype=np.int32)
+        self._model_index = {}
+        # Slot -> None, ordered from least to most recently used
+        self._lru = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def _model_id(self, model):
+        # Called with the lock held
+        return self._model_index.setdefault(model, len(self._model_index))
+
+    def lookup(self, image, image_hash=None, model=None):
+        """
+        Find a stored mask for a near-duplicate of `image` made by `model`.
+
+        Returns (mask, distance) with the mask as a PIL 'L' image at
+        mask_size, or None on a miss.
+        """
+        if image_hash is None:
+            image_hash = phash(image)
+        aspect = image.width / image.height
+
+        with self._lock:
+            if not self._valid.any():
+                self._record(hit=False)
+                return None
+            distances = hamming_distances(self._hashes, image_hash)
+            aspect_ok = np.abs(self._aspects / aspect - 1.0) <= ASPECT_RATIO_TOLERANCE
+            model_ok = self._model_ids == self._model_id(model)
+            candidates = self._valid & aspect_ok & model_ok & (distances <= self.max_distance)
+            if not candidates.any():
+                self._record(hit=False)
+                return None
+            slot = int(np.argmin(np.where(candidates, distances, np.iinfo(np.int64).max)))
+            self._lru.move_to_end(slot)
+            mask = self._masks[slot]
+            self._record(hit=True)
+            return Image.fromarray(mask), int(distances[slot])
+
+    def add(self, image, mask, image_hash=None, model=None):
+        """Store a downsampled copy of `mask` (made by `model`) for `image`."""
+        if image_hash is None:
+            image_hash = phash(image)
+        small = np.asarray(mask.convert("L").resize((self.mask_size, self.mask_size), Image.BILINEAR))
+
+        with self._lock:
+            free = np.flatnonzero(~self._valid)
+            if len(free):
+                slot = int(free[0])
+            else:
+                slot, _ = self._lru.popitem(last=False)
+            self._hashes[slot] = np.uint64(image_hash)
+            self._aspects[slot] = image.width / image.height
+            self._masks[slot] = small
+            self._model_ids[slot] = self._model_id(model)
+            self._valid[slot] = True
+            self._lru[slot] = None
+            self._lru.move_to_end(slot)
+
+    def _record(self, hit):
+        if hit:
+            self.hits += 1
+        else:
+            self.misses += 1
+        metrics.inc("mask_cache_lookups_total", cache="phash", result="hit" if hit else "miss")
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": int(self._valid.sum()),
+                "capacity": self.capacity,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else None,
+            }
+
+
+# Shared index for the worker process (None when disabled)
+phash_index = (
+    PerceptualMaskIndex(PHASH_CACHE_ENTRIES, PHASH_MAX_DISTANCE, PHASH_MASK_SIZE)
+    if PHASH_CACHE_ENTRIES > 0 else None
+)
@@ -0,0 +1,267 @@
+# models/mask_refinement.py: Optional mask refinements applied at model resolution
+import math
+
+import numpy as np
+import torch
+import torch.nn.functional as F
+from PIL import Image
+
+from config import MODEL_INPUT_SIZE
+from utils.request_options import InvalidOptionError
+from utils.sky_detection import sky_mask_for_refinement
+
+
+# Largest edge_shift and feather accepted, in pixels of the model-resolution
+# mask; beyond these the result is meaningless and only costs time in the slot
+MAX_EDGE_SHIFT = 64
+MAX_FEATHER = 32
+
+
+class RefinementOptions:
+    """
+    Per-request mask refinements.
+
+    Sizes are in pixels of the model-resolution mask (MODEL_INPUT_SIZE), and
+    areas are fractions of the mask area, so the cost is independent of the
+    output size.
+
+    Attributes:
+        threshold: Binarise the mask at this value (0-1), None to keep soft edges
+        feather: Gaussian feather radius applied last, 0 to disable
+        fill_holes: Fill background regions enclosed by the subject that are
+            smaller than this fraction of the image, 0 to disable
+        remove_islands: Drop foreground regions smaller than this fraction
+            of the image, 0 to disable
+        edge_shift: Grow (positive) or shrink (negative) the subject edge by
+            this many pixels
+        remove_sky: Make detected sky transparent
+    """
+
+    def __init__(self, threshold=None, feather=0.0, fill_holes=0.0, remove_islands=0.0,
+                 edge_shift=0, remove_sky=False):
+        if threshold is not None and not 0.0 < threshold < 1.0:
+            raise InvalidOptionError("threshold must be between 0 and 1")
+        if feather < 0 or fill_holes < 0 or remove_islands < 0:
+            raise InvalidOptionError("feather, fill_holes and remove_islands must not be negative")
+        if feather > MAX_FEATHER:
+            raise InvalidOptionError(f"feather must be at most {MAX_FEATHER}")
+        if abs(edge_shift) > MAX_EDGE_SHIFT:
+            raise InvalidOptionError(f"edge_shift must be between -{MAX_EDGE_SHIFT} and {MAX_EDGE_SHIFT}")
+        self.threshold = threshold
+        self.feather = feather
+        self.fill_holes = fill_holes
+        self.remove_islands = remove_islands
+        self.edge_shift = edge_shift
+        self.remove_sky = remove_sky
+
+    def is_noop(self):
+        return (
+            self.threshold is None
+            and not self.feather
+            and not self.fill_holes
+            and not self.remove_islands
+            and not self.edge_shift
+            and not self.remove_sky
+        )
+
+    def to_dict(self):
+        return dict(self.__dict__)
+
+
+def _neighbour_edges(foreground):
+    """Flat pixel indices (a, b) of every pair of 8-connected foreground neighbours."""
+    n, h, w = foreground.shape
+    index = torch.arange(n * h * w, dtype=torch.int64).reshape(n, h, w)
+    # Right, down, down-right and down-left neighbours cover every pair once
+    pairs = [
+        (index[:, :, :-1], index[:, :, 1:], foreground[:, :, :-1] & foreground[:, :, 1:]),
+        (index[:, :-1, :], index[:, 1:, :], foreground[:, :-1, :] & foreground[:, 1:, :]),
+        (index[:, :-1, :-1], index[:, 1:, 1:], foreground[:, :-1, :-1] & foreground[:, 1:, 1:]),
+        (index[:, :-1, 1:], index[:, 1:, :-1], foreground[:, :-1, 1:] & foreground[:, 1:, :-1]),
+    ]
+    return torch.cat([a[m] for a, _, m in pairs]), torch.cat([b[m] for _, b, m in pairs])
+
+
+def label_components(foreground):
+    """
+    Label 8-connected components of a batch of binary masks.
+
+    A vectorised union-find over the neighbour pairs: every round hooks the
+    root of each pair onto the smaller root, then compresses all paths by
+    pointer jumping. Every component that still has a neighbour merges in
+    each round, so a few rounds suffice whatever the shape (serpentine or
+    noisy masks included), each a handful of passes over the pixels.
+
+    Args:
+        foreground: bool tensor (n, h, w)
+
+    Returns:
+        int64 tensor (n, h, w): 0 for background, otherwise a component id
+        unique across the batch
+    """
+    n, h, w = foreground.shape
+    a, b = _neighbour_edges(foreground)
+    parent = torch.arange(n * h * w, dtype=torch.int64)
+    while len(a):
+        # parent is fully compressed here, so these are roots
+        root_a, root_b = parent[a], parent[b]
+        parent.scatter_reduce_(0, torch.maximum(root_a, root_b), torch.minimum(root_a, root_b), reduce="amin")
+        while True:
+            grandparent = parent[parent]
+            if torch.equal(grandparent, parent):
+                break
+            parent = grandparent
+        # Pairs already in one component are done
+        joined = parent[a] == parent[b]
+        a, b = a[~joined], b[~joined]
+    return ((parent + 1) * foreground.reshape(-1)).reshape(n, h, w)
+
+
+def _small_components(foreground, max_area, exclude_border=False):
+    """Boolean mask of components with fewer than max_area pixels."""
+    labels = label_components(foreground)
+    counts = torch.bincount(labels.reshape(-1))
+    small = counts < max_area
+    small[0] = False
+    if exclude_border:
+        border = torch.cat([
+            labels[:, 0, :].reshape(-1), labels[:, -1, :].reshape(-1),
+            labels[:, :, 0].reshape(-1), labels[:, :, -1].reshape(-1),
+        ])
+        small[border] = False
+    return small[labels]
+
+
+def _gaussian_kernel(sigma):
+    radius = max(1, int(math.ceil(3 * sigma)))
+    x = torch.arange(-radius, radius + 1, dtype=torch.float32)
+    kernel = torch.exp(-(x ** 2) / (2 * sigma ** 2))
+    return kernel / kernel.sum(), radius
+
+
+def feather_masks(masks, sigma):
+    """Separable Gaussian blur of (n, 1, h, w) masks."""
+    kernel, radius = _gaussian_kernel(sigma)
+    masks = F.pad(masks, (radius, radius, 0, 0), mode="replicate")
+    masks = F.conv2d(masks, kernel.view(1, 1, 1, -1))
+    masks = F.pad(masks, (0, 0, radius, radius), mode="replicate")
+    return F.conv2d(masks, kernel.view(1, 1, -1, 1))
+
+
+def _window_max(masks, radius, dim):
+    """
+    Maximum over a window of 2 * radius + 1 along dim (-1 or -2), like a
+    1-D max pool padded with -inf.
+
+    Windows of doubling width are built from the previous ones, and the
+    result is the maximum of two overlapping windows, so this takes
+    O(log radius) elementwise passes instead of O(radius) per pixel.
+    """
+    size = 2 * radius + 1
+    x = F.pad(masks, (radius, radius, 0, 0) if dim == -1 else (0, 0, radius, radius), value=-math.inf)
+    # x[i] becomes the maximum of the padded input over [i, i + width)
+    width = 1
+    while width * 2 <= size:
+        length = x.shape[dim] - width
+        x = torch.maximum(x.narrow(dim, 0, length), x.narrow(dim, width, length))
+        width *= 2
+    length = masks.shape[dim]
+    return torch.maximum(x.narrow(dim, 0, length), x.narrow(dim, size - width, length))
+
+
+def shift_edges(masks, pixels):
+    """Dilate (pixels > 0) or erode (pixels < 0) (n, 1, h, w) masks with a square element."""
+    if pixels == 0:
+        return masks
+    radius = abs(pixels)
+    sign = 1.0 if pixels > 0 else -1.0
+    # A square element is separable: a row pass, then a column pass
+    masks = _window_max(sign * masks, radius, -1)
+    return sign * _window_max(masks, radius, -2)
+
+
+def refine_masks(masks, options):
+    """
+    Apply refinements to a batch of masks.
+
+    Args:
+        masks: float tensor (n, 1, h, w) with values in [0, 1]
+        options: RefinementOptions
+
+    Returns:
+        float tensor (n, 1, h, w)
+    """
+    masks = masks.float()
+    area = masks.shape[-1] * masks.shape[-2]
+
+    if options.remove_islands:
+        islands = _small_components(masks[:, 0] >= 0.5, options.remove_islands * area)
+        masks = masks.masked_fill(islands.unsqueeze(1), 0.0)
+
+    if options.fill_holes:
+        holes = _small_components(masks[:, 0] < 0.5, options.fill_holes * area, exclude_border=True)
+        masks = masks.masked_fill(holes.unsqueeze(1), 1.0)
+
+    masks = shift_edges(masks, options.edge_shift)
+
+    if options.threshold is not None:
+        masks = (masks >= options.threshold).float()
+
+    if options.feather:
+        masks = feather_masks(masks, options.feather)
+
+    return masks.clamp(0.0, 1.0)
+
+
+def _work_size(mask_image):
+    """Refinements run at the mask resolution, capped at the model input size."""
+    width, height = mask_image.size
+    max_width, max_height = MODEL_INPUT_SIZE
+    if width <= max_width and height <= max_height:
+        return mask_image.size
+    return MODEL_INPUT_SIZE
+
+
+def remove_sky(image, mask):
+    """
+    Make detected sky transparent.
+
+    Args:
+        image: PIL Image (RGB or RGBA) at any resolution
+        mask: float tensor (h, w) mask
+
+    Returns:
+        float tensor (h, w)
+    """
+    h, w = mask.shape
+    pixels = np.asarray(image.convert("RGB").resize((w, h), Image.BILINEAR))
+    sky = torch.from_numpy(sky_mask_for_refinement(pixels) > 0)
+    return mask.masked_fill(sky, 0.0)
+
+
+def refine_mask(image, mask_image, options=None):
+    """
+    Apply the requested refinements to a mask before it is upsampled.
+
+    Args:
+        image: PIL Image the mask belongs to
+        mask_image: PIL Image (mode "L") at any resolution
+        options: RefinementOptions, None for no refinement
+
+    Returns:
+        PIL Image (mode "L"), at most at model resolution
+    """
+    # A 1x1 mask comes from the blank-image fast path; nothing to refine
+    if options is None or options.is_noop() or mask_image.size == (1, 1):
+        return mask_image
+
+    work_size = _work_size(mask_image)
+    if work_size != mask_image.size:
+        mask_image = mask_image.resize(work_size, Image.BILINEAR)
+    mask = torch.from_numpy(np.asarray(mask_image.convert("L"), dtype=np.float32) / 255.0)
+
+    if options.remove_sky:
+        mask = remove_sky(image, mask)
+
+    mask = refine_masks(mask[None, None], options)[0, 0]
+    return Image.fromarray((mask.numpy() * 255).round().astype(np.uint8))
@@ -0,0 +1,164 @@
+# models/model_registry.py: Named models loaded on demand and kept in a memory-bounded LRU
+import os
+import threading
+import time
+from collections import OrderedDict
+
+import torch
+
+from config import (
+    DEVICE, MODEL_INPUT_SIZE, MODELS, DEFAULT_MODEL, MODEL_MEMORY_BUDGET_MB,
+    MODEL_SNAPSHOT_DIR, MODEL_OFFLINE, MODEL_WARMUP,
+)
+from models.birefnet_model import load_birefnet_model, ensure_snapshot
+from utils.metrics import metrics
+
+MB = 1024 * 1024
+
+
+class UnknownModelError(ValueError):
+    """Raised when a request names a model that is not configured."""
+
+
+def model_size_bytes(model):
+    """Memory held by a model's parameters and buffers."""
+    tensors = list(model.parameters()) + list(model.buffers())
+    return sum(t.numel() * t.element_size() for t in tensors)
+
+
+class ModelRegistry:
+    """
+    Models selectable by name, loaded on first use.
+
+    Loaded models are kept in least-recently-used order; when their combined
+    size exceeds the memory budget, the least recently used ones are
+    evicted. Pinned models (the default) are never evicted. A request that
+    is still using an evicted model keeps its reference, so eviction never
+    breaks in-flight inference; the memory is freed once it finishes.
+    """
+
+    def __init__(self, models, default, memory_budget_mb=0, snapshot_dir="", offline=False,
+                 warmup=True, pinned=None):
+        if default not in models:
+            raise ValueError(f"Default model {default!r} is not one of {sorted(models)}")
+        self.models = dict(models)
+        self.default = default
+        self.memory_budget = memory_budget_mb * MB
+        self.snapshot_dir = snapshot_dir
+        self.offline = offline
+        self.warmup = warmup
+        self.pinned = set(pinned if pinned is not None else [default])
+
+        self._lock = threading.Lock()
+        self._load_locks = {name: threading.Lock() for name in models}
+        # name -> (model, size in bytes), least recently used first
+        self._loaded = OrderedDict()
+        self.evictions = 0
+
+    def resolve(self, name=None):
+        """Return the configured model name for a request (default when None)."""
+        if not name:
+            return self.default
+        if name not in self.models:
+            raise UnknownModelError(f"Unknown model {name!r}, expected one of: {', '.join(sorted(self.models))}")
+        return name
+
+    def get(self, name=None):
+        """Return the loaded model, loading (and possibly evicting others) first."""
+        name = self.resolve(name)
+        with self._lock:
+            entry = self._loaded.get(name)
+            if entry is not None:
+                self._loaded.move_to_end(name)
+                return entry[0]
+        # Loading takes seconds; only block requests for the same model
+        with self._load_locks[name]:
+            with self._lock:
+                entry = self._loaded.get(name)
+                if entry is not None:
+                    self._loaded.move_to_end(name)
+                    return entry[0]
+            model = self._load(name)
+            with self._lock:
+                self._loaded[name] = (model, model_size_bytes(model))
+                self._evict(keep=name)
+                self._update_gauges()
+            return model
+
+    def is_loaded(self, name=None):
+        with self._lock:
+            return self.resolve(name) in self._loaded
+
+    def load_fresh(self, name=None, half=None):
+        """
+        Load a new instance of a model that the registry does not keep or
+        share (e.g. an fp32 copy for benchmarks).
+
+        Args:
+            name: Model name (default when None)
+            half: Convert to fp16 (default: on CUDA, like registry models)
+        """
+        name = self.resolve(name)
+        local_dir = None
+        if self.snapshot_dir:
+            local_dir = ensure_snapshot(self.models[name], os.path.join(self.snapshot_dir, name), self.offline)
+        return load_birefnet_model(self.models[name], local_dir=local_dir, half=half)
+
+    def _load(self, name):
+        start = time.time()
+        model = self.load_fresh(name)
+        metrics.observe("model_load_seconds", time.time() - start, model=name)
+
+        if self.warmup:
+            start = time.time()
+            dummy = torch.zeros(1, 3, *MODEL_INPUT_SIZE, device=DEVICE)
+            if DEVICE.type == "cuda":
+                dummy = dummy.half()
+            with torch.no_grad():
+                model(dummy)
+            metrics.observe("model_warmup_seconds", time.time() - start, model=name)
+        return model
+
+    def _evict(self, keep):
+        """Drop least recently used models until within budget (lock held)."""
+        if not self.memory_budget:
+            return
+        for name in list(self._loaded):
+            if sum(size for _, size in self._loaded.values()) <= self.memory_budget:
+                break
+            if name == keep or name in self.pinned:
+                continue
+            del self._loaded[name]
+            self.evictions += 1
+            metrics.inc("model_evictions_total", model=name)
+        if DEVICE.type == "cuda":
+            torch.cuda.empty_cache()
+
+    def _update_gauges(self):
+        for name in self.models:
+            entry = self._loaded.get(name)
+            metrics.set_gauge("model_loaded", 1 if entry else 0, model=name)
+        metrics.set_gauge("model_memory_mb", sum(size for _, size in self._loaded.values()) / MB)
+
+    def stats(self):
+        with self._lock:
+            return {
+                "default": self.default,
+                "available": sorted(self.models),
+                "loaded": {name: round(size / MB, 1) for name, (_, size) in self._loaded.items()},
+                "memory_mb": round(sum(size for _, size in self._loaded.values()) / MB, 1),
+                "memory_budget_mb": self.memory_budget // MB or None,
+                "evictions": self.evictions,
+            }
+
+
+# Initialize the registry once and load the default model up front
+model_registry = ModelRegistry(
+    MODELS,
+    DEFAULT_MODEL,
+    memory_budget_mb=MODEL_MEMORY_BUDGET_MB,
+    snapshot_dir=MODEL_SNAPSHOT_DIR,
+    offline=MODEL_OFFLINE,
+    warmup=MODEL_WARMUP,
+)
+model_registry.get()
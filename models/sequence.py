@@ -0,0 +1,235 @@
+# models/sequence.py: Masks for frame sequences, running the model on keyframes and reusing/warping their masks in between
+from contextlib import nullcontext
+
+import numpy as np
+from PIL import Image
+
+from models.bg_remover import predict_masks
+from utils.metrics import metrics
+from config import MODEL_INPUT_SIZE, SEQUENCE_DIFF_THRESHOLD, SEQUENCE_KEYFRAME_INTERVAL, SEQUENCE_BATCH_SIZE
+
+# Side length of the greyscale thumbnails frames are compared on
+SIGNATURE_SIZE = 128
+
+# Largest motion (fraction of the frame) compensated by warping; beyond it
+# too much new content enters the frame and a keyframe is taken instead
+MAX_SHIFT = 0.1
+
+# Grey-level change (0-1) at which a signature pixel counts as changed;
+# above compression noise and flicker
+PIXEL_TOLERANCE = 0.08
+
+
+class FramePlan:
+    """
+    How the mask of one frame is obtained.
+
+    Attributes:
+        index: Position of the frame in the sequence
+        source: "model" (keyframe), "reused" (mask of the keyframe as is) or
+            "warped" (mask of the keyframe translated by shift)
+        keyframe: Index of the keyframe whose mask is used
+        shift: (dy, dx) motion since the keyframe, as fractions of the frame size
+        difference: Fraction of the frame that changed since the
+            motion-compensated keyframe, None for keyframes
+    """
+
+    def __init__(self, index, source, keyframe, shift=(0.0, 0.0), difference=None):
+        self.index = index
+        self.source = source
+        self.keyframe = keyframe
+        self.shift = shift
+        self.difference = difference
+
+    def to_dict(self):
+        return {
+            "index": self.index,
+            "source": self.source,
+            "keyframe": self.keyframe,
+            "shift": [round(s, 4) for s in self.shift],
+            "difference": None if self.difference is None else round(self.difference, 4),
+        }
+
+
+def frame_signature(image, size=SIGNATURE_SIZE):
+    """Greyscale thumbnail (float32, 0-1) used to compare frames."""
+    gray = image.convert("L").resize((size, size), Image.BILINEAR)
+    return np.asarray(gray, dtype=np.float32) / 255.0
+
+
+def _sample_positions(n, shift):
+    """Source indices and weights for shifting n samples by a fractional amount."""
+    positions = np.clip(np.arange(n, dtype=np.float32) - shift, 0, n - 1)
+    low = np.floor(positions).astype(np.int64)
+    high = np.minimum(low + 1, n - 1)
+    return low, high, positions - low
+
+
+def translate(array, dy, dx):
+    """
+    Shift a 2-D array by (dy, dx) pixels with bilinear interpolation,
+    repeating the edge into the uncovered border. Keeps the input dtype.
+    """
+    h, w = array.shape
+    y0, y1, fy = _sample_positions(h, dy)
+    x0, x1, fx = _sample_positions(w, dx)
+    values = array.astype(np.float32)
+    top = values[y0][:, x0] * (1 - fx) + values[y0][:, x1] * fx
+    bottom = values[y1][:, x0] * (1 - fx) + values[y1][:, x1] * fx
+    shifted = top * (1 - fy)[:, None] + bottom * fy[:, None]
+    if np.issubdtype(array.dtype, np.integer):
+        shifted = np.rint(shifted)
+    return shifted.astype(array.dtype)
+
+
+def _overlap(n, shift):
+    """Slice of positions that still show content after shifting n samples."""
+    return slice(max(0, int(np.ceil(shift))), n + min(0, int(np.floor(shift))))
+
+
+def estimate_shift(reference, current, max_shift=MAX_SHIFT):
+    """
+    Global translation from reference to current by phase correlation.
+
+    Returns:
+        (dy, dx) in signature pixels, with sub-pixel precision, such that
+        translate(reference, dy, dx) approximates current; (0, 0) when the
+        motion exceeds max_shift
+    """
+    h, w = reference.shape
+    window = np.outer(np.hanning(h), np.hanning(w)).astype(np.float32)
+    cross = np.fft.fft2(current * window) * np.conj(np.fft.fft2(reference * window))
+    cross /= np.abs(cross) + 1e-9
+    correlation = np.fft.ifft2(cross).real
+    py, px = np.unravel_index(np.argmax(correlation), correlation.shape)
+    # Refine the peak with a parabola through its neighbours on each axis
+    dy = py + _peak_offset(correlation[(py - 1) % h, px], correlation[py, px], correlation[(py + 1) % h, px])
+    dx = px + _peak_offset(correlation[py, (px - 1) % w], correlation[py, px], correlation[py, (px + 1) % w])
+    # Peaks past the middle are negative shifts
+    dy = dy - h if dy > h / 2 else dy
+    dx = dx - w if dx > w / 2 else dx
+    if abs(dy) > max_shift * h or abs(dx) > max_shift * w:
+        return 0.0, 0.0
+    return float(dy), float(dx)
+
+
+def _peak_offset(before, peak, after):
+    """Sub-pixel position of a peak from its two neighbours, in [-0.5, 0.5]."""
+    curvature = before - 2 * peak + after
+    if curvature >= 0:
+        return 0.0
+    return float(np.clip(0.5 * (before - after) / curvature, -0.5, 0.5))
+
+
+def _pool(array, factor=2):
+    """Average factor x factor blocks."""
+    h, w = array.shape
+    h, w = h - h % factor, w - w % factor
+    return array[:h, :w].reshape(h // factor, factor, w // factor, factor).mean(axis=(1, 3))
+
+
+def frame_difference(reference, current, shift=(0, 0), tolerance=PIXEL_TOLERANCE):
+    """
+    Fraction of signature pixels that changed between the shifted reference
+    and current, over the area both frames show (the uncovered border is
+    bounded by MAX_SHIFT). Counting changed pixels rather than averaging the
+    change keeps a small subject moving across a static background from
+    being diluted by the rest of the frame. Pixels are compared in 2x2
+    blocks, so sub-pixel misalignment of sharp edges does not count.
+    """
+    h, w = reference.shape
+    region = (_overlap(h, shift[0]), _overlap(w, shift[1]))
+    changed = np.abs(_pool(translate(reference, *shift)[region]) - _pool(current[region])) > tolerance
+    return float(changed.mean()) if changed.size else 1.0
+
+
+def plan_sequence(frames, diff_threshold=SEQUENCE_DIFF_THRESHOLD,
+                  keyframe_interval=SEQUENCE_KEYFRAME_INTERVAL, warp=True):
+    """
+    Decide which frames need a model pass.
+
+    Every frame is compared with the last keyframe (not the previous frame),
+    so small changes cannot accumulate into drift. A frame becomes a new
+    keyframe when it differs by more than diff_threshold after motion
+    compensation, has a different size, or keyframe_interval frames have
+    passed since the last one.
+
+    Args:
+        frames: List of PIL Images
+        diff_threshold: Largest changed fraction (0-1) at which the keyframe mask is reused
+        keyframe_interval: Force a keyframe every N frames, 0 to only use changes
+        warp: Compensate global translation (camera pan, object slide)
+
+    Returns:
+        List of FramePlan, one per frame
+    """
+    plans = []
+    keyframe = reference = None
+    for index, frame in enumerate(frames):
+        signature = frame_signature(frame)
+        is_key = (
+            keyframe is None
+            or frame.size != frames[keyframe].size
+            or (keyframe_interval and index - keyframe >= keyframe_interval)
+        )
+        if not is_key:
+            shift = estimate_shift(reference, signature) if warp else (0.0, 0.0)
+            difference = frame_difference(reference, signature, shift)
+            is_key = difference > diff_threshold
+        if is_key:
+            keyframe, reference = index, signature
+            plans.append(FramePlan(index, "model", index))
+            continue
+        # Motion below half a mask pixel is not worth a warp
+        source = "warped" if max(abs(shift[0]), abs(shift[1])) * MODEL_INPUT_SIZE[0] / SIGNATURE_SIZE >= 0.5 else "reused"
+        shift = shift if source == "warped" else (0.0, 0.0)
+        shift = (shift[0] / SIGNATURE_SIZE, shift[1] / SIGNATURE_SIZE)
+        plans.append(FramePlan(index, source, keyframe, shift, difference))
+    return plans
+
+
+def warp_mask(mask_image, shift):
+    """Translate a mask by (dy, dx) given as fractions of its size."""
+    if shift == (0.0, 0.0):
+        return mask_image
+    mask = np.asarray(mask_image)
+    h, w = mask.shape
+    return Image.fromarray(translate(mask, shift[0] * h, shift[1] * w))
+
+
+def sequence_masks(frames, diff_threshold=SEQUENCE_DIFF_THRESHOLD,
+                   keyframe_interval=SEQUENCE_KEYFRAME_INTERVAL, warp=True,
+                   batch_size=SEQUENCE_BATCH_SIZE, model_name=None, admit=None):
+    """
+    Foreground masks for an ordered frame sequence.
+
+    Keyframes are run through the model in batches of batch_size; the other
+    frames reuse or warp the mask of their keyframe.
+
+    Args:
+        frames: List of PIL Images (RGB or RGBA)
+        diff_threshold, keyframe_interval, warp: See plan_sequence()
+        batch_size: Keyframes per model batch
+        model_name: Registry name of the model to use, None for the default
+        admit: Optional callable(pixels) returning a context manager that is
+            held around each model batch (admission control)
+
+    Returns:
+        (masks, plans): PIL "L" masks at model resolution and the FramePlans
+    """
+    plans = plan_sequence(frames, diff_threshold, keyframe_interval, warp)
+    keyframes = [plan.index for plan in plans if plan.source == "model"]
+
+    key_masks = {}
+    for start in range(0, len(keyframes), max(1, batch_size)):
+        batch = keyframes[start:start + max(1, batch_size)]
+        images = [frames[i] if frames[i].mode == "RGB" else frames[i].convert("RGB") for i in batch]
+        pixels = sum(image.width * image.height for image in images)
+        with (admit(pixels) if admit is not None else nullcontext()):
+            key_masks.update(zip(batch, predict_masks(images, model_name)))
+
+    masks = []
+    for plan in plans:
+        masks.append(key_masks[plan.index] if plan.source == "model" else warp_mask(key_masks[plan.keyframe], plan.shift))
+        metrics.inc("sequence_frames_total", source=plan.source)
+    return masks, plans
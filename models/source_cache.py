@@ -0,0 +1,123 @@
+# models/source_cache.py: Short-lived cache of decoded inputs and their masks, keyed by the source bytes
+import threading
+import time
+from collections import OrderedDict
+
+from config import SOURCE_CACHE_MB, SOURCE_CACHE_TTL_SECONDS
+from utils.metrics import metrics
+
+
+def _image_bytes(image):
+    return image.width * image.height * len(image.getbands())
+
+
+class SourceCacheEntry:
+    """
+    Cached work for one source.
+
+    Attributes:
+        image: Decoded input (RGB or RGBA), or None when it was too large to
+            keep; shared between requests, so it must not be modified
+        mask: Mask before refinement (PIL "L", model resolution for model masks)
+        mask_source: Where the mask came from ("model", "phash_cache" or a fast path kind)
+        size: Bytes held by the entry
+    """
+
+    def __init__(self, image, mask, mask_source):
+        self.image = image
+        self.mask = mask
+        self.mask_source = mask_source
+        self.size = (_image_bytes(image) if image is not None else 0) + _image_bytes(mask)
+        self.last_used = time.monotonic()
+
+
+class SourceCache:
+    """
+    LRU cache bounded by memory and by time since last use.
+
+    Requests that repeat a source with different post-processing options
+    (refinement, streaming, response mode) find the decoded image and the
+    unrefined mask here and skip decoding, preprocessing and the model.
+    Only exact repeats hit: the key is a digest of the source bytes plus
+    everything that decides the mask (model, fast path and reuse_mask
+    settings). A decoded image larger than a quarter of the budget is not
+    kept; its entry holds only the mask, which still skips the model.
+    """
+
+    def __init__(self, max_bytes, ttl):
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+        self._bytes = 0
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def key(fingerprint, model_name, fast_path, reuse_mask):
+        """Cache key of a source under the settings that decide its mask."""
+        return (fingerprint, model_name, bool(fast_path), bool(reuse_mask))
+
+    def get(self, key):
+        """The live entry for key (renewing it), or None."""
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and now - entry.last_used > self.ttl:
+                self._remove(key)
+                entry = None
+            if entry is None:
+                self.misses += 1
+            else:
+                entry.last_used = now
+                self._entries.move_to_end(key)
+                self.hits += 1
+        metrics.inc("mask_cache_lookups_total", cache="source", result="hit" if entry is not None else "miss")
+        return entry
+
+    def put(self, key, image, mask, mask_source):
+        """
+        Store the decoded image and unrefined mask of a source.
+
+        Returns:
+            The new SourceCacheEntry, or None when it did not fit
+        """
+        if _image_bytes(image) > self.max_bytes // 4:
+            image = None
+        entry = SourceCacheEntry(image, mask, mask_source)
+        if entry.size > self.max_bytes:
+            return None
+        now = time.monotonic()
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = entry
+            self._bytes += entry.size
+            # Expired entries first, then least recently used ones
+            for old_key in [k for k, e in self._entries.items() if now - e.last_used > self.ttl]:
+                self._remove(old_key)
+            while self._bytes > self.max_bytes:
+                self._remove(next(iter(self._entries)))
+            metrics.set_gauge("source_cache_mb", self._bytes / 2**20)
+        return entry
+
+    def _remove(self, key):
+        # Called with the lock held
+        self._bytes -= self._entries.pop(key).size
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "mb": round(self._bytes / 2**20, 1),
+                "max_mb": round(self.max_bytes / 2**20, 1),
+                "ttl_seconds": self.ttl,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else None,
+            }
+
+
+# Shared cache for the worker process (None when disabled)
+source_cache = SourceCache(SOURCE_CACHE_MB * 2**20, SOURCE_CACHE_TTL_SECONDS) if SOURCE_CACHE_MB > 0 else None
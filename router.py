@@ -0,0 +1,382 @@
+#!/usr/bin/env python3
+"""
+Local router in front of several background removal instances (app.py or asgi.py).
+
+Each backend's /health is polled for its queue depth (requests running or
+waiting for an inference slot), capacity and warm models. Requests go to the
+backend with the lowest load, counting the router's own in-flight requests
+since the last poll. Backends that fail health checks or refuse connections
+are ejected for a while. With --affinity, requests carrying the same image
+prefer the same backend (rendezvous hashing), so its mask caches get the
+repeats, unless that backend is noticeably busier than the least loaded one.
+
+Usage:
+    python router.py --backend http://127.0.0.1:5001 --backend http://127.0.0.1:5002
+                     [--port 8000] [--policy queue|round_robin|random] [--affinity]
+
+Compare tail latency between policies with load_test.py pointed at the
+router, or run benchmarks/router.py.
+"""
+
+import argparse
+import asyncio
+import hashlib
+import itertools
+import logging
+import os
+import random
+import sys
+import time
+from contextlib import asynccontextmanager
+
+import httpx
+from starlette.applications import Starlette
+from starlette.responses import JSONResponse, StreamingResponse
+from starlette.routing import Route
+
+from utils.metrics import metrics
+
+logging.basicConfig(
+    level=getattr(logging, os.environ.get("LOG_LEVEL", "INFO").upper()),
+    format="%(asctime)s - %(name)s - %(levelname)s - %(message)s",
+    handlers=[logging.StreamHandler(sys.stdout)],
+)
+logger = logging.getLogger("router")
+
+POLICIES = ("queue", "round_robin", "random")
+
+# Headers that describe a single connection and must not be forwarded
+HOP_BY_HOP_HEADERS = {
+    "connection", "keep-alive", "proxy-authenticate", "proxy-authorization",
+    "te", "trailer", "transfer-encoding", "upgrade", "host", "content-length",
+}
+
+
+class Backend:
+    """One upstream instance and what the router knows about it."""
+
+    def __init__(self, url):
+        self.url = url.rstrip("/")
+        self.healthy = False
+        self.draining = False
+        self.failures = 0
+        self.ejected_until = 0.0
+        self.ejections = 0
+        self.queue_depth = 0
+        self.capacity = 1
+        self.warm = []
+        self.inflight = 0
+        self.last_error = None
+
+    def available(self, now):
+        return self.healthy and not self.draining and now >= self.ejected_until
+
+    def load(self):
+        """
+        Requests per inference slot. The reported depth is up to one poll
+        interval old, the router's own in-flight count is current; the
+        larger of the two is used.
+        """
+        return max(self.queue_depth, self.inflight) / max(self.capacity, 1)
+
+    def stats(self, now):
+        return {
+            "url": self.url,
+            "available": self.available(now),
+            "healthy": self.healthy,
+            "draining": self.draining,
+            "ejected_for": round(max(0.0, self.ejected_until - now), 1),
+            "ejections": self.ejections,
+            "queue_depth": self.queue_depth,
+            "capacity": self.capacity,
+            "inflight": self.inflight,
+            "warm": self.warm,
+            "last_error": self.last_error,
+        }
+
+
+def content_key(body, content_type):
+    """
+    Hash of a request body for affinity, or None for an empty body.
+
+    Multipart boundaries are random per request, so they are removed first;
+    the same image sent with the same options then hashes the same.
+    """
+    if not body:
+        return None
+    _, _, boundary = (content_type or "").partition("boundary=")
+    boundary = boundary.split(";")[0].strip().strip('"')
+    if boundary:
+        body = body.replace(boundary.encode("latin-1"), b"")
+    return hashlib.sha1(body).digest()
+
+
+def rendezvous_score(key, backend):
+    """Highest-random-weight hash: each key ranks the backends in a stable order."""
+    return hashlib.sha1(key + backend.url.encode("utf-8")).digest()
+
+
+class Router:
+    """
+    Backend selection, health polling and ejection.
+
+    Args:
+        urls: Backend base URLs
+        policy: "queue" (lowest load), "round_robin" or "random"
+        affinity: Prefer the rendezvous-hash backend of the request content
+        affinity_slack: Extra requests per slot the affinity backend may have
+            over the least loaded one before affinity is ignored
+        eject_after: Consecutive failed health checks or connections before ejection
+        eject_seconds: How long an ejected backend is skipped (doubles on
+            repeated ejections, up to 8x)
+    """
+
+    def __init__(self, urls, policy="queue", affinity=False, affinity_slack=2.0,
+                 eject_after=2, eject_seconds=10.0):
+        if policy not in POLICIES:
+            raise ValueError(f"Unknown policy {policy!r}, expected one of {POLICIES}")
+        self.backends = [Backend(url) for url in urls]
+        self.policy = policy
+        self.affinity = affinity
+        self.affinity_slack = affinity_slack
+        self.eject_after = eject_after
+        self.eject_seconds = eject_seconds
+        self._round_robin = itertools.cycle(range(len(self.backends)))
+        self._rng = random.Random()
+
+    def choose(self, key=None, model=None, exclude=()):
+        """Pick a backend for a request, or None when none is available."""
+        now = time.monotonic()
+        candidates = [b for b in self.backends if b.available(now) and b not in exclude]
+        if not candidates:
+            return None
+
+        if self.policy == "round_robin":
+            while True:
+                backend = self.backends[next(self._round_robin)]
+                if backend in candidates:
+                    return backend
+        if self.policy == "random":
+            return self._rng.choice(candidates)
+
+        def score(backend):
+            # A backend that would have to load the requested model first
+            # costs about as much as one more request in its queue
+            cold = 1.0 if model and model not in backend.warm else 0.0
+            return backend.load() + cold
+
+        best_score = min(score(b) for b in candidates)
+        if self.affinity and key is not None:
+            preferred = max(candidates, key=lambda b: rendezvous_score(key, b))
+            if score(preferred) <= best_score + self.affinity_slack:
+                metrics.inc("router_affinity_total", result="hit")
+                return preferred
+            metrics.inc("router_affinity_total", result="overflow")
+        return self._rng.choice([b for b in candidates if score(b) == best_score])
+
+    def record_failure(self, backend, error):
+        backend.failures += 1
+        backend.last_error = str(error)[:200]
+        if backend.failures >= self.eject_after and time.monotonic() >= backend.ejected_until:
+            duration = self.eject_seconds * 2 ** min(backend.ejections, 3)
+            backend.ejected_until = time.monotonic() + duration
+            backend.ejections += 1
+            # Only a successful health check brings it back
+            backend.healthy = False
+            metrics.inc("router_ejections_total", backend=backend.url)
+            logger.warning(f"Ejected {backend.url} for {duration:.0f}s after {backend.failures} failures: {backend.last_error}")
+
+    def record_health(self, backend, status):
+        backend.failures = 0
+        backend.last_error = None
+        backend.draining = status.get("status") == "draining"
+        load = status.get("load", {})
+        admission = status.get("admission", {})
+        # Instances without the load summary still report admission stats
+        backend.queue_depth = load.get("queue_depth", admission.get("active", 0) + admission.get("queued", 0))
+        backend.capacity = load.get("capacity", admission.get("max_concurrent", 1))
+        backend.warm = load.get("warm", [])
+        if not backend.healthy and time.monotonic() >= backend.ejected_until:
+            logger.info(f"Backend {backend.url} is healthy")
+            backend.healthy = True
+
+    async def poll(self, client, backend, timeout):
+        try:
+            response = await client.get(f"{backend.url}/health", timeout=timeout)
+            response.raise_for_status()
+            self.record_health(backend, response.json())
+        except (httpx.HTTPError, ValueError) as e:
+            self.record_failure(backend, e)
+
+    async def poll_forever(self, client, interval, timeout):
+        while True:
+            await asyncio.gather(*(self.poll(client, backend, timeout) for backend in self.backends))
+            for backend in self.backends:
+                metrics.set_gauge("router_backend_queue_depth", backend.queue_depth, backend=backend.url)
+            await asyncio.sleep(interval)
+
+    def stats(self):
+        now = time.monotonic()
+        return {
+            "policy": self.policy,
+            "affinity": self.affinity,
+            "backends": [backend.stats(now) for backend in self.backends],
+        }
+
+
+def forward_headers(headers, client_host):
+    forwarded = {k: v for k, v in headers.items() if k.lower() not in HOP_BY_HOP_HEADERS}
+    if client_host:
+        previous = headers.get("x-forwarded-for")
+        forwarded["X-Forwarded-For"] = f"{previous}, {client_host}" if previous else client_host
+    return forwarded
+
+
+class RelayResponse(StreamingResponse):
+    """
+    Streams an upstream response back to the client.
+
+    The backend's in-flight count drops and the upstream response is closed
+    exactly once however the response ends: body finished, client gone
+    mid-body, or client gone before the body started (when the body
+    generator never runs, so its own cleanup would not either).
+    """
+
+    def __init__(self, upstream, backend, start, headers):
+        self.upstream = upstream
+        self.backend = backend
+        self.start = start
+        self._released = False
+        super().__init__(upstream.aiter_raw(), status_code=upstream.status_code, headers=headers)
+
+    async def __call__(self, scope, receive, send):
+        try:
+            await super().__call__(scope, receive, send)
+        finally:
+            await self.release()
+
+    async def release(self):
+        if self._released:
+            return
+        self._released = True
+        # Counted before awaiting, so a cancelled request still releases
+        self.backend.inflight -= 1
+        latency = time.perf_counter() - self.start
+        metrics.observe("router_latency_seconds", latency, backend=self.backend.url)
+        metrics.observe("router_latency_seconds", latency)
+        await self.upstream.aclose()
+
+
+async def proxy(request):
+    """Forward a request to the chosen backend and stream its response back."""
+    router = request.app.state.router
+    client = request.app.state.client
+    body = await request.body()
+    key = content_key(body, request.headers.get("content-type")) if router.affinity else None
+    headers = forward_headers(request.headers, request.client.host if request.client else None)
+
+    start = time.perf_counter()
+    tried = []
+    # A refused connection means the request never reached the backend,
+    # so it is safe to try the next one
+    for _ in range(len(router.backends)):
+        backend = router.choose(key, request.headers.get("x-model"), exclude=tried)
+        if backend is None:
+            break
+        backend.inflight += 1
+        upstream = client.build_request(request.method, backend.url + request.url.path,
+                                        params=request.query_params, headers=headers, content=body)
+        try:
+            response = await client.send(upstream, stream=True)
+        except httpx.ConnectError as e:
+            backend.inflight -= 1
+            router.record_failure(backend, e)
+            tried.append(backend)
+            metrics.inc("router_retries_total", backend=backend.url)
+            continue
+        except httpx.HTTPError as e:
+            backend.inflight -= 1
+            logger.warning(f"Request to {backend.url} failed: {str(e)}")
+            metrics.inc("router_requests_total", backend=backend.url, status=504)
+            return JSONResponse({"error": f"Upstream error: {str(e)}"}, status_code=504, headers={"X-Backend": backend.url})
+
+        metrics.inc("router_requests_total", backend=backend.url, status=response.status_code)
+        response_headers = {k: v for k, v in response.headers.items() if k.lower() not in HOP_BY_HOP_HEADERS}
+        response_headers["X-Backend"] = backend.url
+        return RelayResponse(response, backend, start, response_headers)
+
+    metrics.inc("router_unavailable_total")
+    return JSONResponse({"error": "No healthy backend available"}, status_code=503, headers={"Retry-After": "1"})
+
+
+async def router_status(request):
+    """Backend states and the router's own counters and latency histograms"""
+    return JSONResponse({"router": request.app.state.router.stats(), "metrics": metrics.snapshot()})
+
+
+def create_app(router, health_interval=1.0, health_timeout=2.0, request_timeout=300.0):
+    @asynccontextmanager
+    async def lifespan(app):
+        limits = httpx.Limits(max_connections=None, max_keepalive_connections=64)
+        timeout = httpx.Timeout(request_timeout, connect=health_timeout)
+        async with httpx.AsyncClient(timeout=timeout, limits=limits) as client:
+            app.state.router = router
+            app.state.client = client
+            # Know the backends' state before taking traffic
+            await asyncio.gather(*(router.poll(client, backend, health_timeout) for backend in router.backends))
+            poller = asyncio.create_task(router.poll_forever(client, health_interval, health_timeout))
+            logger.info(f"✅ Router ready: {len(router.backends)} backends, policy={router.policy}, affinity={router.affinity}")
+            try:
+                yield
+            finally:
+                poller.cancel()
+
+    return Starlette(
+        routes=[
+            Route("/router/status", router_status, methods=["GET"]),
+            Route("/{path:path}", proxy, methods=["GET", "POST", "PUT", "DELETE", "HEAD", "OPTIONS"]),
+        ],
+        lifespan=lifespan,
+    )
+
+
+def parse_arguments():
+    """Parse command line arguments"""
+    parser = argparse.ArgumentParser(description="Queue-depth aware router for background removal instances")
+    parser.add_argument("--backend", action="append", default=[],
+                        help="Backend base URL, repeatable (default: ROUTER_BACKENDS env var, comma separated)")
+    parser.add_argument("--port", type=int, default=int(os.environ.get("PORT", 8000)),
+                        help="Port to run the router on (default: 8000 or PORT env var)")
+    parser.add_argument("--host", type=str, default=os.environ.get("HOST", "0.0.0.0"),
+                        help="Host to bind the router to (default: 0.0.0.0 or HOST env var)")
+    parser.add_argument("--policy", choices=POLICIES, default=os.environ.get("ROUTER_POLICY", "queue"),
+                        help="Backend selection (default: queue)")
+    parser.add_argument("--affinity", action="store_true",
+                        default=os.environ.get("ROUTER_AFFINITY", "false").lower() in ("1", "true", "yes"),
+                        help="Send repeats of the same image to the same backend")
+    parser.add_argument("--affinity-slack", type=float, default=float(os.environ.get("ROUTER_AFFINITY_SLACK", 2)),
+                        help="Extra load per slot tolerated on the affinity backend (default: 2)")
+    parser.add_argument("--health-interval", type=float, default=float(os.environ.get("ROUTER_HEALTH_INTERVAL", 1.0)),
+                        help="Seconds between health polls (default: 1)")
+    parser.add_argument("--eject-after", type=int, default=int(os.environ.get("ROUTER_EJECT_AFTER", 2)),
+                        help="Consecutive failures before a backend is ejected (default: 2)")
+    parser.add_argument("--eject-seconds", type=float, default=float(os.environ.get("ROUTER_EJECT_SECONDS", 10)),
+                        help="Initial ejection time in seconds (default: 10)")
+    parser.add_argument("--timeout", type=float, default=float(os.environ.get("ROUTER_TIMEOUT", 300)),
+                        help="Upstream request timeout in seconds (default: 300)")
+    args = parser.parse_args()
+    if not args.backend:
+        args.backend = [url.strip() for url in os.environ.get("ROUTER_BACKENDS", "").split(",") if url.strip()]
+    if not args.backend:
+        parser.error("at least one --backend (or ROUTER_BACKENDS) is required")
+    return args
+
+
+if __name__ == "__main__":
+    import uvicorn
+
+    args = parse_arguments()
+    router = Router(args.backend, policy=args.policy, affinity=args.affinity, affinity_slack=args.affinity_slack,
+                    eject_after=args.eject_after, eject_seconds=args.eject_seconds)
+    app = create_app(router, health_interval=args.health_interval, request_timeout=args.timeout)
+    uvicorn.run(app, host=args.host, port=args.port)
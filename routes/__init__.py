@@ -3,7 +3,17 @@
 from flask import Blueprint
 from routes.remove_bg import remove_bg_bp
 from routes.ping import ping_bp
+from routes.metrics import metrics_bp
+from routes.profiles import profiles_bp
+from routes.batch_urls import batch_urls_bp
+from routes.sequence import sequence_bp
+from routes.results import results_bp
 
 def register_routes(app):
     app.register_blueprint(remove_bg_bp)
-    app.register_blueprint(ping_bp)
\ No newline at end of file
+    app.register_blueprint(ping_bp)
+    app.register_blueprint(metrics_bp)
+    app.register_blueprint(profiles_bp)
+    app.register_blueprint(batch_urls_bp)
+    app.register_blueprint(sequence_bp)
+    app.register_blueprint(results_bp)
\ No newline at end of file
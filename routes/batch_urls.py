@@ -0,0 +1,328 @@
+# routes/batch_urls.py: POST /remove-bg/batch, many image URLs per request with fetches overlapping inference
+import base64
+import json
+import queue
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+from flask import Blueprint, request, jsonify, current_app, g, Response
+from werkzeug.datastructures import Headers, MultiDict
+
+from utils.image_utils import ImageTooLargeError, URL_FETCH_HEADERS, fetch_url_content
+from utils.admission import admission_controller, AdmissionRejected
+from utils.metrics import metrics
+from models.model_registry import UnknownModelError
+from utils.request_options import InvalidOptionError
+from routes.processing import process_remove_bg, request_memory, RemoveBgOptions
+from config import (
+    BATCH_MAX_URLS, BATCH_FETCH_WORKERS, BATCH_PREFETCH, BATCH_INFERENCE_WORKERS, BATCH_MAX_CONCURRENT,
+    MAX_CONCURRENT_INFERENCES,
+)
+
+batch_urls_bp = Blueprint("batch_urls", __name__)
+
+_DONE = object()
+
+
+class FetchError(ValueError):
+    """Raised when an image URL cannot be downloaded."""
+
+
+class BatchSlots:
+    """
+    Bounds the batch requests running at once. Each one starts its own
+    fetch pool, inference threads and dispatcher, so without a bound enough
+    concurrent batches would exhaust threads and connections.
+    """
+
+    def __init__(self, limit):
+        self.limit = limit
+        self.count = 0
+        self._lock = threading.Lock()
+
+    def try_acquire(self):
+        with self._lock:
+            if self.count >= self.limit:
+                return False
+            self.count += 1
+            metrics.set_gauge("batch_active_requests", self.count)
+            return True
+
+    def release(self):
+        with self._lock:
+            self.count -= 1
+            metrics.set_gauge("batch_active_requests", self.count)
+
+
+# None when BATCH_MAX_CONCURRENT is 0 (unlimited)
+batch_slots = BatchSlots(BATCH_MAX_CONCURRENT) if BATCH_MAX_CONCURRENT > 0 else None
+
+BATCH_BUSY_ERROR = "Too many batch requests in progress, please retry later"
+
+
+def acquire_batch_slot():
+    """
+    Take a batch slot.
+
+    Returns:
+        (release, retry_after): release() frees the slot once the response
+        is closed; retry_after is None, or the Retry-After for a 503 when
+        every slot is taken
+    """
+    if batch_slots is None:
+        return (lambda: None), None
+    if not batch_slots.try_acquire():
+        metrics.inc("batch_rejected_total")
+        return None, admission_controller.retry_after()
+    return batch_slots.release, None
+
+
+class ItemRequest:
+    """
+    One URL of a batch, exposed with the attributes process_remove_bg reads
+    from a request: form (the batch options plus image_url), files, args and
+    headers of the batch request. Outputs are never streamed, since they
+    are embedded in the NDJSON lines (or stored, with response=reference).
+    """
+
+    def __init__(self, url, options, args, headers):
+        self.form = dict(options, image_url=url, stream="false")
+        self.files = {}
+        self.args = args
+        self.headers = headers
+
+
+def parse_batch_body(body):
+    """
+    Validate a batch request body.
+
+    Args:
+        body: Decoded JSON, {"urls": [...], "order": "completed" | "input", <options>}.
+            Other keys are per-image options as accepted by /remove-bg
+            (model, reuse_mask, fast_path, threshold, ...)
+
+    Returns:
+        (urls, ordered, options) with options as strings, like form fields
+
+    Raises:
+        ValueError: for a malformed body; UnknownModelError for an unknown
+        model; InvalidOptionError for an invalid option
+    """
+    if not isinstance(body, dict):
+        raise ValueError('Expected a JSON object like {"urls": ["https://..."]}')
+    urls = body.get("urls")
+    if not isinstance(urls, list) or not urls or not all(isinstance(url, str) and url for url in urls):
+        raise ValueError('"urls" must be a non-empty list of URLs')
+    if len(urls) > BATCH_MAX_URLS:
+        raise ValueError(f"Too many URLs ({len(urls)}), the limit is {BATCH_MAX_URLS} per request")
+    order = body.get("order", "completed")
+    if order not in ("completed", "input"):
+        raise ValueError('"order" must be "completed" or "input"')
+
+    options = {}
+    for name, value in body.items():
+        if name in ("urls", "order") or value is None:
+            continue
+        options[name] = str(value).lower() if isinstance(value, bool) else str(value)
+    # Fail the whole batch up front rather than every item
+    RemoveBgOptions(ItemRequest("", options, {}, {}))
+    return urls, order == "input", options
+
+
+def item_error(exc):
+    """HTTP status, message and Retry-After (or None) for a failed item"""
+    if isinstance(exc, FetchError):
+        return 502, str(exc), None
+    if isinstance(exc, ImageTooLargeError):
+        return 413, str(exc), None
+    if isinstance(exc, (UnknownModelError, InvalidOptionError)):
+        return 400, str(exc), None
+    if isinstance(exc, AdmissionRejected):
+        return exc.status_code, str(exc), exc.retry_after
+    return 500, str(exc), None
+
+
+class UrlBatch:
+    """
+    Fetch a list of image URLs on a bounded thread pool and run each image
+    through /remove-bg processing as soon as it has arrived.
+
+    At most `prefetch` items are in the window at a time: downloading,
+    waiting for inference, or finished but not yet yielded (in input order,
+    results held back behind a slower earlier item), so memory does not grow
+    with the batch size. Inference goes through
+    admission control and rate limiting like any other request, with at most
+    `inference_workers` items of the batch running or queued at once.
+    """
+
+    def __init__(self, urls, options, args, headers, client_id, request_id, logger,
+                 server_software="", fetch_workers=None, prefetch=None, inference_workers=None):
+        self.urls = urls
+        self.options = options
+        self.args = args
+        self.headers = headers
+        self.client_id = client_id
+        self.request_id = request_id
+        self.logger = logger
+        self.server_software = server_software
+        self.fetch_workers = max(1, min(fetch_workers or BATCH_FETCH_WORKERS, len(urls)))
+        self.prefetch = max(self.fetch_workers, prefetch or BATCH_PREFETCH)
+        self.inference_workers = max(1, inference_workers or BATCH_INFERENCE_WORKERS or MAX_CONCURRENT_INFERENCES)
+
+        self.fetched = queue.Queue()
+        self.results = queue.Queue()
+        self._window = threading.Semaphore(self.prefetch)
+        self._cancelled = threading.Event()
+        self._session = requests.Session()
+        self._session.headers.update(URL_FETCH_HEADERS)
+        self._session.mount("http://", requests.adapters.HTTPAdapter(pool_maxsize=self.fetch_workers))
+        self._session.mount("https://", requests.adapters.HTTPAdapter(pool_maxsize=self.fetch_workers))
+
+    def _fetch(self, index, url):
+        start = time.time()
+        try:
+            content, error = fetch_url_content(self._session, url), None
+        except ImageTooLargeError as e:
+            content, error = None, e
+        except requests.RequestException as e:
+            content, error = None, FetchError(f"Error reading image_url: {str(e)}")
+        fetch_time = time.time() - start
+        metrics.observe("batch_fetch_seconds", fetch_time)
+        self.fetched.put((index, url, content, error, fetch_time))
+
+    def _dispatch(self):
+        """Start fetches in input order, keeping at most `prefetch` images ahead of inference."""
+        with ThreadPoolExecutor(max_workers=self.fetch_workers, thread_name_prefix="batch-fetch") as pool:
+            for index, url in enumerate(self.urls):
+                while not self._window.acquire(timeout=0.5):
+                    if self._cancelled.is_set():
+                        break
+                if self._cancelled.is_set():
+                    break
+                pool.submit(self._fetch, index, url)
+        for _ in range(self.inference_workers):
+            self.fetched.put(_DONE)
+
+    def _process(self, index, url, content, error, fetch_time):
+        item = {"index": index, "url": url, "fetch_seconds": round(fetch_time, 4)}
+        start = time.time()
+        try:
+            if error is not None:
+                raise error
+            if self._cancelled.is_set():
+                raise RuntimeError("Batch cancelled")
+            item_id = f"{self.request_id}/{index}"
+            req = ItemRequest(url, self.options, self.args, self.headers)
+            with request_memory(item_id, self.logger, self.server_software):
+                result = process_remove_bg(req, item_id, self.client_id, self.logger, url_content=content)
+            item.update(status=200, headers=result.headers, width=result.size[0], height=result.size[1])
+            if result.reference is not None:
+                item["result"] = result.reference
+            else:
+                item["image_b64"] = base64.b64encode(result.buf.getvalue()).decode("ascii")
+        except Exception as e:
+            status, message, retry_after = item_error(e)
+            self.logger.warning(f"[{self.request_id}] Item {index} failed ({status}): {message}")
+            item.update(status=status, error=message)
+            if retry_after is not None:
+                item["retry_after"] = retry_after
+        item["seconds"] = round(time.time() - start, 4)
+        metrics.inc("batch_items_total", status=item["status"])
+        return item
+
+    def _inference_worker(self):
+        while True:
+            entry = self.fetched.get()
+            if entry is _DONE:
+                break
+            self.results.put(self._process(*entry))
+
+    def _completed(self):
+        """
+        Yield results as they complete. Each still holds its window slot;
+        the caller releases it when the result leaves the batch.
+        """
+        threads = [threading.Thread(target=self._dispatch, daemon=True)]
+        threads += [threading.Thread(target=self._inference_worker, daemon=True) for _ in range(self.inference_workers)]
+        for thread in threads:
+            thread.start()
+        try:
+            for _ in range(len(self.urls)):
+                yield self.results.get()
+        finally:
+            # Client went away (or we are done): stop fetching, skip the rest
+            self._cancelled.set()
+            self._session.close()
+
+    def __iter__(self):
+        """
+        Yield one result dict per URL as it completes (see ordered() for
+        input order); closing the iterator cancels the batch.
+        """
+        for item in self._completed():
+            # Let the next fetch start now that this result is handed on
+            self._window.release()
+            yield item
+
+    def ordered(self):
+        """
+        Yield results in input order, holding back those that finish early.
+
+        Held-back results keep their window slots, so a slow item stalls
+        new fetches instead of letting finished results pile up behind it.
+        The next result due is always the earliest item in the window, so
+        it has been dispatched already and the batch cannot stall on it.
+        """
+        waiting = {}
+        next_index = 0
+        for item in self._completed():
+            waiting[item["index"]] = item
+            while next_index in waiting:
+                self._window.release()
+                yield waiting.pop(next_index)
+                next_index += 1
+
+
+def iter_ndjson(batch, ordered=False):
+    """Stream a batch as newline-delimited JSON: one line per URL, then a summary line."""
+    start = time.time()
+    succeeded = failed = 0
+    for item in (batch.ordered() if ordered else batch):
+        if item["status"] == 200:
+            succeeded += 1
+        else:
+            failed += 1
+        yield json.dumps(item) + "\n"
+    elapsed = time.time() - start
+    batch.logger.info(f"[{batch.request_id}] Batch finished: {succeeded} succeeded, {failed} failed in {elapsed:.4f}s")
+    yield json.dumps({"summary": {"total": len(batch.urls), "succeeded": succeeded, "failed": failed,
+                                  "elapsed_seconds": round(elapsed, 4)}}) + "\n"
+
+
+@batch_urls_bp.route("/remove-bg/batch", methods=["POST"])
+def remove_bg_batch():
+    """Remove backgrounds from a list of image URLs, streaming NDJSON results per URL"""
+    try:
+        urls, ordered, options = parse_batch_body(request.get_json(silent=True))
+    except ValueError as e:
+        current_app.logger.warning(f"[{g.request_id}] Invalid batch request: {str(e)}")
+        return jsonify({"error": str(e)}), 400
+
+    release, retry_after = acquire_batch_slot()
+    if release is None:
+        current_app.logger.warning(f"[{g.request_id}] Rejected: too many batch requests already running")
+        return jsonify({"error": BATCH_BUSY_ERROR}), 503, {"Retry-After": str(retry_after)}
+
+    current_app.logger.info(f"[{g.request_id}] Processing batch of {len(urls)} URLs ({'input' if ordered else 'completion'} order)")
+    # The response body is produced after this function returns, so take
+    # copies of everything the batch needs from the request
+    batch = UrlBatch(
+        urls, options, MultiDict(request.args), Headers(request.headers), g.client_id, g.request_id,
+        current_app._get_current_object().logger, request.environ.get("SERVER_SOFTWARE", ""),
+    )
+    response = Response(iter_ndjson(batch, ordered), mimetype="application/x-ndjson")
+    # Runs when the server closes the response, even if the body never started
+    response.call_on_close(release)
+    return response
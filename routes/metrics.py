@@ -0,0 +1,27 @@
+# routes/metrics.py
+from flask import Blueprint, jsonify
+from utils.metrics import metrics
+from utils.admission import admission_controller
+from models.mask_cache import phash_index
+from models.model_registry import model_registry
+from utils.result_store import result_store
+from models.source_cache import source_cache
+from utils.rate_limit import rate_limiter
+
+metrics_bp = Blueprint("metrics", __name__)
+
+@metrics_bp.route("/metrics", methods=["GET"])
+def get_metrics():
+    """Return in-process counters, gauges and latency histograms for this worker"""
+    return jsonify(metrics_snapshot())
+
+def metrics_snapshot():
+    """Metrics payload shared by the Flask and ASGI apps"""
+    snapshot = metrics.snapshot()
+    snapshot["admission"] = admission_controller.stats()
+    snapshot["phash_cache"] = phash_index.stats() if phash_index is not None else None
+    snapshot["models"] = model_registry.stats()
+    snapshot["result_store"] = result_store.stats() if result_store is not None else None
+    snapshot["source_cache"] = source_cache.stats() if source_cache is not None else None
+    snapshot["rate_limit"] = rate_limiter.stats() if rate_limiter is not None else None
+    return snapshot
@@ -1,6 +1,8 @@
 # routes/ping.py
 from flask import Blueprint, jsonify, current_app, g
-from models.birefnet_model import birefnet_model
+from models.model_registry import model_registry
+from utils.admission import admission_controller
+from utils.memory import memory_monitor
 
 ping_bp = Blueprint("ping", __name__)
 
@@ -13,13 +15,31 @@ def ping():
 @ping_bp.route("/health", methods=["GET"])
 def health_check():
     """Health check endpoint to verify model and API are running"""
-    model_loaded = birefnet_model is not None
+    model_loaded = model_registry.is_loaded()
     
     # Always log health check requests
     current_app.logger.info(f"[{g.request_id}] Health check request received")
     current_app.logger.info(f"[{g.request_id}] Health check: model_loaded={model_loaded}")
     
-    return jsonify({
-        "status": "healthy", 
-        "model_loaded": model_loaded
-    })
\ No newline at end of file
+    return jsonify(health_status())
+
+def health_status():
+    """Health payload shared by the Flask and ASGI apps"""
+    # A worker past its memory ceiling is draining before it restarts
+    memory = memory_monitor.stats()
+    admission = admission_controller.stats()
+    models = model_registry.stats()
+    return {
+        "status": "draining" if memory["recycling"] else "healthy",
+        "model_loaded": model_registry.is_loaded(),
+        "models": models,
+        "admission": admission,
+        "memory": memory,
+        # Summary for load balancers (router.py): requests running or
+        # waiting here, how many run at once, and which models are warm
+        "load": {
+            "queue_depth": admission["active"] + admission["queued"],
+            "capacity": admission["max_concurrent"],
+            "warm": sorted(models["loaded"]),
+        },
+    }
\ No newline at end of file
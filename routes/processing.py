@@ -0,0 +1,272 @@
+# routes/processing.py: /remove-bg processing shared by the Flask (WSGI) and ASGI apps
+import io
+import time
+from contextlib import contextmanager, nullcontext
+from werkzeug.datastructures import FileStorage, MultiDict
+from utils.image_utils import open_input_image, decode_image, source_fingerprint
+from utils.rate_limit import charged_admission, request_cost
+from utils.request_options import get_option, get_bool_option, get_refinement_options, InvalidOptionError
+from utils.profiling import profiling_requested, RequestProfiler
+from utils.memory import memory_monitor
+from utils.metrics import metrics
+from utils.png_stream import PngStream
+from utils.result_store import result_store
+from models.bg_remover import get_mask, apply_mask
+from models.mask_refinement import refine_mask, RefinementOptions
+from models.model_registry import model_registry
+from models.source_cache import source_cache
+from config import MAX_INPUT_MEGAPIXELS, FAST_PATHS_ENABLED, STREAM_OUTPUT_MIN_MEGAPIXELS, SOURCE_CACHE_HIT_COST
+
+def is_raw_upload(content_type):
+    """Whether a request body with this Content-Type is the image itself."""
+    content_type = (content_type or "").split(";")[0].strip().lower()
+    return content_type.startswith("image/") or content_type == "application/octet-stream"
+
+class RawUploadRequest:
+    """
+    A /remove-bg request whose body is the image itself (Content-Type
+    image/* or application/octet-stream), exposed like a form upload: the
+    body as image_file (absent when the body is empty), options from the
+    query string and headers.
+    """
+
+    def __init__(self, body, args, headers, remote_addr=None):
+        self.form = MultiDict()
+        self.files = MultiDict({"image_file": FileStorage(io.BytesIO(body), filename="body")} if body else {})
+        self.args = args
+        self.headers = headers
+        self.remote_addr = remote_addr
+
+class RemoveBgOptions:
+    """
+    Validated per-request options of /remove-bg.
+
+    Reading them up front makes a malformed request fail before any work,
+    and lets /remove-bg/batch check its shared options once for all URLs.
+
+    Raises:
+        InvalidOptionError or UnknownModelError
+    """
+
+    def __init__(self, req):
+        # Model by registry name (X-Model header or "model" field)
+        self.model_name = model_registry.resolve(req.headers.get("X-Model") or get_option(req, "model"))
+        # Allow reusing the mask of a near-duplicate image
+        self.reuse_mask = get_bool_option(req, "reuse_mask", True)
+        # Allow trivial inputs to skip the model
+        self.fast_path = get_bool_option(req, "fast_path", FAST_PATHS_ENABLED)
+        # Mask refinements (threshold, feather, holes, islands, edges, sky)
+        self.refinement = RefinementOptions(**get_refinement_options(req))
+        # Encode the PNG while sending it (default: by output size)
+        self.stream = get_bool_option(req, "stream", None)
+        # "image" returns the PNG, "reference" stores it and returns its ID,
+        # size and dimensions as JSON
+        self.response_mode = get_option(req, "response", "image")
+        if self.response_mode not in ("image", "reference"):
+            raise InvalidOptionError(f'Invalid value for response: {self.response_mode!r} (expected "image" or "reference")')
+        if self.response_mode == "reference" and result_store is None:
+            raise InvalidOptionError("response=reference is not available: the result store is disabled")
+        # Priority lane ("small", "medium", "large"); only a larger lane than
+        # the input size implies is honoured
+        self.tier = req.headers.get("X-Priority-Lane") or get_option(req, "lane")
+
+class RemoveBgResult:
+    """
+    PNG output of a /remove-bg request and the response headers that describe it.
+
+    Small outputs are encoded into buf; large ones are left to stream, an
+    iterable PngStream encoding while the response is sent (buf is None).
+    With response=reference the output is in the result store instead, and
+    reference holds the JSON body describing it.
+    """
+
+    def __init__(self, buf, headers, size, stream=None, start_time=None, reference=None):
+        self.buf = buf
+        self.headers = headers
+        self.size = size
+        self.stream = stream
+        self.start_time = start_time
+        self.reference = reference
+
+@contextmanager
+def request_memory(request_id, logger, server_software=""):
+    """
+    Track RSS growth (and CUDA tensor peak) of a request, log it afterwards and
+    recycle the worker once it has grown past WORKER_MAX_RSS_MB
+    """
+    memory = memory_monitor.start()
+    try:
+        yield memory
+    finally:
+        memory_monitor.finish(memory)
+        logger.info(f"[{request_id}] Memory: peak RSS +{memory.rss_delta / 2**20:.1f} MB, retained {memory.retained / 2**20:+.1f} MB, worker RSS {memory.rss_end / 2**20:.1f} MB" + (f", tensor peak {memory.tensor_peak / 2**20:.1f} MB" if memory.tensor_peak is not None else ""))
+        # Replace this worker once it has grown past the ceiling; gunicorn
+        # lets in-flight requests (including this one) finish first
+        if memory_monitor.should_recycle():
+            memory_monitor.recycle(server_software)
+
+def process_remove_bg(req, request_id, client_id, logger, url_content=None):
+    """
+    Run a /remove-bg request: options, rate limit, admission, decode, mask and PNG encode
+
+    Args:
+        req: Request with form, args, files and headers mappings (Flask's
+            request, or an equivalent adapter)
+        request_id: ID used in log lines and trace names
+        client_id: Client identity for rate limiting and fair queueing
+        logger: Logger for progress messages
+        url_content: Bytes already fetched for image_url, if any
+
+    Returns:
+        RemoveBgResult
+
+    Raises:
+        ImageTooLargeError, AdmissionRejected (incl. RateLimited),
+        UnknownModelError, InvalidOptionError or ValueError
+    """
+    start_process_time = time.time()
+
+    options = RemoveBgOptions(req)
+    model_name = options.model_name
+    reuse_mask = options.reuse_mask
+    fast_path = options.fast_path
+    refinement = options.refinement
+    stream = options.stream
+    response_mode = options.response_mode
+
+    # Open input image from request (header only, pixels are not decoded yet)
+    image_load_start = time.time()
+    input_image = open_input_image(req, max_megapixels=MAX_INPUT_MEGAPIXELS, url_content=url_content)
+    pixels = input_image.width * input_image.height
+
+    # A repeated source reuses its decoded image and unrefined mask, so
+    # only refinement and encoding run again
+    cache_key = cached = None
+    fingerprint = source_fingerprint(req, url_content) if source_cache is not None else None
+    if fingerprint is not None:
+        cache_key = source_cache.key(fingerprint, model_name, fast_path, reuse_mask)
+        cached = source_cache.get(cache_key)
+
+    # Charge the client's token bucket by input size, then wait for an
+    # inference slot; decoding happens inside it so the pixel budget also
+    # bounds decoded image memory. A hit with its decoded image cached runs
+    # no model, so it is charged SOURCE_CACHE_HIT_COST and takes only pixel
+    # budget (refinement and compositing still allocate full-size copies).
+    # Admin-only opt-in: profile decode, inference and encode of this request
+    profiler = RequestProfiler(request_id) if profiling_requested(req) else None
+    if cached is not None and cached.image is not None:
+        admit = charged_admission(client_id, request_cost(pixels * SOURCE_CACHE_HIT_COST), pixels,
+                                  tier=options.tier, slot=False)
+    else:
+        admit = charged_admission(client_id, request_cost(pixels), pixels, tier=options.tier)
+    with admit as admission, (profiler if profiler is not None else nullcontext()):
+        if cached is None and cache_key is not None:
+            # An identical request that ran while this one queued may have
+            # stored the source meanwhile
+            cached = source_cache.get(cache_key)
+        if cached is not None and cached.image is not None:
+            original_image = cached.image
+        else:
+            original_image = decode_image(input_image)
+        image_load_time = time.time() - image_load_start
+
+        logger.info(f"[{request_id}] Image loaded successfully: {original_image.size}, mode: {original_image.mode}, load_time: {image_load_time:.4f}s")
+
+        # Process the image with the background removal function
+        process_start = time.time()
+        logger.info(f"[{request_id}] Starting background removal process")
+
+        if cached is not None:
+            mask_image, mask_source = cached.mask, "source_cache"
+            metrics.inc("mask_source_total", source=mask_source)
+        else:
+            mask_image, mask_source = get_mask(original_image, reuse_mask=reuse_mask, fast_path=fast_path, model_name=model_name)
+            if cache_key is not None:
+                cached = source_cache.put(cache_key, original_image, mask_image, mask_source)
+        mask_image = refine_mask(original_image, mask_image, refinement)
+        # A cached image is shared with later requests, so it gets no alpha itself
+        shared = cached is not None and cached.image is original_image
+        output_image = apply_mask(original_image, mask_image, in_place=not shared)
+        process_time = time.time() - process_start
+
+        logger.info(f"[{request_id}] Background removal completed in {process_time:.4f}s (model: {model_name}, mask source: {mask_source})")
+
+        if response_mode == "reference":
+            stream = False
+        elif stream is None:
+            stream = bool(STREAM_OUTPUT_MIN_MEGAPIXELS) and pixels >= STREAM_OUTPUT_MIN_MEGAPIXELS * 1_000_000
+
+        # Return the output as a PNG with transparency. Streamed outputs are
+        # encoded after the inference slot is released, at the pace the
+        # client reads, so a slow client does not hold the slot
+        buf = stored = None
+        save_start = time.time()
+        if response_mode == "reference":
+            # Encoded straight into the store, never buffered whole
+            stored = result_store.put(PngStream(output_image))
+        elif not stream:
+            buf = io.BytesIO()
+            output_image.save(buf, format="PNG")
+            buf.seek(0)
+        save_time = time.time() - save_start
+
+    total_time = time.time() - start_process_time
+    logger.info(f"[{request_id}] Total processing time: {total_time:.4f}s (Load: {image_load_time:.4f}s, Process: {process_time:.4f}s, Save: {'streamed' if stream else f'{save_time:.4f}s'})")
+    if stored is not None:
+        logger.info(f"[{request_id}] Stored result {stored.id} ({stored.size} bytes, size: {output_image.size}, lane: {admission.lane}, queue_wait: {admission.queue_wait:.4f}s)")
+    else:
+        logger.info(f"[{request_id}] Sending processed image to client (size: {output_image.size}, lane: {admission.lane}, queue_wait: {admission.queue_wait:.4f}s)")
+
+    headers = {
+        "X-Priority-Lane": admission.lane,
+        "X-Queue-Wait": f"{admission.queue_wait:.4f}",
+        "X-Mask-Source": mask_source,
+        "X-Model": model_name,
+    }
+    if mask_source not in ("model", "phash_cache", "source_cache"):
+        headers["X-Bypass"] = mask_source
+    if profiler is not None:
+        # "busy" when another request was being profiled at the time
+        headers["X-Profile-Trace"] = request_id if profiler.active else "busy"
+    if stored is not None:
+        reference = {
+            "id": stored.id,
+            "url": f"/results/{stored.id}",
+            "size": stored.size,
+            "width": output_image.width,
+            "height": output_image.height,
+            "content_type": "image/png",
+            "expires_at": int(stored.expires_at),
+        }
+        return RemoveBgResult(None, headers, output_image.size, start_time=start_process_time, reference=reference)
+    if stream:
+        return RemoveBgResult(None, headers, output_image.size, PngStream(output_image), start_process_time)
+    # A buffered response starts once it is complete
+    metrics.observe("response_ttfb_seconds", total_time, encoding="buffered")
+    return RemoveBgResult(buf, headers, output_image.size, start_time=start_process_time)
+
+
+def iter_streamed_output(result, request_id, logger, on_close=None):
+    """
+    Yield the chunks of a streamed result, then log and record its
+    time-to-first-byte (from the start of the request) and encode time
+
+    Args:
+        result: RemoveBgResult with a stream
+        request_id: ID used in log lines
+        logger: Logger for the summary line
+        on_close: Optional callable run once the stream is finished or
+            abandoned (e.g. ending the request's memory tracking)
+    """
+    stream = result.stream
+    ttfb = None
+    try:
+        for chunk in stream:
+            if ttfb is None:
+                ttfb = time.time() - result.start_time
+            yield chunk
+        metrics.observe("response_ttfb_seconds", ttfb, encoding="stream")
+        logger.info(f"[{request_id}] Streamed {stream.bytes_sent} bytes in {stream.chunks_sent} chunks (TTFB: {ttfb:.4f}s, Encode: {stream.encode_seconds:.4f}s, Total: {time.time() - result.start_time:.4f}s)")
+    finally:
+        if on_close is not None:
+            on_close()
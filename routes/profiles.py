@@ -0,0 +1,45 @@
+# routes/profiles.py
+import os
+from flask import Blueprint, jsonify, request, send_from_directory
+from utils.profiling import is_admin, list_traces, is_trace_file
+from config import PROFILING_ADMIN_TOKEN, PROFILE_TRACE_DIR
+
+profiles_bp = Blueprint("profiles", __name__)
+
+def profiles_error(req, name=None):
+    """
+    Check access to /profiles (shared by the Flask and ASGI apps)
+
+    Args:
+        req: Request with a headers mapping
+        name: Trace file name for /profiles/<name>, if any
+
+    Returns:
+        (error message, HTTP status), or None when the request may proceed
+    """
+    if not PROFILING_ADMIN_TOKEN:
+        return "Profiling is disabled", 404
+    if not is_admin(req):
+        return "Admin token required", 403
+    if name is not None:
+        if not is_trace_file(name):
+            return "Invalid trace name", 400
+        if not os.path.isfile(os.path.join(PROFILE_TRACE_DIR, name)):
+            return "Trace not found", 404
+    return None
+
+@profiles_bp.route("/profiles", methods=["GET"])
+def get_profiles():
+    """List the profiling traces written by this server, newest first"""
+    error = profiles_error(request)
+    if error is not None:
+        return jsonify({"error": error[0]}), error[1]
+    return jsonify({"traces": list_traces()})
+
+@profiles_bp.route("/profiles/<name>", methods=["GET"])
+def download_profile(name):
+    """Download one trace file (see GET /profiles for names)"""
+    error = profiles_error(request, name)
+    if error is not None:
+        return jsonify({"error": error[0]}), error[1]
+    return send_from_directory(os.path.abspath(PROFILE_TRACE_DIR), name, as_attachment=True)
@@ -1,10 +1,13 @@
-import io
 import logging
 import time
-from flask import Blueprint, request, send_file, jsonify, current_app, g
-from PIL import Image
-from utils.image_utils import get_input_image
-from models.bg_remover import remove
+from contextlib import ExitStack
+from flask import Blueprint, request, send_file, jsonify, current_app, g, Response, stream_with_context
+from werkzeug.exceptions import RequestEntityTooLarge
+from utils.image_utils import ImageTooLargeError
+from utils.admission import AdmissionRejected
+from models.model_registry import UnknownModelError
+from utils.request_options import InvalidOptionError
+from routes.processing import process_remove_bg, request_memory, iter_streamed_output, is_raw_upload, RawUploadRequest
 
 remove_bg_bp = Blueprint("remove_bg", __name__)
 
@@ -12,11 +15,24 @@ remove_bg_bp = Blueprint("remove_bg", __name__)
 def remove_bg():
     # Always track timing
     start_process_time = time.time()
-    
+    # Track RSS growth (and CUDA tensor peak) of this request
+    with ExitStack() as memory:
+        memory.enter_context(request_memory(g.request_id, current_app.logger, request.environ.get("SERVER_SOFTWARE", "")))
+        return _remove_bg(start_process_time, memory)
+
+def _remove_bg(start_process_time, memory):
     try:
+        # Raw uploads: the body is the image, options are in the query string
+        req = request
+        if is_raw_upload(request.content_type):
+            req = RawUploadRequest(request.get_data(), request.args, request.headers, request.remote_addr)
+
         # Always log request details
         input_method = ""
-        if 'image_file' in request.files:
+        if req is not request and 'image_file' in req.files:
+            input_method = "raw_upload"
+            current_app.logger.info(f"[{g.request_id}] Processing raw upload ({request.content_length or 0} bytes, {request.content_type})")
+        elif 'image_file' in request.files:
             input_method = "file_upload"
             current_app.logger.info(f"[{g.request_id}] Processing file upload")
         elif 'image_url' in request.form:
@@ -27,41 +43,44 @@ def remove_bg():
             input_method = "base64"
             current_app.logger.info(f"[{g.request_id}] Processing base64 image ({len(request.form['image_file_b64'])//1024} KB)")
         else:
-            current_app.logger.warning(f"[{g.request_id}] Invalid request: no image provided. Please use form-data with one of: image_file, image_file_b64, or image_url")
-            return jsonify({"error": "No image provided. Please use form-data with one of: image_file, image_file_b64, or image_url"}), 400
+            current_app.logger.warning(f"[{g.request_id}] Invalid request: no image provided. Please use form-data with one of: image_file, image_file_b64, or image_url, or send the image as the body")
+            return jsonify({"error": "No image provided. Please use form-data with one of: image_file, image_file_b64, or image_url, or send the image as the body"}), 400
             
-        # Get input image from request
-        image_load_start = time.time()
-        original_image = get_input_image(request)
-        image_load_time = time.time() - image_load_start
-        
-        current_app.logger.info(f"[{g.request_id}] Image loaded successfully: {original_image.size}, mode: {original_image.mode}, load_time: {image_load_time:.4f}s")
-        
-        # Process the image with the background removal function
-        process_start = time.time()
-        current_app.logger.info(f"[{g.request_id}] Starting background removal process")
-        
-        output_image = remove(original_image)
-        process_time = time.time() - process_start
-        
-        current_app.logger.info(f"[{g.request_id}] Background removal completed in {process_time:.4f}s")
+        result = process_remove_bg(req, g.request_id, g.client_id, current_app.logger)
+
+        if result.reference is not None:
+            # Stored; the caller fetches it from GET /results/<id>
+            response = jsonify(result.reference)
+        elif result.stream is not None:
+            # Chunked: the PNG is encoded while it is sent, and memory is
+            # tracked until the stream is done
+            chunks = iter_streamed_output(result, g.request_id, current_app.logger, on_close=memory.pop_all().close)
+            response = Response(stream_with_context(chunks), mimetype="image/png")
+            response.headers["Content-Disposition"] = "inline; filename=output.png"
+        else:
+            response = send_file(result.buf, mimetype="image/png", as_attachment=False, download_name="output.png")
+        response.headers.update(result.headers)
+        return response
+
+    except ImageTooLargeError as e:
+        current_app.logger.warning(f"[{g.request_id}] Rejected oversized image: {str(e)}")
+        return jsonify({"error": str(e)}), 413
+
+    except (UnknownModelError, InvalidOptionError) as e:
+        current_app.logger.warning(f"[{g.request_id}] {str(e)}")
+        return jsonify({"error": str(e)}), 400
+
+    except AdmissionRejected as e:
+        current_app.logger.warning(f"[{g.request_id}] Rejected by admission control ({e.status_code}): {str(e)}, retry after {e.retry_after}s")
+        return jsonify({"error": str(e)}), e.status_code, {"Retry-After": str(e.retry_after)}
 
-        # Return the output as a PNG with transparency
-        buf = io.BytesIO()
-        save_start = time.time()
-        output_image.save(buf, format="PNG")
-        save_time = time.time() - save_start
-        buf.seek(0)
-        
-        total_time = time.time() - start_process_time
-        current_app.logger.info(f"[{g.request_id}] Total processing time: {total_time:.4f}s (Load: {image_load_time:.4f}s, Process: {process_time:.4f}s, Save: {save_time:.4f}s)")
-        current_app.logger.info(f"[{g.request_id}] Sending processed image to client (size: {output_image.size})")
-        
-        return send_file(buf, mimetype="image/png", as_attachment=False, download_name="output.png")
+    except RequestEntityTooLarge:
+        # Body over MAX_UPLOAD_MB, answered by the app's 413 handler
+        raise
 
     except Exception as e:
         error_time = time.time() - start_process_time
         current_app.logger.error(f"[{g.request_id}] Error in background removal after {error_time:.4f}s: {str(e)}")
         import traceback
         current_app.logger.error(f"[{g.request_id}] Traceback: {traceback.format_exc()}")
-        return jsonify({"error": str(e)}), 500
\ No newline at end of file
+        return jsonify({"error": str(e)}), 500
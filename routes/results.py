@@ -0,0 +1,51 @@
+# routes/results.py: GET /results/<id>, results stored by /remove-bg with response=reference
+from flask import Blueprint, jsonify, send_file
+from werkzeug.http import parse_etags
+from utils.result_store import result_store, is_result_id
+
+results_bp = Blueprint("results", __name__)
+
+RESULT_GONE = "Result not found or expired"
+
+@results_bp.route("/results/<result_id>", methods=["GET"])
+def get_result(result_id):
+    """Serve a stored result, with ETag (its content hash), conditional requests and byte ranges"""
+    stored, error = find_result(result_id)
+    if error is not None:
+        return jsonify({"error": error[0]}), error[1]
+    try:
+        # Content-addressed, so the bytes behind an ID never change
+        response = send_file(stored.path, mimetype="image/png", etag=stored.id, conditional=True,
+                             max_age=result_store.cache_max_age(stored))
+    except FileNotFoundError:
+        # Evicted between the lookup and the open
+        return jsonify({"error": RESULT_GONE}), 404
+    response.cache_control.immutable = True
+    return response
+
+def find_result(result_id):
+    """
+    Look up a result for GET /results/<id> (shared by the Flask and ASGI apps)
+
+    Returns:
+        (StoredResult, None), or (None, (error message, HTTP status))
+    """
+    if result_store is None:
+        return None, ("The result store is disabled", 404)
+    if not is_result_id(result_id):
+        return None, ("Invalid result ID", 400)
+    stored = result_store.get(result_id)
+    if stored is None:
+        return None, (RESULT_GONE, 404)
+    return stored, None
+
+def result_headers(stored):
+    """ETag and Cache-Control of a stored result, as send_file() sets them in the Flask app"""
+    return {
+        "ETag": f'"{stored.id}"',
+        "Cache-Control": f"public, max-age={result_store.cache_max_age(stored)}, immutable",
+    }
+
+def is_not_modified(stored, if_none_match):
+    """Whether an If-None-Match header value matches the result (weak comparison, as for GET)"""
+    return parse_etags(if_none_match).contains_weak(stored.id)
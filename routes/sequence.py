@@ -0,0 +1,282 @@
+# routes/sequence.py: POST /remove-bg/sequence, alpha masks for product spins and short clips
+import io
+import json
+import tarfile
+import time
+import traceback
+import zipfile
+
+from flask import Blueprint, request, send_file, jsonify, current_app, g
+from PIL import Image, ImageSequence
+from werkzeug.exceptions import RequestEntityTooLarge
+
+from utils.image_utils import ImageTooLargeError, check_image_size, decode_image
+from utils.admission import AdmissionRejected
+from utils.rate_limit import charged_admission, request_cost
+from utils.request_options import get_option, get_bool_option, get_float_option, get_int_option, get_refinement_options, InvalidOptionError
+from models.sequence import sequence_masks
+from models.mask_refinement import refine_mask, RefinementOptions
+from models.model_registry import model_registry, UnknownModelError
+from routes.processing import request_memory
+from config import (
+    MAX_INPUT_MEGAPIXELS, SEQUENCE_MAX_FRAMES, SEQUENCE_MAX_MEGAPIXELS, SEQUENCE_MAX_FRAME_MB, SEQUENCE_MAX_ARCHIVE_MB,
+    SEQUENCE_DECODE_COST,
+    SEQUENCE_DIFF_THRESHOLD, SEQUENCE_KEYFRAME_INTERVAL, SEQUENCE_BATCH_SIZE,
+)
+
+sequence_bp = Blueprint("sequence", __name__)
+
+IMAGE_EXTENSIONS = (".png", ".jpg", ".jpeg", ".webp", ".bmp", ".tif", ".tiff")
+
+NO_FRAMES_ERROR = "No frames provided. Please use form-data with repeated frames files, an archive (zip/tar) or an animation (GIF/WebP/APNG)"
+
+
+class SequenceInputError(ValueError):
+    """Raised when the uploaded frames cannot be used."""
+
+
+class SequenceResult:
+    """Zip of per-frame outputs and the response headers that describe it"""
+
+    def __init__(self, buf, headers):
+        self.buf = buf
+        self.headers = headers
+
+
+def _archive_members(stream):
+    """
+    (name, bytes) of the image files in a zip or tar archive, sorted by name.
+
+    Nothing is decompressed until the archive index passes the frame count
+    and size limits, and each member's image header is checked against
+    MAX_INPUT_MEGAPIXELS before the member is read in full.
+    """
+    data = io.BytesIO(stream.read())
+    if zipfile.is_zipfile(data):
+        with zipfile.ZipFile(data) as archive:
+            infos = [info for info in archive.infolist() if not info.is_dir() and _is_image_name(info.filename)]
+            _check_members([(info.filename, info.file_size) for info in infos])
+            # A zip member never yields more than its declared file_size
+            members = [(info.filename, _read_member(info.filename, archive.open(info))) for info in infos]
+    else:
+        data.seek(0)
+        try:
+            with tarfile.open(fileobj=data) as archive:
+                infos = [info for info in archive.getmembers() if info.isfile() and _is_image_name(info.name)]
+                _check_members([(info.name, info.size) for info in infos])
+                members = [(info.name, _read_member(info.name, archive.extractfile(info))) for info in infos]
+        except tarfile.TarError:
+            raise SequenceInputError("archive must be a zip or tar file")
+    return sorted(members, key=lambda member: member[0])
+
+
+def _check_members(members):
+    """Enforce the frame count and byte limits on (name, uncompressed size) pairs from an archive index"""
+    _check_frame_count(len(members))
+    for name, size in members:
+        if size > SEQUENCE_MAX_FRAME_MB * 2**20:
+            raise ImageTooLargeError(f"Archive member {name} is {size / 2**20:.1f} MB, which exceeds the limit of {SEQUENCE_MAX_FRAME_MB:g} MB per frame")
+    total = sum(size for _, size in members)
+    if total > SEQUENCE_MAX_ARCHIVE_MB * 2**20:
+        raise ImageTooLargeError(f"Archive frames are {total / 2**20:.1f} MB uncompressed, which exceeds the limit of {SEQUENCE_MAX_ARCHIVE_MB:g} MB")
+
+
+def _read_member(name, member):
+    """Read an archive member once its image header is known to be within the size limit"""
+    with member:
+        try:
+            header = Image.open(member)
+        except Exception as e:
+            raise SequenceInputError(f"Error reading frame {name}: {str(e)}")
+        check_image_size(header, MAX_INPUT_MEGAPIXELS)
+        member.seek(0)
+        return member.read()
+
+
+def _check_frame_count(count):
+    if count > SEQUENCE_MAX_FRAMES:
+        raise SequenceInputError(f"Too many frames ({count}), the limit is {SEQUENCE_MAX_FRAMES}")
+
+
+def _is_image_name(name):
+    base = name.rsplit("/", 1)[-1]
+    return not base.startswith(".") and base.lower().endswith(IMAGE_EXTENSIONS)
+
+
+def _open_frames(req):
+    """
+    Open the frames of a request (frames files, archive or animation) without decoding them
+
+    Returns:
+        (headers, iter_frames): an opened image per frame, for sizes, and a
+        callable yielding the frames to decode in order
+    """
+    if "frames" in req.files:
+        frames = [Image.open(upload.stream) for upload in req.files.getlist("frames")]
+    elif "archive" in req.files:
+        frames = [Image.open(io.BytesIO(data)) for _, data in _archive_members(req.files["archive"].stream)]
+    elif "animation" in req.files:
+        animation = Image.open(req.files["animation"].stream)
+        _check_frame_count(getattr(animation, "n_frames", 1))
+        # Every frame of an animation has the canvas size
+        return [animation] * getattr(animation, "n_frames", 1), lambda: ImageSequence.Iterator(animation)
+    else:
+        raise SequenceInputError(NO_FRAMES_ERROR)
+    return frames, lambda: frames
+
+
+def open_frames(req):
+    """
+    Open the frames of a request without decoding them, enforcing the frame and size limits.
+
+    Returns:
+        (pixels, read): total pixels, and a callable that decodes the frames
+        into a list of PIL Images (RGB, or RGBA when the source has alpha)
+    """
+    try:
+        headers, iter_frames = _open_frames(req)
+    except (SequenceInputError, ImageTooLargeError):
+        raise
+    except Exception as e:
+        raise SequenceInputError(f"Error reading frames: {str(e)}")
+    if not headers:
+        raise SequenceInputError("No image frames found in the request")
+    _check_frame_count(len(headers))
+    for header in headers:
+        check_image_size(header, MAX_INPUT_MEGAPIXELS)
+    pixels = sum(header.width * header.height for header in headers)
+    if pixels / 1_000_000 > SEQUENCE_MAX_MEGAPIXELS:
+        raise ImageTooLargeError(f"Sequence is {pixels / 1_000_000:.1f} MP in total, which exceeds the limit of {SEQUENCE_MAX_MEGAPIXELS:g} MP")
+
+    def read():
+        try:
+            return [decode_image(frame) for frame in iter_frames()]
+        except ValueError as e:
+            raise SequenceInputError(str(e))
+        except Exception as e:
+            raise SequenceInputError(f"Error reading frames: {str(e)}")
+
+    return pixels, read
+
+
+def process_sequence(req, request_id, client_id, logger):
+    """
+    Run a /remove-bg/sequence request: read frames, plan keyframes, batched
+    inference, reuse/warp masks for the other frames and zip the outputs
+
+    Args:
+        req: Request with form, args, files (with getlist) and headers mappings
+        request_id: ID used in log lines
+        client_id: Client identity for rate limiting and fair queueing
+        logger: Logger for progress messages
+
+    Returns:
+        SequenceResult
+
+    Raises:
+        SequenceInputError, ImageTooLargeError, AdmissionRejected (incl.
+        RateLimited), UnknownModelError, InvalidOptionError or ValueError
+    """
+    start_process_time = time.time()
+
+    model_name = model_registry.resolve(req.headers.get("X-Model") or get_option(req, "model"))
+    diff_threshold = get_float_option(req, "diff_threshold", SEQUENCE_DIFF_THRESHOLD)
+    keyframe_interval = get_int_option(req, "keyframe_interval", SEQUENCE_KEYFRAME_INTERVAL)
+    warp = get_bool_option(req, "warp", True)
+    output = get_option(req, "output", "alpha")
+    if output not in ("alpha", "rgba"):
+        raise SequenceInputError('output must be "alpha" or "rgba"')
+    refinement = RefinementOptions(**get_refinement_options(req))
+    tier = req.headers.get("X-Priority-Lane") or get_option(req, "lane")
+
+    pixels, read = open_frames(req)
+
+    # Decoded frames, masks and output PNGs live until the zip is built, so
+    # the whole request holds pixel budget for every frame (charged at
+    # SEQUENCE_DECODE_COST). Keyframe batches are charged in full and only
+    # wait for an inference slot, as their pixels are already held
+    def admit(batch_pixels):
+        return charged_admission(client_id, request_cost(batch_pixels), batch_pixels, tier=tier, budget=False)
+
+    with charged_admission(client_id, request_cost(pixels * SEQUENCE_DECODE_COST), pixels, tier=tier, slot=False):
+        result = _run_sequence(read, admit, model_name, diff_threshold, keyframe_interval, warp, output, refinement,
+                               request_id, logger, start_process_time)
+    return result
+
+
+def _run_sequence(read, admit, model_name, diff_threshold, keyframe_interval, warp, output, refinement,
+                  request_id, logger, start_process_time):
+    """Decode, mask and zip the frames of an admitted sequence request (see process_sequence())"""
+    frames = read()
+    load_time = time.time() - start_process_time
+    logger.info(f"[{request_id}] Loaded {len(frames)} frames of {frames[0].size} in {load_time:.4f}s")
+
+    process_start = time.time()
+    masks, plans = sequence_masks(frames, diff_threshold, keyframe_interval, warp,
+                                  batch_size=SEQUENCE_BATCH_SIZE, model_name=model_name, admit=admit)
+    keyframes = sum(plan.source == "model" for plan in plans)
+    process_time = time.time() - process_start
+    logger.info(f"[{request_id}] Masks for {len(frames)} frames from {keyframes} keyframes in {process_time:.4f}s (model: {model_name})")
+
+    save_start = time.time()
+    buf = io.BytesIO()
+    manifest = []
+    # PNGs are already compressed, so store them as is
+    with zipfile.ZipFile(buf, "w", zipfile.ZIP_STORED) as archive:
+        for frame, mask, plan in zip(frames, masks, plans):
+            mask = refine_mask(frame, mask, refinement).resize(frame.size, Image.LANCZOS)
+            if output == "rgba":
+                frame.putalpha(mask)
+                mask = frame
+            name = f"frame_{plan.index:05d}.png"
+            png = io.BytesIO()
+            mask.save(png, format="PNG")
+            archive.writestr(name, png.getvalue())
+            manifest.append(dict(plan.to_dict(), name=name))
+        archive.writestr("manifest.json", json.dumps({"model": model_name, "output": output, "frames": manifest}, indent=2))
+    save_time = time.time() - save_start
+    buf.seek(0)
+
+    total_time = time.time() - start_process_time
+    logger.info(f"[{request_id}] Total sequence time: {total_time:.4f}s (Load: {load_time:.4f}s, Masks: {process_time:.4f}s, Save: {save_time:.4f}s)")
+
+    headers = {
+        "X-Sequence-Frames": str(len(frames)),
+        "X-Sequence-Keyframes": str(keyframes),
+        "X-Model": model_name,
+    }
+    return SequenceResult(buf, headers)
+
+
+@sequence_bp.route("/remove-bg/sequence", methods=["POST"])
+def remove_bg_sequence():
+    """Remove backgrounds from an ordered frame sequence, returning a zip of per-frame alpha masks"""
+    start_process_time = time.time()
+    with request_memory(g.request_id, current_app.logger, request.environ.get("SERVER_SOFTWARE", "")):
+        try:
+            result = process_sequence(request, g.request_id, g.client_id, current_app.logger)
+            response = send_file(result.buf, mimetype="application/zip", as_attachment=True, download_name="frames.zip")
+            response.headers.update(result.headers)
+            return response
+
+        except ImageTooLargeError as e:
+            current_app.logger.warning(f"[{g.request_id}] Rejected oversized sequence: {str(e)}")
+            return jsonify({"error": str(e)}), 413
+
+        except (SequenceInputError, UnknownModelError, InvalidOptionError) as e:
+            current_app.logger.warning(f"[{g.request_id}] Invalid sequence request: {str(e)}")
+            return jsonify({"error": str(e)}), 400
+
+        except AdmissionRejected as e:
+            current_app.logger.warning(f"[{g.request_id}] Rejected by admission control ({e.status_code}): {str(e)}, retry after {e.retry_after}s")
+            return jsonify({"error": str(e)}), e.status_code, {"Retry-After": str(e.retry_after)}
+
+        except RequestEntityTooLarge:
+            # Body over MAX_UPLOAD_MB, answered by the app's 413 handler
+            raise
+
+        except Exception as e:
+            error_time = time.time() - start_process_time
+            current_app.logger.error(f"[{g.request_id}] Error in sequence processing after {error_time:.4f}s: {str(e)}")
+            current_app.logger.error(f"[{g.request_id}] Traceback: {traceback.format_exc()}")
+            return jsonify({"error": str(e)}), 500
@@ -7,6 +7,7 @@ import warnings
 from PIL import Image, ImageDraw, ImageFont
 from datetime import datetime
 from models.bg_remover import remove
+from utils.sky_detection import detect_sky
 
 # Filter out FutureWarnings to suppress timm deprecation warnings
 warnings.filterwarnings("ignore", category=FutureWarning)
@@ -91,47 +92,9 @@ def create_debug_visualization(image_path, base_name, debug_dir):
         img_np = np.array(image)
         h, w, _ = img_np.shape
         
-        # Create an all white mask to start (255 = keep, 0 = remove)
-        mask_np = np.ones((h, w), dtype=np.uint8) * 255
-        
-        # Function to detect sky pixels
-        def detect_sky_pixels(img, threshold=0.8):
-            sky_mask = np.zeros((h, w), dtype=np.uint8)
-            for y in range(h):
-                for x in range(w):
-                    r, g, b = img[y, x]
-                    # Check for blue sky
-                    is_blue_sky = b > r and b > g and b > 100
-                    # Check for white/gray sky
-                    brightness = (int(r) + int(g) + int(b)) / 3.0
-                    is_bright = (brightness > 200 and 
-                                abs(int(r) - int(g)) < 20 and 
-                                abs(int(r) - int(b)) < 20 and 
-                                abs(int(g) - int(b)) < 20)
-                    if is_blue_sky or is_bright:
-                        sky_mask[y, x] = 255
-            return sky_mask
-        
-        # Generate sky detection mask
+        # Generate sky detection masks (vectorised, see utils/sky_detection.py)
         print("Generating sky detection mask...")
-        sky_mask = detect_sky_pixels(img_np)
-        
-        # Apply more aggressive detection to upper quarter
-        sky_mask_top = sky_mask.copy()
-        upper_region = np.zeros((h//4, w), dtype=np.uint8)
-        for y in range(h//4):
-            for x in range(w):
-                # Check surrounding pixels
-                count = 0
-                for dy in [-2, -1, 0, 1, 2]:
-                    for dx in [-2, -1, 0, 1, 2]:
-                        ny, nx = y + dy, x + dx
-                        if 0 <= ny < h//4 and 0 <= nx < w and sky_mask[ny, nx] > 0:
-                            count += 1
-                
-                # If surrounded by many sky pixels, likely sky
-                if count > 15:
-                    upper_region[y, x] = 255
+        sky_mask, upper_region, combined_mask = detect_sky(img_np)
         
         # Inverted masks (for display - white is background, black is foreground)
         # Note: in implementation, 255 = keep, 0 = remove, but for display we invert
@@ -148,10 +111,6 @@ def create_debug_visualization(image_path, base_name, debug_dir):
         temp_mask[:h//4, :] = upper_region
         upper_only[temp_mask == 0] = [255, 255, 255]  # Make non-sky white
         
-        # Combined mask for actual use (255 = keep, 0 = remove)
-        combined_mask = np.maximum(sky_mask, np.zeros_like(sky_mask))
-        combined_mask[:h//4, :] = np.maximum(upper_region, np.zeros_like(upper_region))
-        
         # For display we invert (white = background)
         combined_mask_display = 255 - combined_mask
         
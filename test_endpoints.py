@@ -8,12 +8,16 @@ Tests all three input methods:
 
 Also includes a batch processing test for all images in the test_images directory.
 
+With --client, the Python client library (client.py) is tested with raw-body
+uploads and concurrent submission of the test_images directory.
+
 Usage:
-    python test_endpoints.py [--host localhost] [--port 5000] [--batch]
+    python test_endpoints.py [--host localhost] [--port 5000] [--batch] [--batch-urls] [--client]
 """
 
 import argparse
 import base64
+import json
 import os
 import sys
 import time
@@ -219,6 +223,111 @@ def test_batch_processing(host, port):
     
     return success_count == len(image_files)
 
+def test_batch_urls(host, port, image_url):
+    """Test the batch URL endpoint with the test URL twice plus one broken URL"""
+    print(f"\nTesting batch URL endpoint with {image_url}...")
+
+    url = f"http://{host}:{port}/remove-bg/batch"
+    urls = [image_url, image_url, image_url + ".missing"]
+
+    try:
+        response = requests.post(url, json={"urls": urls, "order": "input"}, stream=True)
+        if response.status_code != 200:
+            print(f"❌ Failed with status code: {response.status_code}")
+            print(f"   Response: {response.text}")
+            return False
+
+        statuses = []
+        for line in response.iter_lines():
+            item = json.loads(line)
+            if "summary" in item:
+                print(f"   Summary: {item['summary']}")
+                continue
+            statuses.append(item["status"])
+            if item["status"] == 200:
+                img = Image.open(io.BytesIO(base64.b64decode(item["image_b64"])))
+                print(f"   [{item['index']}] {img.width}x{img.height} {img.mode} (fetch {item['fetch_seconds']}s, total {item['seconds']}s)")
+            else:
+                print(f"   [{item['index']}] {item['status']}: {item['error']}")
+
+        # Both good URLs succeed and the broken one fails on its own
+        if statuses[:2] == [200, 200] and len(statuses) == 3 and statuses[2] != 200:
+            print("✅ Success! Per-URL results streamed in input order")
+            return True
+        print(f"❌ Unexpected item statuses: {statuses}")
+        return False
+    except Exception as e:
+        print(f"❌ Error: {str(e)}")
+        return False
+
+def test_reference_result(host, port, test_image_path):
+    """Test response=reference and downloading the stored result, whole, by range and by ETag"""
+    print(f"\nTesting reference result with {test_image_path}...")
+
+    url = f"http://{host}:{port}/remove-bg"
+
+    try:
+        with open(test_image_path, "rb") as f:
+            response = requests.post(url, files={"image_file": f}, data={"response": "reference"})
+        if response.status_code != 200:
+            print(f"❌ Failed with status code: {response.status_code}")
+            print(f"   Response: {response.text}")
+            return False
+        reference = response.json()
+        print(f"   Stored {reference['id'][:16]}... ({reference['size']} bytes, {reference['width']}x{reference['height']})")
+
+        result_url = f"http://{host}:{port}{reference['url']}"
+        full = requests.get(result_url)
+        img = Image.open(io.BytesIO(full.content))
+        partial = requests.get(result_url, headers={"Range": "bytes=0-99"})
+        cached = requests.get(result_url, headers={"If-None-Match": full.headers.get("ETag", "")})
+        print(f"   GET: {full.status_code} {img.width}x{img.height} {img.mode}, Range: {partial.status_code} ({len(partial.content)} bytes), If-None-Match: {cached.status_code}")
+
+        if (full.status_code == 200 and len(full.content) == reference["size"] and img.size == (reference["width"], reference["height"])
+                and partial.status_code == 206 and len(partial.content) == 100 and cached.status_code == 304):
+            print("✅ Success! Result stored and served with ranges and ETag")
+            return True
+        print("❌ Stored result was not served as expected")
+        return False
+    except Exception as e:
+        print(f"❌ Error: {str(e)}")
+        return False
+
+def test_client_library(host, port, test_image_path):
+    """Test client.py: a raw-body upload, then every test image with a bounded in-flight window"""
+    from client import BgRemovalClient
+
+    print(f"\nTesting Python client library...")
+
+    image_files = sorted(
+        os.path.join("test_images", f) for f in os.listdir("test_images")
+        if f.lower().endswith((".png", ".jpg", ".jpeg"))
+    )
+
+    try:
+        with BgRemovalClient(f"http://{host}:{port}", pool_size=4) as api:
+            result = api.remove(test_image_path)
+            img = result.image()
+            print(f"   Raw upload: {img.width}x{img.height} {img.mode} ({result.seconds:.2f}s, {result.attempts} attempt(s))")
+
+            start = time.time()
+            items = list(api.map(image_files, window=4, ordered=True))
+            elapsed = time.time() - start
+            for item in items:
+                if not item.ok:
+                    print(f"   {item.input}: {item.error}")
+            successes = sum(1 for item in items if item.ok)
+            print(f"   Concurrent: {successes}/{len(image_files)} images in {elapsed:.2f}s")
+
+        if img.mode == "RGBA" and successes == len(image_files) and [item.index for item in items] == list(range(len(image_files))):
+            print("✅ Success! Client raw uploads and concurrent submission work")
+            return True
+        print("❌ Client results were not as expected")
+        return False
+    except Exception as e:
+        print(f"❌ Error: {str(e)}")
+        return False
+
 def main():
     parser = argparse.ArgumentParser(description="Test the background removal API endpoints")
     parser.add_argument("--host", default="localhost", help="API host (default: localhost)")
@@ -227,6 +336,8 @@ def main():
     parser.add_argument("--test-url", default="https://images.pexels.com/photos/45201/kitty-cat-kitten-pet-45201.jpeg", 
                         help="URL to test image")
     parser.add_argument("--batch", action="store_true", help="Run batch processing test on all images in test_images directory")
+    parser.add_argument("--batch-urls", action="store_true", help="Test the /remove-bg/batch endpoint with --test-url")
+    parser.add_argument("--client", action="store_true", help="Test the Python client library (client.py)")
     args = parser.parse_args()
     
     # Print test configuration
@@ -252,11 +363,18 @@ def main():
     file_success = test_file_upload(args.host, args.port, args.test_image)
     url_success = test_url_input(args.host, args.port, args.test_url)
     base64_success = test_base64_input(args.host, args.port, args.test_image)
+    reference_success = test_reference_result(args.host, args.port, args.test_image)
     
     # Run batch processing test if requested
     batch_success = True
     if args.batch:
         batch_success = test_batch_processing(args.host, args.port)
+    batch_urls_success = True
+    if args.batch_urls:
+        batch_urls_success = test_batch_urls(args.host, args.port, args.test_url)
+    client_success = True
+    if args.client:
+        client_success = test_client_library(args.host, args.port, args.test_image)
     
     # Print summary
     print("\n" + "=" * 40)
@@ -267,11 +385,16 @@ def main():
     print(f"File Upload: {'✅ Passed' if file_success else '❌ Failed'}")
     print(f"URL Input: {'✅ Passed' if url_success else '❌ Failed'}")
     print(f"Base64 Input: {'✅ Passed' if base64_success else '❌ Failed'}")
+    print(f"Reference Result: {'✅ Passed' if reference_success else '❌ Failed'}")
     if args.batch:
         print(f"Batch Processing: {'✅ Passed' if batch_success else '❌ Failed'}")
+    if args.batch_urls:
+        print(f"Batch URLs: {'✅ Passed' if batch_urls_success else '❌ Failed'}")
+    if args.client:
+        print(f"Client Library: {'✅ Passed' if client_success else '❌ Failed'}")
     print("=" * 40)
     
-    if file_success and url_success and base64_success and batch_success:
+    if file_success and url_success and base64_success and reference_success and batch_success and batch_urls_success and client_success:
         print("\n✅ All tests passed successfully!")
         return 0
     else:
@@ -0,0 +1,249 @@
+# utils/admission.py: Admission control and backpressure for inference requests
+import math
+import threading
+import time
+from contextlib import contextmanager
+
+from config import (
+    MAX_CONCURRENT_INFERENCES,
+    MAX_QUEUE_LENGTH,
+    MAX_QUEUED_PER_CLIENT,
+    PIXEL_BUDGET_MP,
+    QUEUE_TIMEOUT,
+    PRIORITY_LANES,
+)
+from utils.metrics import metrics
+from utils.scheduler import Lane, LaneScheduler
+
+
+class AdmissionRejected(Exception):
+    """
+    Raised when a request cannot be admitted.
+
+    Attributes:
+        status_code: HTTP status to return (429 queue full, 503 timed out)
+        retry_after: Suggested number of seconds before retrying
+    """
+
+    def __init__(self, message, status_code, retry_after):
+        super().__init__(message)
+        self.status_code = status_code
+        self.retry_after = retry_after
+
+
+class Admission:
+    """Ticket for an admitted request."""
+
+    def __init__(self, pixels, lane, client=None, slot=True, budget=True):
+        self.pixels = pixels
+        self.lane = lane
+        self.client = client
+        # False for work that needs pixel budget but no inference slot
+        self.slot = slot
+        # Pixels held against the budget (0 when an enclosing admission holds them)
+        self.budget_pixels = pixels if budget else 0
+        self.enqueued_at = time.monotonic()
+        self.granted = False
+        self.queue_wait = 0.0
+
+
+class AdmissionController:
+    """
+    Bounds the work a worker process accepts.
+
+    A request is admitted when fewer than max_concurrent requests are running
+    and the pixels already in flight plus its own fit in the pixel budget.
+    A request larger than the whole budget is still admitted when nothing
+    else is running, so it cannot starve. Requests that cannot run wait in
+    their size lane; the scheduler decides which lane is served next and
+    rotates between clients within a lane. Requests admitted with
+    slot=False (no model work, e.g. source cache hits) only take pixel
+    budget; they start ahead of the queue when that leaves room for the
+    request at its head, and otherwise wait in their lane like the rest.
+    Requests admitted with budget=False are model steps of work that already
+    holds its pixels (e.g. the keyframe batches of a sequence); they only
+    wait for a free slot, outside the lanes, so they cannot deadlock behind
+    requests waiting for that same budget. When a lane's queue is full, or
+    the client already has max_queued_per_client requests waiting, requests
+    are rejected immediately (429); when they wait longer than queue_timeout
+    they are rejected with 503.
+    """
+
+    def __init__(self, max_concurrent, pixel_budget, queue_timeout, scheduler, max_queued_per_client=None):
+        self.max_concurrent = max_concurrent
+        self.pixel_budget = pixel_budget
+        self.queue_timeout = queue_timeout
+        self.max_queued_per_client = max_queued_per_client
+        self.scheduler = scheduler
+
+        self._cond = threading.Condition()
+        self._active = 0
+        # Running requests that hold pixel budget but no slot
+        self._budget_only = 0
+        self._active_pixels = 0
+        self._rejected = 0
+        # Exponentially weighted average of service time, for Retry-After
+        self._avg_service_time = None
+
+    def _can_run(self, pixels, slot=True):
+        if slot and self._active >= self.max_concurrent:
+            return False
+        return not pixels or self._active + self._budget_only == 0 or self._active_pixels + pixels <= self.pixel_budget
+
+    def _can_start_now(self, admission):
+        """Whether a new request may start without queueing (lock held)."""
+        if not self._can_run(admission.budget_pixels, admission.slot):
+            return False
+        head = self.scheduler.peek()
+        if head is None:
+            return True
+        # Budget-only work may pass waiting requests as long as the head
+        # still fits the budget afterwards, so it is never delayed
+        return not admission.slot and self._active_pixels + admission.budget_pixels + head[1].budget_pixels <= self.pixel_budget
+
+    def _start(self, admission):
+        admission.granted = True
+        admission.queue_wait = time.monotonic() - admission.enqueued_at
+        if admission.slot:
+            self._active += 1
+        else:
+            self._budget_only += 1
+        self._active_pixels += admission.budget_pixels
+
+    def _dispatch(self):
+        """Start waiting requests in scheduler order while they fit."""
+        started = False
+        while True:
+            head = self.scheduler.peek()
+            if head is None:
+                break
+            lane, admission = head
+            # Stop at the head instead of skipping it, so a large request
+            # whose turn it is gets the slots as they drain
+            if not self._can_run(admission.budget_pixels, admission.slot):
+                break
+            self.scheduler.pop(lane)
+            self._start(admission)
+            started = True
+        if started:
+            self._cond.notify_all()
+
+    def retry_after(self):
+        """Estimate seconds until a new request would get a slot."""
+        avg = self._avg_service_time or 1.0
+        backlog = (self.scheduler.queued() + self._active) / max(self.max_concurrent, 1)
+        return max(1, math.ceil(avg * backlog))
+
+    def _reject(self, lane, message, status_code):
+        self._rejected += 1
+        metrics.inc("admission_rejected_total", lane=lane.name, status=status_code)
+        raise AdmissionRejected(message, status_code, self.retry_after())
+
+    def acquire(self, pixels, tier=None, client=None, slot=True, budget=True):
+        """
+        Block until the request may run and return its Admission, or raise AdmissionRejected.
+
+        slot=False admits work that needs pixel budget but no inference slot;
+        budget=False admits a model step whose pixels an enclosing admission
+        already holds.
+        """
+        lane = self.scheduler.classify(pixels, tier)
+        admission = Admission(pixels, lane.name, client, slot, budget)
+
+        with self._cond:
+            if self._can_start_now(admission):
+                self._start(admission)
+                return admission
+
+            if not budget:
+                # Queued requests are dispatched as soon as they fit, so a
+                # free slot here is one the head of the queue cannot use yet
+                deadline = admission.enqueued_at + self.queue_timeout
+                while not self._can_run(0):
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        self._reject(lane, "Server is busy: timed out waiting for an inference slot", 503)
+                    self._cond.wait(remaining)
+                self._start(admission)
+                return admission
+
+            if len(lane.waiters) >= lane.max_queue:
+                self._reject(lane, f"Server is busy: {lane.name} request queue is full", 429)
+            if self.max_queued_per_client and self.scheduler.queued_for(client) >= self.max_queued_per_client:
+                self._reject(lane, "Too many queued requests for this client", 429)
+
+            self.scheduler.push(lane, admission)
+            self._dispatch()
+
+            deadline = admission.enqueued_at + self.queue_timeout
+            while not admission.granted:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    self.scheduler.remove(lane, admission)
+                    # Our departure may let the next request in
+                    self._dispatch()
+                    self._reject(lane, "Server is busy: timed out waiting for an inference slot", 503)
+                self._cond.wait(remaining)
+
+        return admission
+
+    def release(self, admission, service_time=None):
+        """Return a slot and start the next waiting requests."""
+        with self._cond:
+            if admission.slot:
+                self._active -= 1
+            else:
+                self._budget_only -= 1
+            self._active_pixels -= admission.budget_pixels
+            # Retry-After estimates how long slots stay busy
+            if service_time is not None and admission.slot:
+                if self._avg_service_time is None:
+                    self._avg_service_time = service_time
+                else:
+                    self._avg_service_time = 0.8 * self._avg_service_time + 0.2 * service_time
+            self._dispatch()
+            # Wakes budget=False requests waiting for a slot nobody queued took
+            self._cond.notify_all()
+
+        metrics.inc("admission_admitted_total", lane=admission.lane)
+        metrics.observe("queue_wait_seconds", admission.queue_wait, lane=admission.lane)
+        if service_time is not None:
+            metrics.observe("service_seconds", service_time, lane=admission.lane)
+            metrics.observe("latency_seconds", admission.queue_wait + service_time, lane=admission.lane)
+
+    @contextmanager
+    def admit(self, pixels, tier=None, client=None, slot=True, budget=True):
+        """Context manager wrapping acquire() and release(); yields the Admission."""
+        admission = self.acquire(pixels, tier, client, slot, budget)
+        start = time.monotonic()
+        try:
+            yield admission
+        finally:
+            self.release(admission, time.monotonic() - start)
+
+    def stats(self):
+        """Return a snapshot of the controller state."""
+        with self._cond:
+            return {
+                "active": self._active,
+                "budget_only": self._budget_only,
+                "active_megapixels": round(self._active_pixels / 1_000_000, 2),
+                "queued": self.scheduler.queued(),
+                "rejected": self._rejected,
+                "max_concurrent": self.max_concurrent,
+                "pixel_budget_megapixels": self.pixel_budget / 1_000_000,
+                "lanes": self.scheduler.stats(),
+            }
+
+
+# Shared controller for the worker process
+admission_controller = AdmissionController(
+    max_concurrent=MAX_CONCURRENT_INFERENCES,
+    pixel_budget=int(PIXEL_BUDGET_MP * 1_000_000),
+    queue_timeout=QUEUE_TIMEOUT,
+    max_queued_per_client=MAX_QUEUED_PER_CLIENT,
+    scheduler=LaneScheduler([
+        Lane(name, max_megapixels, weight, MAX_QUEUE_LENGTH)
+        for name, max_megapixels, weight in PRIORITY_LANES
+    ]),
+)
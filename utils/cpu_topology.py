@@ -0,0 +1,115 @@
+# utils/cpu_topology.py: torch thread counts and per-worker CPU affinity
+import logging
+import os
+
+import torch
+
+from config import TORCH_INTRA_OP_THREADS, TORCH_INTER_OP_THREADS, CPU_AFFINITY
+
+logger = logging.getLogger(__name__)
+
+# torch only allows setting the inter-op pool size once per process
+_inter_op_configured = False
+
+# Configuration applied to this process by configure_worker
+worker_config = None
+
+
+def parse_cpu_list(value):
+    """Parse a Linux-style core list ("0-3,8,10-11") into a sorted list of ints."""
+    cpus = set()
+    for part in value.split(","):
+        part = part.strip()
+        if not part:
+            continue
+        first, _, last = part.partition("-")
+        try:
+            start, end = int(first), int(last or first)
+        except ValueError:
+            raise ValueError(f"Invalid CPU list {value!r}")
+        if start > end:
+            raise ValueError(f"Invalid CPU range {part!r}")
+        cpus.update(range(start, end + 1))
+    return sorted(cpus)
+
+
+def available_cpus():
+    """Cores this process may run on."""
+    if hasattr(os, "sched_getaffinity"):
+        return sorted(os.sched_getaffinity(0))
+    return list(range(os.cpu_count() or 1))
+
+
+def worker_cpus(slot, workers, cpus=None):
+    """
+    Cores for one of several workers sharing the host.
+
+    Splits cpus into `workers` contiguous, nearly equal slices (adjacent
+    cores usually share caches). With more workers than cores, workers
+    share cores round-robin.
+
+    Args:
+        slot: Worker index, 0 <= slot < workers
+        workers: Number of workers
+        cpus: Cores to split, default all available cores
+
+    Returns:
+        List of core ids
+    """
+    cpus = available_cpus() if cpus is None else list(cpus)
+    workers = max(1, workers)
+    if workers >= len(cpus):
+        return [cpus[slot % len(cpus)]]
+    start = slot * len(cpus) // workers
+    end = (slot + 1) * len(cpus) // workers
+    return cpus[start:end]
+
+
+def set_torch_threads(intra_op=0, inter_op=0):
+    """Set torch's intra/inter-op thread pools; 0 keeps the default."""
+    global _inter_op_configured
+    if intra_op > 0:
+        torch.set_num_threads(intra_op)
+    if inter_op > 0 and not _inter_op_configured:
+        try:
+            torch.set_num_interop_threads(inter_op)
+            _inter_op_configured = True
+        except RuntimeError as e:
+            # Raised once any inter-op parallel work has started
+            logger.warning(f"Could not set inter-op threads to {inter_op}: {e}")
+
+
+def configure_worker(slot=0, workers=1, affinity=CPU_AFFINITY,
+                     intra_op=TORCH_INTRA_OP_THREADS, inter_op=TORCH_INTER_OP_THREADS):
+    """
+    Pin this process to its share of the cores and size torch's thread pools.
+
+    Call in the worker process before the model runs (gunicorn post_fork,
+    or at startup for a single process). Without an explicit intra-op count
+    but with an affinity, torch uses one thread per pinned core.
+
+    Returns:
+        Dict describing the applied configuration
+    """
+    global worker_config
+    cpus = None
+    if affinity and hasattr(os, "sched_setaffinity"):
+        pool = available_cpus() if affinity == "auto" else parse_cpu_list(affinity)
+        cpus = worker_cpus(slot, workers, pool)
+        os.sched_setaffinity(0, cpus)
+        if intra_op <= 0:
+            intra_op = len(cpus)
+    set_torch_threads(intra_op, inter_op)
+    worker_config = {
+        "slot": slot,
+        "workers": workers,
+        "cpus": cpus,
+        "intra_op_threads": torch.get_num_threads(),
+        "inter_op_threads": torch.get_num_interop_threads(),
+    }
+    return worker_config
+
+
+def ensure_configured():
+    """Apply the single-process configuration unless a worker hook already did."""
+    return worker_config if worker_config is not None else configure_worker()
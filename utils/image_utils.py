@@ -1,12 +1,109 @@
 # utils/image_utils.py: Image processing utilities, reading images from various sources, base64 conversion, etc.
 import base64
+import hashlib
 import io
 import requests
 from PIL import Image
+from config import URL_FETCH_TIMEOUT, MAX_UPLOAD_MB
 
-def get_input_image(req):
+# Add a proper User-Agent header to comply with website policies
+URL_FETCH_HEADERS = {
+    "User-Agent": "BgRemovalAPI/1.0 (github.com/trinexai/bg-removal; hello@trinex.ai)"
+}
+
+
+# Byte limit for request bodies and image_url downloads
+MAX_UPLOAD_BYTES = int(MAX_UPLOAD_MB * 1024 * 1024)
+
+# Chunk size for streamed image_url downloads
+FETCH_CHUNK_BYTES = 64 * 1024
+
+
+class ImageTooLargeError(ValueError):
+    """Raised when an input image exceeds the configured megapixel limit."""
+
+
+def upload_too_large(what):
+    """ImageTooLargeError for a body or download over MAX_UPLOAD_BYTES"""
+    return ImageTooLargeError(f"{what} is larger than the limit of {MAX_UPLOAD_MB:g} MB")
+
+
+def check_content_length(length, what):
+    """
+    Reject a declared Content-Length over MAX_UPLOAD_BYTES before reading anything.
+
+    Args:
+        length: Content-Length header value, or None when it is not sent
+        what: Name of the body in the error message (e.g. "image_url")
+    """
+    if length is not None and length.isdigit() and int(length) > MAX_UPLOAD_BYTES:
+        raise upload_too_large(what)
+
+
+def read_limited(chunks, what, length=None):
+    """
+    Join byte chunks, stopping as soon as they exceed MAX_UPLOAD_BYTES.
+
+    Args:
+        chunks: Iterable of bytes, e.g. a streamed response's iter_content()
+        what: Name of the body in the error message
+        length: Content-Length header value, checked before reading
+
+    Returns:
+        The bytes read
+
+    Raises:
+        ImageTooLargeError: if the body is, or claims to be, too large
+    """
+    check_content_length(length, what)
+    buf = bytearray()
+    for chunk in chunks:
+        buf += chunk
+        if len(buf) > MAX_UPLOAD_BYTES:
+            raise upload_too_large(what)
+    return bytes(buf)
+
+
+def fetch_url_content(session, url):
+    """
+    Download image_url with requests, at most MAX_UPLOAD_BYTES of it.
+
+    Args:
+        session: requests module or a requests.Session
+        url: URL to fetch
+
+    Returns:
+        The response body
+
+    Raises:
+        ImageTooLargeError: if the body is over the limit
+        requests.RequestException: if the download fails
+    """
+    with session.get(url, headers=URL_FETCH_HEADERS, timeout=URL_FETCH_TIMEOUT, stream=True) as resp:
+        resp.raise_for_status()
+        return read_limited(resp.iter_content(FETCH_CHUNK_BYTES), "image_url", resp.headers.get("Content-Length"))
+
+
+def check_image_size(image, max_megapixels=None):
     """
-    Get input image from request.
+    Reject an opened image whose header reports more than max_megapixels.
+
+    PIL only parses the header in Image.open(), so this runs before the
+    pixel data is decoded into memory.
+    """
+    if not max_megapixels:
+        return
+    megapixels = image.width * image.height / 1_000_000
+    if megapixels > max_megapixels:
+        raise ImageTooLargeError(
+            f"Image is {image.width}x{image.height} ({megapixels:.1f} MP), "
+            f"which exceeds the limit of {max_megapixels:g} MP"
+        )
+
+
+def open_input_image(req, max_megapixels=None, url_content=None):
+    """
+    Open input image from request without decoding its pixel data.
 
     Supported form-data fields:
     - "image_file": Direct image file upload
@@ -14,6 +111,12 @@ def get_input_image(req):
     - "image_url": URL to an image
 
     Priority: image_file > image_file_b64 > image_url
+
+    url_content holds the bytes of image_url when the caller already fetched
+    it (the ASGI app fetches asynchronously); otherwise it is fetched here.
+
+    The returned image is lazily loaded; call decode_image() to get the pixels.
+    Raises ImageTooLargeError if the image exceeds max_megapixels.
     """
     sources = {}
     image = None
@@ -21,30 +124,28 @@ def get_input_image(req):
     # Check file upload via "image_file"
     if "image_file" in req.files:
         try:
-            sources["image_file"] = Image.open(req.files["image_file"].stream).convert("RGB")
+            sources["image_file"] = Image.open(req.files["image_file"].stream)
         except Exception as e:
             raise ValueError(f"Error reading image_file: {str(e)}")
-            
+
     # Check "image_file_b64" field in form data
     image_file_b64 = req.form.get("image_file_b64")
     if image_file_b64:
         try:
             decoded = base64.b64decode(image_file_b64)
-            sources["image_file_b64"] = Image.open(io.BytesIO(decoded)).convert("RGB")
+            sources["image_file_b64"] = Image.open(io.BytesIO(decoded))
         except Exception as e:
             raise ValueError(f"Error reading image_file_b64: {str(e)}")
-            
+
     # Check "image_url" field in form data
     image_url = req.form.get("image_url")
     if image_url:
         try:
-            # Add a proper User-Agent header to comply with website policies
-            headers = {
-                "User-Agent": "BgRemovalAPI/1.0 (github.com/trinexai/bg-removal; hello@trinex.ai)"
-            }
-            resp = requests.get(image_url, headers=headers)
-            resp.raise_for_status()
-            sources["image_url"] = Image.open(io.BytesIO(resp.content)).convert("RGB")
+            if url_content is None:
+                url_content = fetch_url_content(requests, image_url)
+            sources["image_url"] = Image.open(io.BytesIO(url_content))
+        except ImageTooLargeError:
+            raise
         except Exception as e:
             raise ValueError(f"Error reading image_url: {str(e)}")
 
@@ -62,4 +163,59 @@ def get_input_image(req):
     if image is None:
         raise ValueError("No valid image source found.")
 
-    return image
\ No newline at end of file
+    check_image_size(image, max_megapixels)
+
+    return image
+
+
+def source_fingerprint(req, url_content=None):
+    """
+    Digest (hex) of the bytes of the source open_input_image() reads, for
+    recognising repeated inputs.
+
+    Uses the same priority as open_input_image(). The upload stream is read
+    in blocks and its position restored. Returns None for an image_url whose
+    content was not fetched yet, since only the URL is known then.
+    """
+    digest = hashlib.blake2b(digest_size=16)
+    if "image_file" in req.files:
+        stream = req.files["image_file"].stream
+        position = stream.tell()
+        stream.seek(0)
+        for block in iter(lambda: stream.read(1 << 20), b""):
+            digest.update(block)
+        stream.seek(position)
+    elif req.form.get("image_file_b64"):
+        digest.update(req.form["image_file_b64"].encode())
+    elif req.form.get("image_url") and url_content is not None:
+        digest.update(url_content)
+    else:
+        return None
+    return digest.hexdigest()
+
+
+def has_alpha(image):
+    """Whether an opened image carries transparency information."""
+    return image.mode in ("RGBA", "LA", "PA", "RGBa", "La") or "transparency" in image.info
+
+
+def decode_image(image):
+    """
+    Decode a lazily opened image into pixel data.
+
+    Images with transparency are decoded as RGBA so their alpha channel is
+    kept; everything else is decoded as RGB.
+    """
+    try:
+        return image.convert("RGBA" if has_alpha(image) else "RGB")
+    except Exception as e:
+        raise ValueError(f"Error decoding image: {str(e)}")
+
+
+def get_input_image(req, max_megapixels=None):
+    """
+    Get decoded input image from request (RGB, or RGBA when the source has alpha).
+
+    See open_input_image() for the supported sources.
+    """
+    return decode_image(open_input_image(req, max_megapixels))
@@ -0,0 +1,60 @@
+# utils/mask_metrics.py: Quality metrics for comparing alpha masks
+import numpy as np
+from PIL import Image
+
+from utils.sky_detection import neighbourhood_count
+
+
+def to_array(mask, size=None):
+    """Convert a PIL mask (any mode) to a float array in [0, 1], optionally resized."""
+    mask = mask.convert("L")
+    if size is not None and mask.size != size:
+        mask = mask.resize(size, Image.BILINEAR)
+    return np.asarray(mask, dtype=np.float32) / 255.0
+
+
+def iou(pred, ref, threshold=0.5):
+    """Intersection over union of the binarised masks (1.0 when both are empty)."""
+    pred_fg = pred >= threshold
+    ref_fg = ref >= threshold
+    union = np.logical_or(pred_fg, ref_fg).sum()
+    if union == 0:
+        return 1.0
+    return float(np.logical_and(pred_fg, ref_fg).sum() / union)
+
+
+def mae(pred, ref):
+    """Mean absolute error between soft masks."""
+    return float(np.abs(pred - ref).mean())
+
+
+def _boundary(fg):
+    """Foreground pixels with at least one background pixel in their 3x3 window."""
+    # Pixels outside the image count as background, so the frame edge is boundary
+    return fg & (neighbourhood_count(fg, 1) < 9)
+
+
+def boundary_f(pred, ref, threshold=0.5, tolerance=0.0075):
+    """
+    Boundary F-score of the binarised masks.
+
+    A boundary pixel counts as matched when the other mask has a boundary
+    pixel within tolerance * image diagonal pixels (at least 1), as in the
+    DAVIS contour accuracy measure.
+
+    Returns:
+        F-score in [0, 1] (1.0 when neither mask has a boundary)
+    """
+    pred_edge = _boundary(pred >= threshold)
+    ref_edge = _boundary(ref >= threshold)
+    pred_count, ref_count = pred_edge.sum(), ref_edge.sum()
+    if pred_count == 0 and ref_count == 0:
+        return 1.0
+    if pred_count == 0 or ref_count == 0:
+        return 0.0
+    radius = max(1, int(round(tolerance * np.hypot(*ref.shape))))
+    precision = (pred_edge & (neighbourhood_count(ref_edge, radius) > 0)).sum() / pred_count
+    recall = (ref_edge & (neighbourhood_count(pred_edge, radius) > 0)).sum() / ref_count
+    if precision + recall == 0:
+        return 0.0
+    return float(2 * precision * recall / (precision + recall))
@@ -0,0 +1,208 @@
+# utils/memory.py: Per-request memory accounting and memory-based worker recycling
+import ctypes
+import ctypes.util
+import logging
+import os
+import signal
+import threading
+import time
+
+import torch
+
+from config import DEVICE, WORKER_MAX_RSS_MB, MEMORY_SAMPLE_INTERVAL, MALLOC_TRIM_THRESHOLD_MB
+from utils.metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+MB = 1024 * 1024
+
+
+def rss_bytes():
+    """Resident set size of this process (Linux), 0 when unavailable."""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):
+        return 0
+
+
+def _load_malloc_trim():
+    try:
+        libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6")
+        return libc.malloc_trim
+    except (OSError, AttributeError):
+        return None
+
+
+_malloc_trim = _load_malloc_trim()
+
+
+def release_memory():
+    """Return freed heap pages to the OS (glibc only); large PIL buffers otherwise linger."""
+    if _malloc_trim is not None:
+        _malloc_trim(0)
+
+
+class RequestMemory:
+    """
+    Memory used by one request.
+
+    Attributes:
+        rss_start: Process RSS when the request started (bytes)
+        rss_peak: Highest process RSS sampled while the request ran (bytes)
+        rss_end: Process RSS when the request finished (bytes)
+        tensor_peak: Peak CUDA tensor allocation above the start (bytes),
+            None on CPU where torch does not track allocations
+
+    RSS is per process, so with several threads the peak includes memory of
+    concurrent requests.
+    """
+
+    def __init__(self):
+        self.rss_start = self.rss_peak = self.rss_end = rss_bytes()
+        self.tensor_peak = None
+        self._tensor_start = None
+
+    @property
+    def rss_delta(self):
+        """Peak growth over the start of the request (bytes)."""
+        return max(0, self.rss_peak - self.rss_start)
+
+    @property
+    def retained(self):
+        """Growth still held after the request (bytes)."""
+        return self.rss_end - self.rss_start
+
+    def to_dict(self):
+        return {
+            "rss_start_mb": round(self.rss_start / MB, 1),
+            "rss_peak_mb": round(self.rss_peak / MB, 1),
+            "rss_delta_mb": round(self.rss_delta / MB, 1),
+            "retained_mb": round(self.retained / MB, 1),
+            "tensor_peak_mb": round(self.tensor_peak / MB, 1) if self.tensor_peak is not None else None,
+        }
+
+
+class MemoryMonitor:
+    """
+    Samples process RSS while requests run and recycles the worker once it
+    stays above a ceiling.
+
+    Recycling sends SIGTERM to the worker itself, which gunicorn handles as
+    a graceful shutdown: the worker stops accepting connections, finishes its
+    in-flight requests (up to --graceful-timeout) and the arbiter starts a
+    fresh worker. It is only done under gunicorn; other servers just log.
+    """
+
+    def __init__(self, max_rss_mb=0, interval=0.05, trim_threshold_mb=256):
+        self.max_rss = max_rss_mb * MB
+        self.interval = interval
+        self.trim_threshold = trim_threshold_mb * MB
+        self.recycling = False
+        self._lock = threading.Lock()
+        self._active = set()
+        self._wakeup = threading.Event()
+        self._thread = None
+
+    def _ensure_sampler(self):
+        # Started lazily so the thread is created in the worker, not before fork
+        if self._thread is None or not self._thread.is_alive():
+            self._thread = threading.Thread(target=self._sample, name="memory-monitor", daemon=True)
+            self._thread.start()
+
+    def _sample(self):
+        while True:
+            self._wakeup.wait()
+            rss = rss_bytes()
+            with self._lock:
+                for usage in self._active:
+                    usage.rss_peak = max(usage.rss_peak, rss)
+                if not self._active:
+                    self._wakeup.clear()
+            time.sleep(self.interval)
+
+    def start(self):
+        """Start tracking a request; returns its RequestMemory."""
+        usage = RequestMemory()
+        if DEVICE.type == "cuda":
+            usage._tensor_start = torch.cuda.memory_allocated()
+            # Global reset: with concurrent requests the peak is shared
+            torch.cuda.reset_peak_memory_stats()
+        with self._lock:
+            self._active.add(usage)
+            self._ensure_sampler()
+        self._wakeup.set()
+        return usage
+
+    def finish(self, usage):
+        """Stop tracking a request and record its memory in the metrics."""
+        with self._lock:
+            self._active.discard(usage)
+            idle = not self._active
+        usage.rss_end = rss_bytes()
+        usage.rss_peak = max(usage.rss_peak, usage.rss_end)
+        if usage._tensor_start is not None:
+            usage.tensor_peak = max(0, torch.cuda.max_memory_allocated() - usage._tensor_start)
+            metrics.observe("request_tensor_peak_mb", usage.tensor_peak / MB)
+
+        metrics.observe("request_rss_delta_mb", usage.rss_delta / MB)
+        metrics.observe("request_retained_mb", usage.retained / MB)
+
+        # Large requests leave freed-but-unreturned heap behind
+        if idle and usage.rss_delta >= self.trim_threshold:
+            release_memory()
+            usage.rss_end = rss_bytes()
+        metrics.set_gauge("worker_rss_mb", usage.rss_end / MB)
+        return usage
+
+    def should_recycle(self):
+        """Whether the worker is above the RSS ceiling after trimming."""
+        if not self.max_rss or self.recycling:
+            return False
+        if rss_bytes() <= self.max_rss:
+            return False
+        release_memory()
+        return rss_bytes() > self.max_rss
+
+    def recycle(self, server_software=""):
+        """
+        Ask the server to replace this worker after in-flight requests finish.
+
+        Args:
+            server_software: SERVER_SOFTWARE from the WSGI environ, if any
+
+        Returns:
+            True when a graceful restart was requested
+        """
+        # The gunicorn arbiter also exports SERVER_SOFTWARE to its workers
+        server_software = server_software or os.environ.get("SERVER_SOFTWARE", "")
+        rss_mb = rss_bytes() / MB
+        if not server_software.startswith("gunicorn"):
+            logger.warning(f"Worker RSS {rss_mb:.0f} MB is above WORKER_MAX_RSS_MB={self.max_rss // MB}, "
+                           f"but recycling is only supported under gunicorn")
+            return False
+        with self._lock:
+            if self.recycling:
+                return False
+            self.recycling = True
+        metrics.inc("worker_recycles_total")
+        logger.warning(f"Worker RSS {rss_mb:.0f} MB is above WORKER_MAX_RSS_MB={self.max_rss // MB}; "
+                       f"draining and restarting worker {os.getpid()}")
+        os.kill(os.getpid(), signal.SIGTERM)
+        return True
+
+    def stats(self):
+        return {
+            "rss_mb": round(rss_bytes() / MB, 1),
+            "max_rss_mb": self.max_rss // MB or None,
+            "recycling": self.recycling,
+            "requests_tracked": len(self._active),
+        }
+
+
+# Shared per-process monitor
+memory_monitor = MemoryMonitor(
+    max_rss_mb=WORKER_MAX_RSS_MB,
+    interval=MEMORY_SAMPLE_INTERVAL,
+    trim_threshold_mb=MALLOC_TRIM_THRESHOLD_MB,
+)
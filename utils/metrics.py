@@ -0,0 +1,92 @@
+# utils/metrics.py: In-process counters, gauges and latency histograms
+import threading
+from collections import deque
+
+
+def _key(name, labels):
+    """Build a Prometheus-style series key, e.g. 'latency_seconds{lane=small}'."""
+    if not labels:
+        return name
+    label_str = ",".join(f"{k}={labels[k]}" for k in sorted(labels))
+    return f"{name}{{{label_str}}}"
+
+
+def percentile(sorted_values, q):
+    """Return the q-th percentile (0-100) of an already sorted list."""
+    if not sorted_values:
+        return None
+    index = min(len(sorted_values) - 1, max(0, int(round(q / 100 * (len(sorted_values) - 1)))))
+    return sorted_values[index]
+
+
+class Histogram:
+    """
+    Latency histogram keeping count, sum and a sliding window of recent
+    observations used for percentiles.
+    """
+
+    def __init__(self, window=2048):
+        self.count = 0
+        self.total = 0.0
+        self.recent = deque(maxlen=window)
+
+    def observe(self, value):
+        self.count += 1
+        self.total += value
+        self.recent.append(value)
+
+    def summary(self):
+        values = sorted(self.recent)
+        return {
+            "count": self.count,
+            "sum": round(self.total, 6),
+            "p50": percentile(values, 50),
+            "p95": percentile(values, 95),
+            "p99": percentile(values, 99),
+            "max": values[-1] if values else None,
+        }
+
+
+class MetricsRegistry:
+    """
+    Thread-safe registry for the worker process.
+
+    Metrics are per process; with several gunicorn workers each worker
+    reports its own values.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counters = {}
+        self._gauges = {}
+        self._histograms = {}
+
+    def inc(self, name, value=1, **labels):
+        key = _key(name, labels)
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    def set_gauge(self, name, value, **labels):
+        key = _key(name, labels)
+        with self._lock:
+            self._gauges[key] = value
+
+    def observe(self, name, value, **labels):
+        key = _key(name, labels)
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = Histogram()
+            histogram.observe(value)
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                "counters": dict(self._counters),
+                "gauges": dict(self._gauges),
+                "histograms": {key: h.summary() for key, h in self._histograms.items()},
+            }
+
+
+# Shared registry for the worker process
+metrics = MetricsRegistry()
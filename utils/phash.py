@@ -0,0 +1,52 @@
+# utils/phash.py: Perceptual hashes for near-duplicate image detection
+import numpy as np
+from PIL import Image
+
+# 64-bit hashes: an 8x8 grid of bits
+HASH_SIZE = 8
+
+
+def _dct_matrix(n):
+    """Orthonormal DCT-II basis as an n x n matrix."""
+    k = np.arange(n)[:, None]
+    i = np.arange(n)[None, :]
+    matrix = np.cos(np.pi * (2 * i + 1) * k / (2 * n)) * np.sqrt(2.0 / n)
+    matrix[0, :] /= np.sqrt(2.0)
+    return matrix
+
+
+_DCT_SIZE = HASH_SIZE * 4
+_DCT = _dct_matrix(_DCT_SIZE)
+
+
+def _bits_to_int(bits):
+    return int.from_bytes(np.packbits(bits.flatten()).tobytes(), "big")
+
+
+def phash(image):
+    """
+    DCT perceptual hash.
+
+    The image is reduced to a 32x32 grayscale thumbnail, and the sign of its
+    lowest 8x8 DCT frequencies relative to their median forms the hash. It is
+    stable under resizing, re-compression and small colour changes.
+    """
+    gray = image.convert("L").resize((_DCT_SIZE, _DCT_SIZE), Image.BILINEAR)
+    pixels = np.asarray(gray, dtype=np.float64)
+    low = (_DCT @ pixels @ _DCT.T)[:HASH_SIZE, :HASH_SIZE]
+    # Exclude the DC term from the median, it only reflects mean brightness
+    median = np.median(low.flatten()[1:])
+    return _bits_to_int(low > median)
+
+
+def dhash(image):
+    """Difference hash: sign of horizontal gradients on a 9x8 thumbnail."""
+    gray = image.convert("L").resize((HASH_SIZE + 1, HASH_SIZE), Image.BILINEAR)
+    pixels = np.asarray(gray, dtype=np.int16)
+    return _bits_to_int(pixels[:, 1:] > pixels[:, :-1])
+
+
+def hamming_distances(hashes, value):
+    """Vectorised Hamming distance between a uint64 array and one hash."""
+    xor = np.bitwise_xor(hashes, np.uint64(value))
+    return np.unpackbits(xor.view(np.uint8).reshape(-1, 8), axis=1).sum(axis=1)
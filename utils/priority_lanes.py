@@ -0,0 +1,10 @@
+# utils/priority_lanes.py: Priority lane definitions, kept free of torch so gunicorn.conf.py can import them
+
+# Priority lanes: (name, largest input in megapixels or None, weight).
+# Requests are classified into the first lane their size fits, and waiting
+# requests are dequeued in proportion to lane weight
+PRIORITY_LANES = [
+    ("small", 1.0, 8),
+    ("medium", 8.0, 3),
+    ("large", None, 1),
+]
@@ -0,0 +1,132 @@
+# utils/profiling.py: Opt-in torch.profiler + cProfile traces for single requests
+import cProfile
+import hmac
+import io
+import os
+import pstats
+import re
+import threading
+
+import torch
+
+from config import PROFILING_ADMIN_TOKEN, PROFILE_TRACE_DIR, PROFILE_MAX_TRACES
+from utils.request_options import TRUE_VALUES
+
+# Files written per profiled request
+TRACE_SUFFIXES = (".torch.json", ".torch.txt", ".pstats", ".pstats.txt")
+
+_TRACE_NAME = re.compile(r"^[A-Za-z0-9_.-]+$")
+
+
+def is_admin(req):
+    """Whether the request carries the profiling admin token."""
+    if not PROFILING_ADMIN_TOKEN:
+        return False
+    token = req.headers.get("X-Admin-Token", "")
+    return hmac.compare_digest(token.encode(), PROFILING_ADMIN_TOKEN.encode())
+
+
+def profiling_requested(req):
+    """Whether an admin asked for this request to be profiled."""
+    flag = req.headers.get("X-Profile") or req.args.get("profile") or ""
+    return flag.strip().lower() in TRUE_VALUES and is_admin(req)
+
+
+class RequestProfiler:
+    """
+    Profile one request with torch.profiler (operators, shapes, CUDA kernels)
+    and cProfile (the Python side of the calling thread).
+
+    torch.profiler is process-wide, so only one request is profiled at a
+    time; while another profile is running, `active` is False and the
+    request runs unprofiled.
+
+    Files written to trace_dir, prefixed with the request ID:
+    - .torch.json: Chrome trace (open in chrome://tracing or Perfetto)
+    - .torch.txt:  operator table sorted by self time
+    - .pstats:     cProfile stats (load with pstats or snakeviz)
+    - .pstats.txt: top functions by cumulative time
+    """
+
+    _lock = threading.Lock()
+
+    def __init__(self, request_id, trace_dir=PROFILE_TRACE_DIR, max_traces=PROFILE_MAX_TRACES):
+        self.request_id = request_id
+        self.trace_dir = trace_dir
+        self.max_traces = max_traces
+        self.active = False
+
+    def __enter__(self):
+        if not self._lock.acquire(blocking=False):
+            return self
+        self.active = True
+        activities = [torch.profiler.ProfilerActivity.CPU]
+        if torch.cuda.is_available():
+            activities.append(torch.profiler.ProfilerActivity.CUDA)
+        self._torch = torch.profiler.profile(activities=activities, record_shapes=True, profile_memory=True)
+        self._python = cProfile.Profile()
+        self._torch.__enter__()
+        self._python.enable()
+        return self
+
+    def __exit__(self, *exc):
+        if not self.active:
+            return False
+        try:
+            self._python.disable()
+            self._torch.__exit__(*exc)
+            self._write()
+            prune_traces(self.trace_dir, self.max_traces)
+        finally:
+            self._lock.release()
+        return False
+
+    def _write(self):
+        os.makedirs(self.trace_dir, exist_ok=True)
+        prefix = os.path.join(self.trace_dir, self.request_id)
+        self._torch.export_chrome_trace(prefix + ".torch.json")
+        with open(prefix + ".torch.txt", "w") as f:
+            f.write(self._torch.key_averages().table(sort_by="self_cpu_time_total", row_limit=50))
+        self._python.dump_stats(prefix + ".pstats")
+        summary = io.StringIO()
+        pstats.Stats(self._python, stream=summary).sort_stats("cumulative").print_stats(50)
+        with open(prefix + ".pstats.txt", "w") as f:
+            f.write(summary.getvalue())
+
+
+def list_traces(trace_dir=PROFILE_TRACE_DIR):
+    """
+    List profiled requests, newest first.
+
+    Returns:
+        List of dicts with request_id, created (unix time) and files
+        (name -> size in bytes)
+    """
+    if not os.path.isdir(trace_dir):
+        return []
+    traces = {}
+    for name in os.listdir(trace_dir):
+        for suffix in TRACE_SUFFIXES:
+            if name.endswith(suffix):
+                request_id = name[:-len(suffix)]
+                path = os.path.join(trace_dir, name)
+                trace = traces.setdefault(request_id, {"request_id": request_id, "created": 0.0, "files": {}})
+                trace["files"][name] = os.path.getsize(path)
+                trace["created"] = max(trace["created"], os.path.getmtime(path))
+                break
+    return sorted(traces.values(), key=lambda t: t["created"], reverse=True)
+
+
+def prune_traces(trace_dir=PROFILE_TRACE_DIR, max_traces=PROFILE_MAX_TRACES):
+    """Delete the oldest profiled requests beyond max_traces."""
+    for trace in list_traces(trace_dir)[max_traces:]:
+        for name in trace["files"]:
+            try:
+                os.remove(os.path.join(trace_dir, name))
+            except OSError:
+                pass
+
+
+def is_trace_file(name):
+    """Whether name is a plain trace file name (no path components)."""
+    return bool(_TRACE_NAME.match(name)) and name.endswith(TRACE_SUFFIXES)
@@ -0,0 +1,368 @@
+# utils/rate_limit.py: Per-client token-bucket rate limiting weighted by input pixel cost
+import hashlib
+import ipaddress
+import math
+import os
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+
+from config import (
+    RATE_LIMIT_ENABLED,
+    RATE_LIMIT_MP_PER_SECOND,
+    RATE_LIMIT_BURST_MP,
+    RATE_LIMIT_MIN_COST_MP,
+    RATE_LIMIT_SQLITE_PATH,
+    RATE_LIMIT_TRACKED_CLIENTS,
+    RATE_LIMIT_TOP_CLIENTS,
+    TRUSTED_PROXIES,
+)
+from utils.admission import AdmissionRejected, admission_controller
+from utils.metrics import metrics
+
+
+class RateLimited(AdmissionRejected):
+    """Raised when a client has used up its token bucket (HTTP 429)."""
+
+    def __init__(self, message, retry_after):
+        super().__init__(message, 429, retry_after)
+
+
+TRUSTED_PROXY_NETWORKS = [ipaddress.ip_network(entry.strip(), strict=False) for entry in TRUSTED_PROXIES.split(",") if entry.strip()]
+
+
+def _is_trusted_proxy(address):
+    try:
+        ip = ipaddress.ip_address(address)
+    except ValueError:
+        return False
+    return any(ip in network for network in TRUSTED_PROXY_NETWORKS)
+
+
+def client_address(req):
+    """
+    IP address of the calling client.
+
+    When the connection comes from a trusted proxy (TRUSTED_PROXIES), the
+    X-Forwarded-For chain is read from the right, skipping trusted hops;
+    the first untrusted address is the client. Entries a client added
+    itself are further left and never reached.
+    """
+    address = req.remote_addr
+    if not TRUSTED_PROXY_NETWORKS or not _is_trusted_proxy(address):
+        return address
+    hops = [hop.strip() for hop in req.headers.get("X-Forwarded-For", "").split(",") if hop.strip()]
+    for hop in reversed(hops):
+        address = hop
+        if not _is_trusted_proxy(hop):
+            break
+    return address
+
+
+def client_id_from_request(req):
+    """
+    Identify the calling client.
+
+    Clients sending an X-API-Key header are identified by a short hash of the
+    key (so keys never appear in logs or metrics), everyone else by IP (see
+    client_address()).
+    """
+    api_key = req.headers.get("X-API-Key")
+    if api_key:
+        return "key:" + hashlib.sha256(api_key.encode("utf-8")).hexdigest()[:12]
+    return f"ip:{client_address(req)}"
+
+
+def request_cost(pixels, min_cost_mp=RATE_LIMIT_MIN_COST_MP):
+    """Token cost of a request: its input megapixels, with a floor per request."""
+    return max(pixels / 1_000_000, min_cost_mp)
+
+
+def _client_kind(client):
+    # Metric label: "key" or "ip", never the client itself, so the number of
+    # series stays fixed however many clients call (see ClientUsage)
+    return client.split(":", 1)[0]
+
+
+class ClientUsage:
+    """
+    Usage per client (API key hash or IP) for the heaviest clients.
+
+    At most max_clients are tracked; a new client replaces the one with the
+    least megapixels, so memory stays bounded while the heavy users, the
+    ones worth seeing, stay in the table.
+    """
+
+    FIELDS = ("requests", "megapixels", "refunded_megapixels", "rate_limited")
+
+    def __init__(self, max_clients):
+        self.max_clients = max_clients
+        self._lock = threading.Lock()
+        self._clients = {}
+
+    def record(self, client, **changes):
+        """Add to a client's counters (see FIELDS)."""
+        if self.max_clients <= 0:
+            return
+        with self._lock:
+            usage = self._clients.get(client)
+            if usage is None:
+                if len(self._clients) >= self.max_clients:
+                    del self._clients[min(self._clients, key=lambda c: self._clients[c]["megapixels"])]
+                usage = self._clients[client] = dict.fromkeys(self.FIELDS, 0)
+            for field, value in changes.items():
+                usage[field] += value
+
+    def top(self, n):
+        """The n clients with the most megapixels, heaviest first."""
+        with self._lock:
+            ranked = sorted(self._clients.items(), key=lambda item: item[1]["megapixels"], reverse=True)[:n]
+            return [{"client": client, **usage,
+                     "megapixels": round(usage["megapixels"], 3),
+                     "refunded_megapixels": round(usage["refunded_megapixels"], 3)}
+                    for client, usage in ranked]
+
+
+class TokenBucketLimiter:
+    """
+    In-process token buckets, one per client.
+
+    Buckets hold up to `burst` tokens (megapixels) and refill at `rate`
+    tokens per second. Costs above the burst size are capped at the burst,
+    so a single large image drains the bucket instead of never fitting.
+
+    A full bucket behaves exactly like a missing one, so buckets that have
+    refilled (including those of clients that went idle) are dropped every
+    `sweep_interval` seconds and memory follows the active clients only.
+    """
+
+    sweep_interval = 60.0
+
+    def __init__(self, rate, burst):
+        self.rate = rate
+        self.burst = burst
+        self._lock = threading.Lock()
+        self._buckets = {}
+        self._last_sweep = time.monotonic()
+        self.usage = ClientUsage(RATE_LIMIT_TRACKED_CLIENTS)
+
+    def _refill(self, tokens, updated, now):
+        return min(self.burst, tokens + (now - updated) * self.rate)
+
+    def _decide(self, tokens, cost):
+        """Return (allowed, tokens_left, retry_after) for a refilled bucket."""
+        cost = min(cost, self.burst)
+        if tokens >= cost:
+            return True, tokens - cost, 0
+        return False, tokens, max(1, math.ceil((cost - tokens) / self.rate))
+
+    def consume(self, client, cost):
+        """
+        Take `cost` tokens from the client's bucket or raise RateLimited.
+
+        Returns:
+            Tokens actually taken (cost capped at the burst), for refund()
+        """
+        now = time.monotonic()
+        with self._lock:
+            tokens, updated = self._buckets.get(client, (self.burst, now))
+            tokens = self._refill(tokens, updated, now)
+            allowed, tokens, retry_after = self._decide(tokens, cost)
+            self._buckets[client] = (tokens, now)
+            if now - self._last_sweep >= self.sweep_interval:
+                self._sweep(now)
+        return self._check(client, cost, allowed, retry_after)
+
+    def refund(self, client, tokens):
+        """Give back tokens taken by consume() for a request that never ran."""
+        now = time.monotonic()
+        with self._lock:
+            balance, updated = self._buckets.get(client, (self.burst, now))
+            self._buckets[client] = (min(self.burst, self._refill(balance, updated, now) + tokens), now)
+        self._record_refund(client, tokens)
+
+    def _record_refund(self, client, tokens):
+        metrics.inc("client_refunded_megapixels_total", round(tokens, 3), kind=_client_kind(client))
+        self.usage.record(client, refunded_megapixels=tokens)
+
+    def _sweep(self, now):
+        # Called with the lock held
+        full = [client for client, (tokens, updated) in self._buckets.items()
+                if self._refill(tokens, updated, now) >= self.burst]
+        for client in full:
+            del self._buckets[client]
+        self._last_sweep = now
+        metrics.set_gauge("rate_limit_buckets", len(self._buckets))
+
+    def _check(self, client, cost, allowed, retry_after):
+        kind = _client_kind(client)
+        if allowed:
+            metrics.inc("client_requests_total", kind=kind)
+            metrics.inc("client_megapixels_total", round(cost, 3), kind=kind)
+            self.usage.record(client, requests=1, megapixels=cost)
+            return min(cost, self.burst)
+        metrics.inc("client_rate_limited_total", kind=kind)
+        self.usage.record(client, rate_limited=1)
+        raise RateLimited(f"Rate limit exceeded for client {client}", retry_after)
+
+    def tokens(self, client):
+        """Current token balance for a client (for diagnostics)."""
+        now = time.monotonic()
+        with self._lock:
+            tokens, updated = self._buckets.get(client, (self.burst, now))
+            return self._refill(tokens, updated, now)
+
+    def bucket_count(self):
+        with self._lock:
+            return len(self._buckets)
+
+    def stats(self):
+        """Limiter settings and this worker's heaviest clients with their current balance."""
+        top = self.usage.top(RATE_LIMIT_TOP_CLIENTS)
+        for entry in top:
+            entry["tokens"] = round(self.tokens(entry["client"]), 3)
+        return {
+            "mp_per_second": self.rate,
+            "burst_mp": self.burst,
+            "buckets": self.bucket_count(),
+            "top_clients": top,
+        }
+
+
+class SQLiteTokenBucketLimiter(TokenBucketLimiter):
+    """
+    Token buckets stored in a local SQLite database, shared by all worker
+    processes on the host.
+
+    Each consume() runs in an IMMEDIATE transaction, so concurrent workers
+    serialise on the bucket update. Wall-clock time is used because the
+    timestamps are compared across processes. Full buckets are deleted by
+    whichever worker next sweeps.
+    """
+
+    def __init__(self, rate, burst, path):
+        super().__init__(rate, burst)
+        self.path = path
+        self._last_sweep = time.time()
+        self._local = threading.local()
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        conn = self._connection()
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS token_buckets ("
+            "client TEXT PRIMARY KEY, tokens REAL NOT NULL, updated REAL NOT NULL)"
+        )
+
+    def _connection(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            # isolation_level=None: transactions are managed explicitly below
+            conn = sqlite3.connect(self.path, timeout=5.0, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            self._local.conn = conn
+        return conn
+
+    def _load(self, conn, client, now):
+        row = conn.execute(
+            "SELECT tokens, updated FROM token_buckets WHERE client = ?", (client,)
+        ).fetchone()
+        if row is None:
+            return self.burst
+        return self._refill(row[0], row[1], now)
+
+    def _update(self, conn, client, change, now):
+        """Apply change(tokens) to the client's refilled bucket in one transaction."""
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            result, tokens = change(self._load(conn, client, now))
+            conn.execute(
+                "INSERT OR REPLACE INTO token_buckets (client, tokens, updated) VALUES (?, ?, ?)",
+                (client, tokens, now),
+            )
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        return result
+
+    def consume(self, client, cost):
+        conn = self._connection()
+        now = time.time()
+
+        def take(tokens):
+            allowed, tokens, retry_after = self._decide(tokens, cost)
+            return (allowed, retry_after), tokens
+
+        allowed, retry_after = self._update(conn, client, take, now)
+        with self._lock:
+            sweep = now - self._last_sweep >= self.sweep_interval
+            if sweep:
+                self._last_sweep = now
+        if sweep:
+            self._sweep_table(conn, now)
+        return self._check(client, cost, allowed, retry_after)
+
+    def refund(self, client, tokens):
+        conn = self._connection()
+        self._update(conn, client, lambda balance: (None, min(self.burst, balance + tokens)), time.time())
+        self._record_refund(client, tokens)
+
+    def _sweep_table(self, conn, now):
+        conn.execute(
+            "DELETE FROM token_buckets WHERE tokens + (? - updated) * ? >= ?",
+            (now, self.rate, self.burst),
+        )
+        count = conn.execute("SELECT COUNT(*) FROM token_buckets").fetchone()[0]
+        metrics.set_gauge("rate_limit_buckets", count)
+
+    def tokens(self, client):
+        return self._load(self._connection(), client, time.time())
+
+    def bucket_count(self):
+        return self._connection().execute("SELECT COUNT(*) FROM token_buckets").fetchone()[0]
+
+
+def create_rate_limiter():
+    """Build the limiter from config; None when rate limiting is disabled."""
+    if not RATE_LIMIT_ENABLED:
+        return None
+    if RATE_LIMIT_SQLITE_PATH:
+        return SQLiteTokenBucketLimiter(RATE_LIMIT_MP_PER_SECOND, RATE_LIMIT_BURST_MP, RATE_LIMIT_SQLITE_PATH)
+    return TokenBucketLimiter(RATE_LIMIT_MP_PER_SECOND, RATE_LIMIT_BURST_MP)
+
+
+# Shared limiter for the worker process
+rate_limiter = create_rate_limiter()
+
+
+@contextmanager
+def charged_admission(client, cost, pixels, tier=None, slot=True, budget=True):
+    """
+    Charge the client's bucket, then wait for an inference slot.
+
+    The charge is refunded when admission rejects the request (queue full
+    or timed out), so a request that never ran costs the client nothing.
+
+    Args:
+        client: Client identity (see client_id_from_request())
+        cost: Tokens to charge (see request_cost())
+        pixels: Input pixels, for the lane and pixel budget
+        tier: Requested lane, if any
+        slot: False for work that needs only pixel budget, no inference slot
+        budget: False for a model step whose pixels an enclosing admission holds
+
+    Yields:
+        The Admission
+    """
+    charged = rate_limiter.consume(client, cost) if rate_limiter is not None else 0
+    admitted = False
+    try:
+        with admission_controller.admit(pixels, tier=tier, client=client, slot=slot, budget=budget) as admission:
+            admitted = True
+            yield admission
+    except AdmissionRejected:
+        if not admitted and charged:
+            rate_limiter.refund(client, charged)
+        raise
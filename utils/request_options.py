@@ -0,0 +1,72 @@
+# utils/request_options.py: Parsing of optional per-request processing options
+import math
+
+TRUE_VALUES = ("1", "true", "yes", "on")
+FALSE_VALUES = ("0", "false", "no", "off")
+
+
+class InvalidOptionError(ValueError):
+    """Raised when a request option has a malformed or out-of-range value."""
+
+
+def get_option(req, name, default=None):
+    """Read an option from form data, falling back to the query string."""
+    value = req.form.get(name)
+    if value is None:
+        value = req.args.get(name)
+    return default if value is None or value == "" else value
+
+
+def get_bool_option(req, name, default):
+    """Read a boolean option ("true"/"false", "1"/"0", "yes"/"no", "on"/"off")."""
+    value = get_option(req, name)
+    if value is None:
+        return default
+    value = value.strip().lower()
+    if value in TRUE_VALUES:
+        return True
+    if value in FALSE_VALUES:
+        return False
+    raise InvalidOptionError(f"Invalid value for {name}: {value!r} (expected true or false)")
+
+
+def get_float_option(req, name, default=None):
+    """Read a float option."""
+    value = get_option(req, name)
+    if value is None:
+        return default
+    try:
+        value = float(value)
+    except ValueError:
+        raise InvalidOptionError(f"Invalid value for {name}: {value!r} (expected a number)")
+    if not math.isfinite(value):
+        raise InvalidOptionError(f"Invalid value for {name}: {value!r} (expected a finite number)")
+    return value
+
+
+def get_int_option(req, name, default=None):
+    """Read an integer option."""
+    value = get_option(req, name)
+    if value is None:
+        return default
+    try:
+        return int(value)
+    except ValueError:
+        raise InvalidOptionError(f"Invalid value for {name}: {value!r} (expected an integer)")
+
+
+def get_refinement_options(req):
+    """
+    Read the mask refinement options of a request.
+
+    Returns:
+        dict of keyword arguments for models.mask_refinement.RefinementOptions
+    """
+    return {
+        "threshold": get_float_option(req, "threshold"),
+        "feather": get_float_option(req, "feather", 0.0),
+        "fill_holes": get_float_option(req, "fill_holes", 0.0),
+        "remove_islands": get_float_option(req, "remove_islands", 0.0),
+        "edge_shift": get_int_option(req, "edge_shift", 0),
+        "remove_sky": get_bool_option(req, "remove_sky", False),
+    }
@@ -0,0 +1,183 @@
+# utils/result_store.py: Content-addressed filesystem store for /remove-bg results, with TTL-based eviction
+import hashlib
+import logging
+import os
+import re
+import tempfile
+import threading
+import time
+
+from config import RESULT_STORE_DIR, RESULT_TTL_SECONDS
+from utils.metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+_RESULT_ID = re.compile(r"^[0-9a-f]{64}$")
+
+TEMP_PREFIX = ".tmp-"
+
+
+def is_result_id(value):
+    """Whether value is a well-formed result ID (64 lowercase hex digits)."""
+    return bool(_RESULT_ID.match(value))
+
+
+class StoredResult:
+    """
+    One result in the store.
+
+    Attributes:
+        id: SHA-256 of the file contents, hex
+        size: Size in bytes
+        path: File path
+        expires_at: Unix time after which the result is gone
+    """
+
+    def __init__(self, result_id, size, path, expires_at):
+        self.id = result_id
+        self.size = size
+        self.path = path
+        self.expires_at = expires_at
+
+
+class ResultStore:
+    """
+    Results stored under the SHA-256 of their bytes, as <directory>/<id[:2]>/<id>.png.
+
+    Identical outputs share one file, and storing one again renews its
+    expiry. A result expires ttl seconds after it was last stored (the file
+    mtime). Expired files are deleted by a sweep that writes trigger at most
+    once per sweep_interval seconds; reads treat them as gone immediately.
+    Files are written under a temporary name and renamed into place, so
+    several workers can share the directory and readers never see a
+    partial file.
+    """
+
+    def __init__(self, directory, ttl, sweep_interval=None):
+        self.directory = directory
+        self.ttl = ttl
+        self.sweep_interval = sweep_interval if sweep_interval is not None else min(60.0, max(1.0, ttl / 10))
+        self._lock = threading.Lock()
+        self._last_sweep = 0.0
+        self._files = self._bytes = 0
+
+    def _path(self, result_id):
+        return os.path.join(self.directory, result_id[:2], result_id + ".png")
+
+    def put(self, chunks):
+        """
+        Store a result, hashing it while it is written.
+
+        Args:
+            chunks: Iterable of bytes (e.g. a PngStream)
+
+        Returns:
+            StoredResult
+        """
+        os.makedirs(self.directory, exist_ok=True)
+        digest = hashlib.sha256()
+        size = 0
+        fd, temp_path = tempfile.mkstemp(dir=self.directory, prefix=TEMP_PREFIX)
+        try:
+            with os.fdopen(fd, "wb") as f:
+                for chunk in chunks:
+                    digest.update(chunk)
+                    f.write(chunk)
+                    size += len(chunk)
+            result_id = digest.hexdigest()
+            path = self._path(result_id)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            existed = os.path.exists(path)
+            # Replacing an identical file is atomic and renews its mtime,
+            # even if a sweep in another worker deletes it meanwhile
+            os.replace(temp_path, path)
+        except BaseException:
+            try:
+                os.remove(temp_path)
+            except OSError:
+                pass
+            raise
+        metrics.inc("result_store_writes_total", existing=str(existed).lower())
+        self._maybe_sweep()
+        return StoredResult(result_id, size, path, time.time() + self.ttl)
+
+    def get(self, result_id):
+        """The stored result with this ID, or None when it is unknown or expired."""
+        if not is_result_id(result_id):
+            return None
+        path = self._path(result_id)
+        try:
+            stat = os.stat(path)
+        except OSError:
+            return None
+        expires_at = stat.st_mtime + self.ttl
+        if expires_at <= time.time():
+            return None
+        return StoredResult(result_id, stat.st_size, path, expires_at)
+
+    def cache_max_age(self, stored):
+        """Seconds a client may cache a result: until it expires."""
+        return max(0, int(stored.expires_at - time.time()))
+
+    def _maybe_sweep(self):
+        now = time.time()
+        with self._lock:
+            if now - self._last_sweep < self.sweep_interval:
+                return
+            self._last_sweep = now
+        self.sweep()
+
+    def sweep(self):
+        """
+        Delete expired results and abandoned temporary files.
+
+        Returns:
+            Number of files deleted
+        """
+        cutoff = time.time() - self.ttl
+        deleted = files = total = 0
+        try:
+            entries = list(os.scandir(self.directory))
+        except OSError:
+            return 0
+        candidates = []
+        for entry in entries:
+            if entry.name.startswith(TEMP_PREFIX):
+                candidates.append(entry)
+            elif entry.is_dir():
+                try:
+                    candidates.extend(os.scandir(entry.path))
+                except OSError:
+                    continue
+        for candidate in candidates:
+            try:
+                stat = candidate.stat()
+                if stat.st_mtime <= cutoff:
+                    os.remove(candidate.path)
+                    deleted += 1
+                elif not candidate.name.startswith(TEMP_PREFIX):
+                    files += 1
+                    total += stat.st_size
+            except OSError:
+                # Removed or renewed by another worker meanwhile
+                continue
+        self._files, self._bytes = files, total
+        if deleted:
+            metrics.inc("result_store_evictions_total", deleted)
+            logger.info(f"Result store: evicted {deleted} expired files, {files} results ({total / 2**20:.1f} MB) remain")
+        metrics.set_gauge("result_store_files", files)
+        metrics.set_gauge("result_store_mb", total / 2**20)
+        return deleted
+
+    def stats(self):
+        """Size of the store as of the last sweep."""
+        return {
+            "directory": self.directory,
+            "ttl_seconds": self.ttl,
+            "files": self._files,
+            "mb": round(self._bytes / 2**20, 1),
+        }
+
+
+# Shared per-process store; None when RESULT_STORE_DIR is empty
+result_store = ResultStore(RESULT_STORE_DIR, RESULT_TTL_SECONDS) if RESULT_STORE_DIR else None
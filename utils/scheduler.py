@@ -0,0 +1,171 @@
+# utils/scheduler.py: Size-aware priority lanes with weighted-fair dequeueing
+from collections import OrderedDict, deque
+
+
+class FairQueue:
+    """
+    FIFO per client, round-robin across clients.
+
+    A client with many waiting requests only gets every n-th dispatch when
+    n clients are waiting, instead of occupying the head of the queue.
+    """
+
+    def __init__(self):
+        self._queues = OrderedDict()
+        self._length = 0
+
+    def __len__(self):
+        return self._length
+
+    def __bool__(self):
+        return self._length > 0
+
+    def count(self, client):
+        """Number of waiting items for one client."""
+        queue = self._queues.get(client)
+        return len(queue) if queue else 0
+
+    def append(self, item, client):
+        self._queues.setdefault(client, deque()).append(item)
+        self._length += 1
+
+    def peek(self):
+        return next(iter(self._queues.values()))[0]
+
+    def popleft(self):
+        client, queue = next(iter(self._queues.items()))
+        item = queue.popleft()
+        if queue:
+            # Client goes to the back of the rotation
+            self._queues.move_to_end(client)
+        else:
+            del self._queues[client]
+        self._length -= 1
+        return item
+
+    def remove(self, item, client):
+        queue = self._queues.get(client)
+        if not queue or item not in queue:
+            raise ValueError("item not queued")
+        queue.remove(item)
+        if not queue:
+            del self._queues[client]
+        self._length -= 1
+
+
+class Lane:
+    """
+    A queue of waiting requests for one size class.
+
+    Attributes:
+        name: Lane name reported in metrics and headers
+        max_megapixels: Largest input (in MP) classified into this lane, None for no limit
+        weight: Relative share of dequeues the lane gets when all lanes are busy
+        max_queue: Maximum number of waiting requests in this lane
+    """
+
+    def __init__(self, name, max_megapixels, weight, max_queue):
+        self.name = name
+        self.max_megapixels = max_megapixels
+        self.weight = weight
+        self.max_queue = max_queue
+        # Waiting requests, round-robin across clients within the lane
+        self.waiters = FairQueue()
+        # Stride-scheduling pass value; the non-empty lane with the lowest
+        # pass is served next and advances by 1 / weight per dequeue
+        self.pass_value = 0.0
+
+
+class LaneScheduler:
+    """
+    Classifies requests into lanes by input megapixels and decides which
+    waiting request is dequeued next.
+
+    Dequeueing uses stride scheduling: every lane gets a share of dispatches
+    proportional to its weight, so small interactive images are not stuck
+    behind a backlog of large uploads, while large uploads still make steady
+    progress. Within a lane, clients are served round-robin. The scheduler
+    itself is not thread-safe; the caller holds a lock.
+    """
+
+    def __init__(self, lanes):
+        # Sort lanes from smallest to largest size class; the unbounded lane last
+        self.lanes = sorted(
+            lanes,
+            key=lambda lane: float("inf") if lane.max_megapixels is None else lane.max_megapixels,
+        )
+        self._by_name = {lane.name: lane for lane in self.lanes}
+
+    def classify(self, pixels, tier=None):
+        """
+        Return the lane for a request by its size.
+
+        An explicit tier name can only move a request to a larger lane than
+        its size implies (e.g. a backfill yielding to interactive traffic).
+        Asking for a smaller lane is ignored, so large jobs cannot take the
+        head-of-line protection of the small lane.
+        """
+        megapixels = pixels / 1_000_000
+        by_size = self.lanes[-1]
+        for lane in self.lanes:
+            if lane.max_megapixels is None or megapixels <= lane.max_megapixels:
+                by_size = lane
+                break
+        requested = self._by_name.get(tier) if tier else None
+        if requested is not None and self.lanes.index(requested) > self.lanes.index(by_size):
+            return requested
+        return by_size
+
+    def lane(self, name):
+        return self._by_name[name]
+
+    def _min_active_pass(self):
+        passes = [lane.pass_value for lane in self.lanes if lane.waiters]
+        return min(passes) if passes else None
+
+    def push(self, lane, waiter):
+        """Enqueue a waiter; a lane waking up from idle gets no saved-up credit."""
+        if not lane.waiters:
+            current = self._min_active_pass()
+            if current is not None:
+                lane.pass_value = max(lane.pass_value, current)
+        lane.waiters.append(waiter, waiter.client)
+
+    def remove(self, lane, waiter):
+        """Remove a waiter that gave up (timed out) before being dispatched."""
+        try:
+            lane.waiters.remove(waiter, waiter.client)
+        except ValueError:
+            pass
+
+    def peek(self):
+        """Return (lane, waiter) that should be dispatched next, or None."""
+        candidates = [lane for lane in self.lanes if lane.waiters]
+        if not candidates:
+            return None
+        # Ties go to the smaller size class
+        lane = min(candidates, key=lambda lane: lane.pass_value)
+        return lane, lane.waiters.peek()
+
+    def pop(self, lane):
+        """Dequeue the head of a lane and charge the lane for it."""
+        waiter = lane.waiters.popleft()
+        lane.pass_value += 1.0 / lane.weight
+        return waiter
+
+    def queued(self):
+        return sum(len(lane.waiters) for lane in self.lanes)
+
+    def queued_for(self, client):
+        """Number of waiting requests for one client across all lanes."""
+        return sum(lane.waiters.count(client) for lane in self.lanes)
+
+    def stats(self):
+        return {
+            lane.name: {
+                "queued": len(lane.waiters),
+                "weight": lane.weight,
+                "max_megapixels": lane.max_megapixels,
+            }
+            for lane in self.lanes
+        }
@@ -0,0 +1,117 @@
+# utils/sky_detection.py: Vectorised colour-based sky detection
+import numpy as np
+
+# Neighbourhood used to confirm sky pixels: (2 * radius + 1)^2 window
+NEIGHBOURHOOD_RADIUS = 2
+
+# A pixel is dense sky when more than this many pixels in its window are sky
+MIN_SKY_NEIGHBOURS = 15
+
+
+def detect_sky_pixels(img):
+    """
+    Classify pixels as sky by colour.
+
+    A pixel is sky when it is blue (blue channel above 100 and above red and
+    green), or bright and neutral (mean above 200 with all channel
+    differences below 20).
+
+    Args:
+        img: uint8 array of shape (h, w, 3)
+
+    Returns:
+        uint8 array of shape (h, w), 255 for sky pixels
+    """
+    pixels = img.astype(np.int16)
+    r, g, b = pixels[..., 0], pixels[..., 1], pixels[..., 2]
+    is_blue_sky = (b > r) & (b > g) & (b > 100)
+    brightness = (r + g + b) / 3.0
+    is_bright = (
+        (brightness > 200)
+        & (np.abs(r - g) < 20)
+        & (np.abs(r - b) < 20)
+        & (np.abs(g - b) < 20)
+    )
+    return np.where(is_blue_sky | is_bright, 255, 0).astype(np.uint8)
+
+
+def neighbourhood_count(mask, radius=NEIGHBOURHOOD_RADIUS):
+    """
+    Count non-zero pixels in the square window around every pixel.
+
+    Pixels outside the image count as zero. Uses a summed-area table, so the
+    cost does not depend on the radius.
+    """
+    binary = (mask > 0).astype(np.int32)
+    h, w = binary.shape
+    padded = np.pad(binary, radius + 1, mode="constant")
+    table = padded.cumsum(axis=0).cumsum(axis=1)
+    size = 2 * radius + 1
+    # Window for output pixel (y, x) covers padded rows y+1 .. y+size
+    return (
+        table[size:size + h, size:size + w]
+        - table[0:h, size:size + w]
+        - table[size:size + h, 0:w]
+        + table[0:h, 0:w]
+    )
+
+
+def dilate(mask, radius=1):
+    """Morphological dilation with a square (2 * radius + 1) structuring element."""
+    if radius <= 0:
+        return mask
+    return np.where(neighbourhood_count(mask, radius) > 0, 255, 0).astype(np.uint8)
+
+
+def dense_sky_region(sky_mask, min_neighbours=MIN_SKY_NEIGHBOURS, radius=NEIGHBOURHOOD_RADIUS):
+    """Keep pixels whose window contains more than min_neighbours sky pixels."""
+    return np.where(neighbourhood_count(sky_mask, radius) > min_neighbours, 255, 0).astype(np.uint8)
+
+
+def detect_sky(img, upper_fraction=0.25):
+    """
+    Run the full sky heuristic.
+
+    Args:
+        img: uint8 array of shape (h, w, 3)
+        upper_fraction: Fraction of the image height treated as the upper
+            region, where the neighbourhood rule replaces the colour rule
+
+    Returns:
+        Tuple of uint8 masks (sky, upper, combined), 255 for sky. `upper`
+        has the shape of the upper region only.
+    """
+    h = img.shape[0]
+    top = int(h * upper_fraction)
+    sky_mask = detect_sky_pixels(img)
+    # Neighbours are only counted inside the upper region, as in the original loops
+    upper_region = dense_sky_region(sky_mask[:top])
+    combined = sky_mask.copy()
+    combined[:top] = upper_region
+    return sky_mask, upper_region, combined
+
+
+def sky_mask_for_refinement(img, upper_fraction=0.5, dilation=1):
+    """
+    Sky mask used to refine a foreground mask.
+
+    Only dense sky in the upper part of the image is returned, dilated by a
+    few pixels to cover the sky/horizon transition, so bright or blue
+    regions of the subject lower in the frame are left alone.
+
+    Args:
+        img: uint8 array of shape (h, w, 3)
+        upper_fraction: Fraction of the height that may contain sky
+        dilation: Dilation radius in pixels
+
+    Returns:
+        uint8 array of shape (h, w), 255 for sky
+    """
+    h = img.shape[0]
+    top = int(h * upper_fraction)
+    result = np.zeros(img.shape[:2], dtype=np.uint8)
+    if top == 0:
+        return result
+    dense = dense_sky_region(detect_sky_pixels(img[:top]))
+    result[:top] = dilate(dense, dilation)
+    return result